@@ -2,14 +2,18 @@ import openai
 import anthropic
 import google.generativeai as genai
 # from utils import set_openai_api_key, set_gemini_api_key
-from sentence_transformers import SentenceTransformer
+from .model_registry import model_registry
 from .perturb import Perturbation  # Import your perturbation functions from perturb.py
 import requests
 import spacy
 import numpy as np 
-# Initialize the sentence transformer model for similarity evaluation
-# Initialize the sentence transformer model for similarity evaluation
-similarity_model = SentenceTransformer("all-distilroberta-v1")
+# Sentence transformer model for similarity evaluation, loaded once on first use
+SIMILARITY_MODEL_NAME = "all-distilroberta-v1"
+
+
+def get_similarity_model():
+    return model_registry.get(SIMILARITY_MODEL_NAME)
+
 url = "http://127.0.0.1:8000/v1/chat/completions" 
 
 def evaluate_response(text1, text2, model):
@@ -381,9 +385,9 @@ class Test:
 
             # Evaluate responses
             if self.original_response:
-                self.score_original = self.evaluate(similarity_model, self.original_response)
+                self.score_original = self.evaluate(get_similarity_model(), self.original_response)
             if self.perturb_response:
-                self.score_perturb = self.evaluate(similarity_model, self.perturb_response)
+                self.score_perturb = self.evaluate(get_similarity_model(), self.perturb_response)
                 
         except Exception as e:
             logger.error(f"Error running test {self.name}: {str(e)}")
@@ -0,0 +1,156 @@
+# api/PromptOps/async_engine.py
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from .completion_memo import CompletionMemo
+from .concurrency import get_concurrency, max_concurrency
+
+logger = logging.getLogger(__name__)
+
+ABORT_POLL_INTERVAL = 0.5
+
+
+class AsyncTestEngine:
+    """
+    Runs tests on a single asyncio event loop.
+
+    A fixed pool of worker coroutines pulls tests from the input iterator,
+    so memory stays bounded no matter how many tests are queued. The pool
+    is sized to the provider's concurrency ceiling; how many requests are
+    actually in flight is decided by the adaptive controller for the
+    model (see PromptOps.concurrency). An optional abort
+    check is polled in the background, on an executor thread; when it fires, every worker is
+    cancelled, which also cancels their in-flight HTTP requests.
+    Original-prompt completions go through a CompletionMemo, so tests
+    that share a prompt only pay for it once.
+    """
+
+    def __init__(
+        self,
+        completion_model: Any,
+        max_in_flight: Optional[int] = None,
+        abort_check_fn: Optional[Callable[[], bool]] = None,
+        abort_poll_interval: float = ABORT_POLL_INTERVAL,
+        memo: Optional[CompletionMemo] = None
+    ):
+        self.completion_model = completion_model
+        self.provider = getattr(
+            completion_model, 'model_provider', 'default').lower()
+        self.max_in_flight = max_in_flight or max_concurrency(self.provider)
+        self.abort_check_fn = abort_check_fn
+        self.abort_poll_interval = abort_poll_interval
+        self.memo = memo if memo is not None else CompletionMemo()
+        self.aborted = False
+        self.completed = 0
+        self.total = 0
+        self._start_time: Optional[float] = None
+
+    def _log_progress(self):
+        if (self.completed % 10 == 0) or (self.completed == self.total) or (self.completed == 1):
+            elapsed = time.time() - self._start_time
+            avg_time = elapsed / self.completed if self.completed > 0 else 0
+            remaining = (self.total - self.completed) * avg_time
+            logger.info(
+                f"Completed {self.completed}/{self.total} tests. Elapsed: {elapsed:.1f}s, Est. remaining: {remaining:.1f}s, "
+                f"concurrency: {self.concurrency_snapshot()}")
+
+    def concurrency_snapshot(self):
+        model = getattr(self.completion_model, 'model', None)
+        if model is None:
+            return None
+        return get_concurrency(self.provider, model).snapshot()
+
+    async def _worker(self, tests):
+        for test in tests:
+            try:
+                await test.arun(self.completion_model, memo=self.memo)
+            except Exception as e:
+                logger.error(f"Error executing test {test.name}: {str(e)}")
+                test.error = str(e)
+            self.completed += 1
+            self._log_progress()
+
+    async def _watch_abort(self, workers):
+        loop = asyncio.get_running_loop()
+        while not all(w.done() for w in workers):
+            # The check may read Redis; keep that round trip off the loop
+            if await loop.run_in_executor(None, self.abort_check_fn):
+                logger.warning(
+                    f"Aborting test execution after {self.completed}/{self.total} tests")
+                self.aborted = True
+                for w in workers:
+                    w.cancel()
+                return
+            await asyncio.sleep(self.abort_poll_interval)
+
+    async def run(self, tests: Iterable[Any], total: Optional[int] = None) -> int:
+        """
+        Run every test and return how many finished. `total` is only used
+        for progress logging when `tests` is a lazy iterable.
+        """
+        if total is None and hasattr(tests, '__len__'):
+            total = len(tests)
+        self.total = total or 0
+        self._start_time = time.time()
+        iterator = iter(tests)
+
+        pool_size = self.max_in_flight
+        if total is not None:
+            pool_size = max(1, min(pool_size, total))
+        logger.info(
+            f"Starting async execution of {self.total} tests for provider {self.provider} "
+            f"with up to {pool_size} in flight")
+
+        workers = [asyncio.ensure_future(self._worker(iterator))
+                   for _ in range(pool_size)]
+        watcher = None
+        if self.abort_check_fn:
+            watcher = asyncio.ensure_future(self._watch_abort(workers))
+        try:
+            await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            if watcher:
+                watcher.cancel()
+            for w in workers:
+                if not w.done():
+                    w.cancel()
+            self.memo.cancel_pending()
+
+        logger.info(
+            f"Async execution finished: {self.completed}/{self.total} tests in {time.time() - self._start_time:.2f}s "
+            f"(original prompts: {self.memo.stats()})")
+        return self.completed
+
+
+# ---------------- sync bridge ----------------
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _engine_loop() -> asyncio.AbstractEventLoop:
+    """
+    One long-lived event loop per process, running in a daemon thread.
+    Keeping it alive lets async HTTP clients be reused across runs.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_loop.run_forever, name="async-test-engine", daemon=True)
+            thread.start()
+        return _loop
+
+
+def run_sync(coro):
+    """
+    Run a coroutine on the engine loop and block until it finishes.
+    Safe to call from plain threads and from inside another event loop
+    (e.g. the one the Celery task runs on).
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _engine_loop()).result()
@@ -0,0 +1,165 @@
+# api/PromptOps/completion_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = int(
+    os.getenv("COMPLETION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "200000"))
+
+# Eviction scans the table, so only run it every so many writes
+EVICT_EVERY = 500
+
+
+def _default_path() -> Optional[str]:
+    """
+    The cache file lives in the volume shared by core & worker so every
+    worker sees the same entries. Without one configured it is disabled.
+    """
+    if os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    explicit = os.getenv("COMPLETION_CACHE_PATH")
+    if explicit is not None:
+        return explicit or None
+    shared = os.getenv("SHARED_DATA_DIR")
+    if shared:
+        return os.path.join(shared, "completion_cache.sqlite3")
+    return None
+
+
+def request_fingerprint(provider: str, model: str, system_content: Optional[str], prompt: str,
+                        temperature: Any, top_p: Any, max_tokens: Any, url: Optional[str] = None) -> str:
+    payload = json.dumps(
+        [provider, model, url, system_content, prompt, temperature, top_p, max_tokens],
+        ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    Persistent cache of LLM completions in a SQLite file.
+
+    Entries expire after `ttl_seconds`; once the table grows past
+    `max_entries` the least recently used rows are evicted. SQLite runs in
+    WAL mode so several worker processes can read while one writes.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.ttl_seconds:
+                return None
+            conn.execute(
+                "UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Completion cache read failed: {e}")
+            return None
+
+    def put(self, key: str, response: str):
+        try:
+            conn = self._conn()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)", (key, response, now, now))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Completion cache write failed: {e}")
+            return
+        with self._writes_lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired rows, then the least recently used ones above max_entries."""
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM completions WHERE created_at < ?",
+                         (time.time() - self.ttl_seconds,))
+            count = conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM completions WHERE key IN ("
+                    " SELECT key FROM completions ORDER BY accessed_at LIMIT ?)", (excess,))
+                logger.info(f"Completion cache evicted {excess} entries")
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Completion cache eviction failed: {e}")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+
+# ---------------- singleton ----------------
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+_cache_disabled = False
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """Process-wide completion cache, or None when it is not configured."""
+    global _cache, _cache_disabled
+    if _cache is not None or _cache_disabled:
+        return _cache
+    with _cache_lock:
+        if _cache is None and not _cache_disabled:
+            path = _default_path()
+            if path is None:
+                _cache_disabled = True
+                return None
+            try:
+                _cache = CompletionCache(path)
+                logger.info(f"Completion cache at {path}")
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Completion cache disabled, cannot open {path}: {e}")
+                _cache_disabled = True
+    return _cache
@@ -0,0 +1,67 @@
+# api/PromptOps/completion_memo.py
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionMemo:
+    """
+    Single-flight memo for completions within one run or one whole job.
+
+    The first caller for a key starts the request; every concurrent or
+    later caller with the same key awaits that same task instead of
+    calling the model again. Waiters are shielded, so cancelling one test
+    does not cancel a request other tests are still waiting on.
+
+    Tasks belong to the engine's event loop, so a memo may be reused by
+    several runs as long as they all go through run_sync. A run that ends
+    early only cancels the requests no caller is awaiting any more, so
+    runs sharing the memo keep theirs.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        # Callers currently awaiting each key's task
+        self._waiters: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        # Cancelled or crashed requests are not worth remembering
+        if task is not None and task.done() and (task.cancelled() or task.exception() is not None):
+            task = None
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+        else:
+            self.hits += 1
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def forget(self, key: Hashable):
+        """Drop a result (e.g. an error response) so the next caller retries."""
+        task = self._tasks.get(key)
+        if task is not None and task.done():
+            del self._tasks[key]
+
+    def cancel_pending(self):
+        """Cancel shared requests nobody is waiting on any more (e.g. after an abort)."""
+        for key, task in self._tasks.items():
+            if not task.done() and key not in self._waiters:
+                task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {"unique": self.misses, "shared": self.hits}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
@@ -0,0 +1,155 @@
+# api/PromptOps/concurrency.py
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from ..utils.model_rate_limits import PROVIDER_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Latency above this multiple of the observed baseline counts as congestion
+LATENCY_TOLERANCE = 2.0
+# Smoothing factor for the latency moving average
+LATENCY_EWMA_ALPHA = 0.2
+# After a decrease, ignore further overload signals for this long so one
+# burst of 429s only halves the window once
+DECREASE_COOLDOWN = 2.0
+
+_OVERLOAD_PHRASES = ("rate limit", "ratelimit", "429", "too many",
+                     "quota", "capacity", "overloaded", "timeout", "timed out")
+
+
+def is_overload_error(e: BaseException) -> bool:
+    """Errors that mean the provider wants less traffic from us."""
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    message = f"{type(e).__name__} {e}".lower()
+    return any(phrase in message for phrase in _OVERLOAD_PHRASES)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency window for one (provider, model).
+
+    Each healthy response grows the window by 1/window (about +1 per
+    round trip); a 429 or timeout halves it. Responses much slower than
+    the latency baseline hold the window where it is, so we stop adding
+    load before the provider starts rejecting it.
+    """
+
+    def __init__(self, name: str, max_window: int, initial_window: Optional[float] = None, min_window: int = 1):
+        self.name = name
+        self.min_window = min_window
+        self.max_window = max(max_window, min_window)
+        self.window = float(initial_window or max(min_window, self.max_window // 4))
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+        self.latency_ewma: Optional[float] = None
+        self.latency_baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _cond(self) -> asyncio.Condition:
+        # Bound to the loop it is first used on (the engine loop)
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        cond = self._cond()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.window))
+            self.in_flight += 1
+
+    async def release(self):
+        cond = self._cond()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def on_success(self, latency: float):
+        self.successes += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+        # Baseline follows the fastest smoothed latency we have seen
+        if self.latency_baseline is None or self.latency_ewma < self.latency_baseline:
+            self.latency_baseline = self.latency_ewma
+
+        if latency > LATENCY_TOLERANCE * self.latency_baseline:
+            return
+        self.window = min(self.max_window, self.window + 1.0 / self.window)
+
+    def on_overload(self):
+        self.overloads += 1
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        previous = self.window
+        self.window = max(float(self.min_window), self.window / 2)
+        logger.warning(
+            f"Concurrency for {self.name} reduced {previous:.1f} -> {self.window:.1f} after overload")
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one request slot and feed the outcome back into the window."""
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_overload_error(e):
+                self.on_overload()
+            raise
+        else:
+            self.on_success(time.monotonic() - start)
+        finally:
+            await self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "window": round(self.window, 2),
+            "max_window": self.max_window,
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency_baseline": round(self.latency_baseline, 3) if self.latency_baseline is not None else None,
+        }
+
+
+def max_concurrency(provider: str) -> int:
+    return PROVIDER_MAX_CONCURRENCY.get(
+        provider, PROVIDER_MAX_CONCURRENCY["default"])
+
+
+# ---------------- registry ----------------
+_controllers: Dict[Tuple[str, str], AdaptiveConcurrency] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_concurrency(provider: str, model: str) -> AdaptiveConcurrency:
+    """Process-wide controller for (provider, model), created on first use."""
+    key = (provider.lower(), model)
+    with _controllers_lock:
+        controller = _controllers.get(key)
+        if controller is None:
+            controller = AdaptiveConcurrency(
+                f"{key[0]}/{model}", max_concurrency(key[0]))
+            _controllers[key] = controller
+        return controller
+
+
+def concurrency_snapshot() -> Dict[str, Dict[str, Any]]:
+    """Current window of every controller, for monitoring."""
+    with _controllers_lock:
+        return {controller.name: controller.snapshot() for controller in _controllers.values()}
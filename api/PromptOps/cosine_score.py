@@ -1,6 +1,10 @@
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from .model_registry import model_registry
+
+COSINE_MODEL_NAME = 'all-mpnet-base-v2'
+
+
 def cosine_score(text1, text2):
     """
     Calculate the cosine similarity score between two texts using SentenceTransformer.
@@ -12,15 +16,14 @@ def cosine_score(text1, text2):
     Returns:
     float: The cosine similarity score between the two texts.
     """
-    # Load the pre-trained SentenceTransformer model
-    model = SentenceTransformer('all-mpnet-base-v2')
+    # Shared pre-trained SentenceTransformer model, loaded once per process
+    model = model_registry.get(COSINE_MODEL_NAME)
 
-    # Encode the texts into embeddings
-    embeddings1 = model.encode([text1])
-    embeddings2 = model.encode([text2])
+    # Encode both texts in a single batch
+    embeddings = model.encode([text1, text2])
 
     # Calculate the cosine similarity between the embeddings
-    score = cosine_similarity(embeddings1, embeddings2)
+    score = cosine_similarity(embeddings[:1], embeddings[1:])
 
     # Return the similarity score
     return score[0][0]
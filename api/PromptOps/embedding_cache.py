@@ -0,0 +1,331 @@
+# api/PromptOps/embedding_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms get memory-only caching
+    fcntl = None
+
+from .scoring import DEFAULT_BATCH_SIZE, encode_normalized
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))
+DEFAULT_MAX_DISK_ENTRIES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_DISK_ENTRIES", "500000"))
+
+KEY_SIZE = 20  # sha1 digest length
+# Rows are stored exactly as encoded, so a disk hit scores the same as a
+# fresh encode; the suffix keeps older float16 stores from being read
+DISK_DTYPE = np.float32
+DISK_FORMAT = "f32"
+
+
+def _default_disk_dir() -> Optional[str]:
+    """
+    Disk tier lives in the volume shared by core & worker. It is only
+    enabled when one is configured, so local runs stay memory-only.
+    """
+    explicit = os.getenv("EMBEDDING_CACHE_DIR")
+    if explicit is not None:
+        return explicit or None
+    shared = os.getenv("SHARED_DATA_DIR")
+    if shared:
+        return os.path.join(shared, "embedding_cache")
+    return None
+
+
+def text_key(model_name: str, text: str) -> bytes:
+    """Content address of an embedding: model name + text hash."""
+    return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+class _DiskTier:
+    """
+    On-disk store shared between processes.
+
+    keys.bin holds fixed-size sha1 records and vectors.f32 the matching
+    float32 rows, which are read through a memory map. Writers append
+    under an exclusive flock (vectors first, then keys), so readers that
+    size themselves from keys.bin never see a half-written row.
+
+    A write that would pass max_entries first compacts the store down to
+    at most half of it, keeping the rows this process used most recently and then
+    the newest ones. Compaction replaces both files and bumps the
+    generation in meta.json, which tells other processes to reload.
+    """
+
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.dim: Optional[int] = None
+        self._generation = 0
+        self._index: Dict[bytes, int] = {}
+        self._count = 0
+        self._vectors: Optional[np.memmap] = None
+        # Last use of each key by this process, for picking what to keep
+        self._used: Dict[bytes, int] = {}
+        self._tick = 0
+        self._keys_path = os.path.join(directory, "keys.bin")
+        self._vectors_path = os.path.join(directory, f"vectors.{DISK_FORMAT}")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        os.makedirs(directory, exist_ok=True)
+        meta = self._read_meta()
+        self.dim = meta.get("dim")
+        self._generation = meta.get("generation", 0)
+
+    def _flock(self, exclusive: bool):
+        fh = open(self._lock_path, "a+")
+        fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return fh
+
+    def _read_meta(self) -> Dict[str, int]:
+        if not os.path.exists(self._meta_path):
+            return {}
+        with open(self._meta_path) as fh:
+            return json.load(fh)
+
+    def _write_meta(self):
+        with open(self._meta_path, "w") as fh:
+            json.dump({"dim": self.dim, "generation": self._generation}, fh)
+
+    def _touch(self, keys):
+        for key in keys:
+            self._tick += 1
+            self._used[key] = self._tick
+
+    def _refresh(self):
+        """
+        Pick up rows appended by other processes since the last look, or
+        reload everything after another process compacted the store.
+        Callers hold the flock.
+        """
+        meta = self._read_meta()
+        if self.dim is None:
+            self.dim = meta.get("dim")
+        if self.dim is None or not os.path.exists(self._keys_path):
+            return
+        if meta.get("generation", 0) != self._generation:
+            self._generation = meta.get("generation", 0)
+            self._index = {}
+            self._count = 0
+            self._vectors = None
+        count = os.path.getsize(self._keys_path) // KEY_SIZE
+        if count > self._count:
+            with open(self._keys_path, "rb") as fh:
+                fh.seek(self._count * KEY_SIZE)
+                data = fh.read((count - self._count) * KEY_SIZE)
+            for i in range(len(data) // KEY_SIZE):
+                self._index.setdefault(
+                    data[i * KEY_SIZE:(i + 1) * KEY_SIZE], self._count + i)
+            self._count = count
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=DISK_DTYPE, mode="r", shape=(count, self.dim))
+        if len(self._used) > self._count:
+            # Forget keys that were compacted away
+            self._used = {k: t for k, t in self._used.items() if k in self._index}
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        if any(k not in self._index for k in keys):
+            lock = self._flock(exclusive=False)
+            try:
+                self._refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                lock.close()
+        found: Dict[bytes, np.ndarray] = {}
+        for key in keys:
+            row = self._index.get(key)
+            if row is not None:
+                # A compacted-away file stays readable through its memory map
+                found[key] = np.array(self._vectors[row], dtype=np.float32)
+        self._touch(found)
+        return found
+
+    def _compact(self, keep: int):
+        """Rewrite the store with only `keep` rows. Callers hold the exclusive flock."""
+        ranked = sorted(self._index.items(),
+                        key=lambda kv: (self._used.get(kv[0], 0), kv[1]), reverse=True)
+        kept = sorted(ranked[:keep], key=lambda kv: kv[1])
+        rows = [row for _, row in kept]
+        block = np.asarray(self._vectors[rows] if rows else
+                           np.zeros((0, self.dim)), dtype=DISK_DTYPE)
+        for path, data in ((self._vectors_path, block.tobytes()),
+                           (self._keys_path, b"".join(k for k, _ in kept))):
+            with open(path + ".tmp", "wb") as fh:
+                fh.write(data)
+            os.replace(path + ".tmp", path)
+        self._generation += 1
+        self._write_meta()
+        logger.info(
+            f"Compacted embedding cache at {self.directory} from {self._count} to {len(kept)} entries")
+        self._index = {}
+        self._count = 0
+        self._vectors = None
+        self._refresh()
+
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        if not items:
+            return
+        dim = len(next(iter(items.values())))
+        lock = self._flock(exclusive=True)
+        try:
+            if self.dim is None:
+                self.dim = dim
+                self._write_meta()
+            elif self.dim != dim:
+                logger.warning(
+                    f"Embedding cache at {self.directory} holds {self.dim}-d vectors, got {dim}-d; skipping write")
+                return
+            self._refresh()
+            new = [(k, v) for k, v in items.items() if k not in self._index]
+            if not new:
+                return
+            if self._count + len(new) > self.max_entries:
+                self._compact(max(0, min(self.max_entries // 2, self.max_entries - len(new))))
+            new = new[:self.max_entries - self._count]
+            if not new:
+                return
+            block = np.stack([v for _, v in new]).astype(DISK_DTYPE)
+            # Drop rows left behind by a writer that died before its keys landed
+            row_bytes = self.dim * np.dtype(DISK_DTYPE).itemsize
+            if os.path.exists(self._vectors_path) and \
+                    os.path.getsize(self._vectors_path) != self._count * row_bytes:
+                os.truncate(self._vectors_path, self._count * row_bytes)
+            with open(self._vectors_path, "ab") as fh:
+                fh.write(block.tobytes())
+            with open(self._keys_path, "ab") as fh:
+                fh.write(b"".join(k for k, _ in new))
+            self._refresh()
+            self._touch(k for k, _ in new)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache in front of a SentenceTransformer's encode().
+
+    Lookups go through an in-process LRU first and then, when configured,
+    a memory-mapped float32 store shared by every worker. Only misses are
+    sent to the model, in one batch.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        capacity: int = DEFAULT_CAPACITY,
+        disk_dir: Optional[str] = None,
+        max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES
+    ):
+        self.model_name = model_name
+        self.capacity = capacity
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[_DiskTier] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir and fcntl is not None:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            try:
+                self._disk = _DiskTier(os.path.join(
+                    disk_dir, f"{safe_name}.{DISK_FORMAT}"), max_disk_entries)
+            except OSError as e:
+                logger.warning(
+                    f"Embedding disk cache disabled for {model_name}: {e}")
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def encode(self, texts: Sequence[str], model, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """
+        Return L2-normalized float32 embeddings for texts, in order.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        keys = [text_key(self.model_name, t) for t in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    vectors[key] = vector
+            self.hits += len(vectors)
+
+        pending = [k for k in dict.fromkeys(keys) if k not in vectors]
+        if pending and self._disk is not None:
+            try:
+                with self._lock:
+                    from_disk = self._disk.get_many(pending)
+                    self.disk_hits += len(from_disk)
+                    for key, vector in from_disk.items():
+                        self._remember(key, vector)
+                vectors.update(from_disk)
+            except Exception as e:
+                logger.warning(f"Embedding disk cache read failed: {e}")
+
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            encoded = encode_normalized(
+                list(missing.values()), model, batch_size)
+            fresh = dict(zip(missing, encoded))
+            vectors.update(fresh)
+            with self._lock:
+                self.misses += len(fresh)
+                for key, vector in fresh.items():
+                    self._remember(key, vector)
+                if self._disk is not None:
+                    try:
+                        self._disk.put_many(fresh)
+                    except Exception as e:
+                        logger.warning(
+                            f"Embedding disk cache write failed: {e}")
+
+        return np.stack([vectors[k] for k in keys])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "model": self.model_name,
+            "entries": len(self._lru),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str) -> EmbeddingCache:
+    """Process-wide cache for model_name, created on first use."""
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = EmbeddingCache(model_name, disk_dir=_default_disk_dir())
+            _caches[model_name] = cache
+        return cache
@@ -0,0 +1,177 @@
+# api/PromptOps/llm_clients.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive pool size per endpoint client
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# How many distinct (provider, endpoint, key) clients a worker keeps open
+MAX_CLIENTS = int(os.getenv("LLM_MAX_CLIENTS", "32"))
+
+# Placeholders used when no key is given, as litellm rejects an empty key
+DUMMY_API_KEYS = {
+    "openai": "dummy_openai_api_key",
+    "claude": "dummy_claude_api_key",
+    "gemini": "dummy_gemini_api_key",
+}
+
+# Providers that are reached through a user supplied URL
+URL_PROVIDERS = ("lm_studio", "llama", "custom", "typhoon")
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+
+
+def resolve_api_base(provider: str, url: Optional[str]) -> Optional[str]:
+    """Base URL to send with each request for this provider, if any."""
+    if provider == "claude":
+        return "https://api.anthropic.com/v1"
+    if provider in URL_PROVIDERS and url and url != "undefined":
+        # litellm appends the route itself
+        for suffix in ("/chat/completions", "/completions"):
+            if url.endswith(suffix):
+                return url[: -len(suffix)]
+        return url
+    return None
+
+
+def _close_on_loop(loop: asyncio.AbstractEventLoop, client: Any):
+    """Close an async client on the loop it belongs to, if that loop still runs."""
+    if loop.is_closed() or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+    except RuntimeError:
+        # The loop closed in the meantime
+        pass
+
+
+class _SdkClients:
+    """
+    The OpenAI SDK clients of one ProviderClient: one sync client, and
+    one async client per event loop (httpx async pools belong to the
+    loop that opened them).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sync_client: Any = None
+        self.async_clients: Dict[asyncio.AbstractEventLoop, Any] = {}
+
+    def drop_closed_loops(self):
+        """Forget clients of loops that have closed, releasing their sockets (lock held)."""
+        for loop in [loop for loop in self.async_clients if loop.is_closed()]:
+            del self.async_clients[loop]
+
+    def close(self):
+        with self.lock:
+            sync_client, self.sync_client = self.sync_client, None
+            async_clients, self.async_clients = self.async_clients, {}
+        if sync_client is not None:
+            sync_client.close()
+        for loop, client in async_clients.items():
+            _close_on_loop(loop, client)
+
+
+class ProviderClient:
+    """
+    Credentials and pooled connections for one (provider, endpoint, key).
+
+    Nothing is written to litellm's module globals: the key and base URL
+    travel with every request, so jobs for different tenants can share a
+    worker. OpenAI requests reuse this client's keep-alive pool. The
+    pinned litellm (1.24) takes no client for the other providers: it
+    sends Claude and custom requests with requests.post, Gemini through
+    the google-generativeai SDK, and has no OpenAI-client path for
+    typhoon or lm_studio, so those get the key and base URL per call.
+
+    The pools are closed once the client is no longer used: right away
+    when it is evicted from the registry while idle, otherwise when the
+    last job holding it lets go of it.
+    """
+
+    def __init__(self, provider: str, api_key: Optional[str], api_base: Optional[str]):
+        self.provider = provider
+        self.api_key = api_key or DUMMY_API_KEYS.get(provider)
+        self.api_base = api_base
+        self._sdk = _SdkClients()
+        self._finalizer = weakref.finalize(self, self._sdk.close)
+
+    def close(self):
+        self._finalizer()
+
+    def _openai_sync(self):
+        from openai import OpenAI
+        with self._sdk.lock:
+            if self._sdk.sync_client is None:
+                self._sdk.sync_client = OpenAI(
+                    api_key=self.api_key, base_url=self.api_base,
+                    max_retries=0, http_client=httpx.Client(limits=_pool_limits()))
+            return self._sdk.sync_client
+
+    def _openai_async(self):
+        from openai import AsyncOpenAI
+        loop = asyncio.get_running_loop()
+        with self._sdk.lock:
+            client = self._sdk.async_clients.get(loop)
+            if client is None:
+                self._sdk.drop_closed_loops()
+                client = AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.api_base,
+                    max_retries=0, http_client=httpx.AsyncClient(limits=_pool_limits()))
+                self._sdk.async_clients[loop] = client
+            return client
+
+    def request_kwargs(self, is_async: bool = False) -> Dict[str, Any]:
+        """Per-call litellm arguments carrying this client's credentials."""
+        kwargs: Dict[str, Any] = {}
+        if self.api_key:
+            kwargs["api_key"] = self.api_key
+        if self.api_base:
+            kwargs["api_base"] = self.api_base
+        if self.provider == "openai":
+            kwargs["client"] = self._openai_async() if is_async else self._openai_sync()
+        return kwargs
+
+
+# ---------------- registry ----------------
+_clients: "OrderedDict[Tuple[str, Optional[str], str], ProviderClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def get_provider_client(provider: str, api_key: Optional[str] = None, url: Optional[str] = None) -> ProviderClient:
+    """
+    Shared client for (provider, endpoint, key). Jobs with the same
+    credentials reuse one connection pool; only the MAX_CLIENTS most
+    recently used clients are kept.
+    """
+    provider = provider.lower()
+    api_base = resolve_api_base(provider, url)
+    key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    key = (provider, api_base, key_hash)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+        client = ProviderClient(provider, api_key, api_base)
+        _clients[key] = client
+        # Evicted clients close their pools as soon as no running job
+        # holds them any more (see ProviderClient)
+        while len(_clients) > MAX_CLIENTS:
+            _clients.popitem(last=False)
+        logger.info(f"Created LLM client for {provider} ({api_base or 'default endpoint'})")
+        return client
@@ -0,0 +1,112 @@
+# api/PromptOps/model_registry.py
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _load_sentence_transformer(name: str):
+    # Imported here so that torch is only pulled in by the first real load
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process, if the platform exposes it."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _parameter_bytes(model: Any) -> Optional[int]:
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return None
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe registry of embedding models.
+
+    Each model is loaded lazily on first use, exactly once per process,
+    and then shared by every caller. Load time and memory footprint are
+    recorded so workers can report what a model actually cost them.
+    """
+
+    def __init__(self, loader: Callable[[str], Any] = _load_sentence_transformer):
+        self._loader = loader
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._registry_lock:
+            if name not in self._locks:
+                self._locks[name] = threading.Lock()
+            return self._locks[name]
+
+    def get(self, name: str) -> Any:
+        """Return the shared instance of `name`, loading it if needed."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        # Per-model lock: loading one model never blocks users of another
+        with self._lock_for(name):
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            logger.info(f"Loading embedding model {name}")
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            model = self._loader(name)
+            load_seconds = time.perf_counter() - start
+            rss_after = _rss_bytes()
+
+            param_bytes = _parameter_bytes(model)
+            stats = {
+                "load_seconds": round(load_seconds, 3),
+                "parameter_mb": round(param_bytes / 2**20, 1) if param_bytes else None,
+                "rss_delta_mb": (
+                    round((rss_after - rss_before) / 2**20, 1)
+                    if rss_before is not None and rss_after is not None else None
+                ),
+            }
+            self._stats[name] = stats
+            self._models[name] = model
+            logger.info(f"Loaded embedding model {name}: {stats}")
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def preload(self, names: Iterable[str]):
+        """Eagerly load models, e.g. when a worker process starts."""
+        for name in names:
+            name = name.strip()
+            if not name:
+                continue
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Failed to preload embedding model {name}: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# ---------------- singleton ----------------
+model_registry = ModelRegistry()
+
+
+def get_model(name: str) -> Any:
+    return model_registry.get(name)
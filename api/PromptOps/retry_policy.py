@@ -0,0 +1,324 @@
+# api/PromptOps/retry_policy.py
+"""
+The single retry layer for LLM calls.
+
+litellm's own retries are disabled and tests no longer loop on errors;
+every provider call goes through RetryPolicy, which
+
+  * retries only errors worth retrying, with jittered exponential backoff
+    and the provider's Retry-After when it sends one,
+  * spends retries from a per-run RetryBudget, so a failing endpoint
+    cannot multiply the number of calls a run makes,
+  * checks a per-endpoint CircuitBreaker that fails fast while the
+    endpoint is down instead of queueing more doomed requests.
+"""
+
+import asyncio
+import logging
+import random
+import socket
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+FATAL = "fatal"
+UNKNOWN = "unknown"
+
+_FATAL_STATUS = {400, 401, 403, 404, 413, 422}
+_FATAL_NAMES = ("authentication", "badrequest", "notfound", "permissiondenied",
+                "contextwindowexceeded", "unprocessable", "invalidrequest")
+_TRANSIENT_NAMES = ("timeout", "connection", "serviceunavailable",
+                    "internalserver", "apierror", "overloaded")
+_RATE_LIMIT_PHRASES = ("rate limit", "ratelimit",
+                       "too many requests", "quota", "429")
+# Out of credit or over the plan's quota: often sent as a 429, but waiting
+# does not help, so these are fatal rather than rate limited
+_QUOTA_EXHAUSTED_STATUS = 402
+_QUOTA_EXHAUSTED_PHRASES = ("insufficient_quota", "insufficient quota",
+                            "exceeded your current quota", "billing",
+                            "credit balance", "payment required")
+
+# Never wait longer than this for a single Retry-After
+MAX_RETRY_AFTER = 120.0
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit is open."""
+
+
+def _status_code(e: BaseException) -> Optional[int]:
+    for source in (e, getattr(e, "response", None)):
+        code = getattr(source, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def classify_error(e: BaseException) -> str:
+    if isinstance(e, CircuitOpenError):
+        return FATAL
+    status = _status_code(e)
+    name = type(e).__name__.lower()
+    message = str(e).lower()
+    if (status == _QUOTA_EXHAUSTED_STATUS or "insufficient_quota" in str(getattr(e, "code", "")).lower()
+            or any(p in message for p in _QUOTA_EXHAUSTED_PHRASES)):
+        return FATAL
+    if status == 429 or "ratelimit" in name or any(p in message for p in _RATE_LIMIT_PHRASES):
+        return RATE_LIMITED
+    if status in _FATAL_STATUS or any(n in name for n in _FATAL_NAMES):
+        return FATAL
+    if (isinstance(e, (ConnectionError, TimeoutError, socket.timeout, asyncio.TimeoutError))
+            or (status is not None and status >= 500)
+            or any(n in name for n in _TRANSIENT_NAMES)):
+        return TRANSIENT
+    return UNKNOWN
+
+
+def retry_after_seconds(e: BaseException) -> Optional[float]:
+    """Read Retry-After (or retry-after-ms) from the error's HTTP response, if any."""
+    headers = None
+    for source in (getattr(e, "response", None), e):
+        headers = getattr(source, "headers", None)
+        if headers:
+            break
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms") or headers.get("Retry-After-Ms")
+        if value is not None:
+            return float(value) / 1000.0
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class RetryBudget:
+    """
+    Retries allowed for one run: a fixed allowance plus a fraction of the
+    requests made. Also collects the run's retry statistics.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 20):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self.wasted_calls = 0
+        self.backoff_seconds = 0.0
+        self.exhausted = 0
+        self.circuit_rejections = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.wasted_calls += 1
+
+    def try_spend(self, backoff: float) -> bool:
+        with self._lock:
+            if self.retries >= self.min_retries + self.ratio * self.requests:
+                self.exhausted += 1
+                return False
+            self.retries += 1
+            self.backoff_seconds += backoff
+            return True
+
+    def record_rejection(self):
+        with self._lock:
+            self.circuit_rejections += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "wasted_calls": self.wasted_calls,
+            "backoff_seconds": round(self.backoff_seconds, 2),
+            "budget_exhausted": self.exhausted,
+            "circuit_rejections": self.circuit_rejections,
+        }
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive transient failures.
+    While open every call fails immediately; after `reset_timeout` one
+    probe is let through (half-open) and its outcome closes or re-opens
+    the circuit. Rate limiting does not count: a 429 means the endpoint
+    is up.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(
+                f"Circuit for {self.name} is open after {self.failures} consecutive failures; not calling the provider")
+
+    def on_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def on_neutral(self):
+        """The call finished without telling us anything about endpoint health."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """Runs one provider call with retries, budget and circuit breaker applied."""
+
+    def __init__(self, budget: RetryBudget, max_attempts: int = 4, base_backoff: float = 1.0, max_backoff: float = 30.0):
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def _record_outcome(self, breaker: CircuitBreaker, kind: Optional[str]):
+        if kind is None:
+            breaker.on_success()
+        elif kind == TRANSIENT:
+            breaker.on_failure()
+        else:
+            breaker.on_neutral()
+
+    def _next_wait(self, e: BaseException, kind: str, attempt: int) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if kind == FATAL or attempt + 1 >= self.max_attempts:
+            return None
+        wait = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        if kind == RATE_LIMITED:
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None:
+                if retry_after > MAX_RETRY_AFTER:
+                    return None
+                wait = max(wait, retry_after)
+        if not self.budget.try_spend(wait):
+            logger.warning(f"Retry budget exhausted; giving up after: {e}")
+            return None
+        logger.warning(
+            f"LLM call failed ({kind}) on attempt {attempt + 1}/{self.max_attempts}: {e}. Retrying in {wait:.1f}s")
+        return wait
+
+    def _give_up(self, e: BaseException, kind: str, attempts: int):
+        if kind == TRANSIENT and isinstance(e, (ConnectionError, socket.error)) and not isinstance(e, socket.timeout):
+            raise ConnectionError(
+                f"Cannot connect to LLM API after {attempts} attempts. Please verify the service is running.") from e
+        raise e
+
+    def _check_circuit(self, breaker: CircuitBreaker):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            self.budget.record_rejection()
+            raise
+
+    @staticmethod
+    def _past_deadline(wait: float, deadline: Optional[float]) -> bool:
+        return deadline is not None and time.monotonic() + wait >= deadline
+
+    def call(self, fn: Callable[[], Any], breaker: CircuitBreaker, deadline: Optional[float] = None) -> Any:
+        """
+        Run fn with retries. `deadline` (time.monotonic()) stops retrying
+        once the next attempt could not start before it.
+        """
+        for attempt in range(self.max_attempts):
+            self._check_circuit(breaker)
+            self.budget.record_request()
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify_error(e)
+                self.budget.record_failure()
+                self._record_outcome(breaker, kind)
+                wait = self._next_wait(e, kind, attempt)
+                if wait is None or self._past_deadline(wait, deadline):
+                    self._give_up(e, kind, attempt + 1)
+                time.sleep(wait)
+            else:
+                self._record_outcome(breaker, None)
+                return result
+
+    async def acall(self, fn: Callable[[], Any], breaker: CircuitBreaker) -> Any:
+        for attempt in range(self.max_attempts):
+            self._check_circuit(breaker)
+            self.budget.record_request()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                breaker.on_neutral()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                self.budget.record_failure()
+                self._record_outcome(breaker, kind)
+                wait = self._next_wait(e, kind, attempt)
+                if wait is None:
+                    self._give_up(e, kind, attempt + 1)
+                await asyncio.sleep(wait)
+            else:
+                self._record_outcome(breaker, None)
+                return result
+
+
+# ---------------- breaker registry ----------------
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str, url: Optional[str] = None) -> CircuitBreaker:
+    """One breaker per endpoint, shared by every run in the process."""
+    name = f"{provider.lower()}@{url}" if url else provider.lower()
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
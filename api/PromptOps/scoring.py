@@ -0,0 +1,88 @@
+# api/PromptOps/scoring.py
+
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Large batches keep the transformer busy instead of paying per-call overhead
+DEFAULT_BATCH_SIZE = 256
+
+
+def encode_normalized(texts: Sequence[str], model, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    """
+    Encode texts in batches and return L2-normalized float32 embeddings,
+    so that cosine similarity becomes a plain dot product.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    embeddings = model.encode(
+        list(texts),
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def cosine_scores(pairs: Sequence[Tuple[str, str]], model, batch_size: int = DEFAULT_BATCH_SIZE, cache=None) -> np.ndarray:
+    """
+    Compute cosine similarity for every (text_a, text_b) pair.
+
+    Every unique string is encoded at most once, in batches, and all
+    similarities are taken at once from the normalized embedding matrix.
+    When an EmbeddingCache is given, only strings it has not seen reach
+    the model.
+    """
+    if not pairs:
+        return np.zeros(0, dtype=np.float32)
+
+    positions: Dict[str, int] = {}
+    for text_a, text_b in pairs:
+        positions.setdefault(text_a, len(positions))
+        positions.setdefault(text_b, len(positions))
+
+    if cache is not None:
+        embeddings = cache.encode(list(positions), model, batch_size)
+    else:
+        embeddings = encode_normalized(list(positions), model, batch_size)
+    idx_a = np.fromiter((positions[a] for a, _ in pairs),
+                        dtype=np.int64, count=len(pairs))
+    idx_b = np.fromiter((positions[b] for _, b in pairs),
+                        dtype=np.int64, count=len(pairs))
+    # Row-wise dot product == diagonal of (A @ B.T) without building the full matrix
+    return np.einsum("ij,ij->i", embeddings[idx_a], embeddings[idx_b])
+
+
+def score_tests(tests: List[Any], model, batch_size: int = DEFAULT_BATCH_SIZE, cache=None) -> int:
+    """
+    Fill in score_original / score_perturb for every test that has a response
+    and has not been scored yet. Returns the number of comparisons made.
+    """
+    pairs: List[Tuple[str, str]] = []
+    targets: List[Tuple[Any, str]] = []
+
+    for test in tests:
+        expected = str(test.expected_result)
+        if test.score_original is None and test.original_response:
+            pairs.append((str(test.original_response), expected))
+            targets.append((test, "score_original"))
+        if test.score_perturb is None and test.perturb_response:
+            pairs.append((str(test.perturb_response), expected))
+            targets.append((test, "score_perturb"))
+
+    if not pairs:
+        return 0
+
+    scores = cosine_scores(pairs, model, batch_size, cache)
+    for (test, attr), score in zip(targets, scores):
+        setattr(test, attr, float(score))
+
+    logger.info(
+        f"Scored {len(pairs)} responses across {len(tests)} tests in one batch")
+    return len(pairs)
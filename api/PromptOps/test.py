@@ -1,114 +1,46 @@
 # api/PromptOps/test.py
 
-from functools import wraps
-import random
-import socket
+import asyncio
 import logging
+import os
 import time
+import httpx
 import litellm
-from sentence_transformers import SentenceTransformer
-import requests
-import numpy as np
-import threading
+
+from .concurrency import get_concurrency
+from .completion_cache import get_completion_cache, request_fingerprint
+from .embedding_cache import get_embedding_cache
+from .llm_clients import get_provider_client
+from .model_registry import model_registry
+from .retry_policy import RetryBudget, RetryPolicy, get_circuit_breaker
+from .scoring import cosine_scores, score_tests
+from ..utils.rate_limiter import estimate_tokens, rate_limiter
 
 logger = logging.getLogger(__name__)
-similarity_model = SentenceTransformer("all-distilroberta-v1")
-
-# Global thread-safe provider request tracking
-provider_locks = {
-    'openai': threading.RLock(),
-    'claude': threading.RLock(),
-    'gemini': threading.RLock(),
-    'lm_studio': threading.RLock(),
-    'custom': threading.RLock(),
-    'typhoon': threading.RLock(),
-}
-
-# Max pending requests before queuing
-MAX_CONCURRENT_PER_PROVIDER = {
-    'openai': 3,
-    'claude': 2,
-    'gemini': 3,
-    'lm_studio': 5,
-    'custom': 5,
-    'typhoon': 3
-}
-
-# Track concurrent requests per provider
-active_requests = {
-    provider: 0 for provider in provider_locks
-}
-
-
-def robust_llm_retry(max_retries=5, initial_backoff=3.0, max_backoff=90.0):
-    """
-    Decorator providing robust retry logic for LLM API calls.
-    """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            backoff = initial_backoff
-
-            # Preserve the original provider for callbacks
-            provider = kwargs.get('provider', None)
-            if not provider and args and hasattr(args[0], 'model_provider'):
-                provider = args[0].model_provider
-
-            for attempt in range(max_retries):
-                try:
-                    old_timeout = socket.getdefaulttimeout()
-                    socket.setdefaulttimeout(60)
-                    try:
-                        return func(*args, **kwargs)
-                    finally:
-                        socket.setdefaulttimeout(old_timeout)
-                except (requests.ConnectionError, requests.Timeout, socket.error, ConnectionRefusedError) as e:
-                    last_exception = e
-                    logger.warning(
-                        f"Connection error on attempt {attempt+1}/{max_retries}: {str(e)}. Retrying in {backoff:.1f}s...")
-                    time.sleep(backoff)
-                    backoff = min(backoff * 1.5 * (1 + 0.1 *
-                                  random.random()), max_backoff)
-                except litellm.exceptions.RateLimitError as e:
-                    last_exception = e
-                    logger.warning(
-                        f"Rate limit hit on attempt {attempt+1}: {str(e)}. Retrying in {backoff:.1f}s...")
-                    time.sleep(backoff)
-                    backoff = min(backoff * 2, max_backoff)
-                except Exception as e:
-                    last_exception = e
-                    if attempt < min(2, max_retries - 1):
-                        logger.warning(
-                            f"Error on attempt {attempt+1}: {str(e)}. Retrying in {backoff:.1f}s...")
-                        time.sleep(backoff)
-                        backoff = min(backoff * 2, max_backoff)
-                    else:
-                        logger.error(
-                            f"Error after {attempt+1} attempts: {str(e)}")
-                        raise
-            if isinstance(last_exception, (requests.ConnectionError, socket.error, ConnectionRefusedError)):
-                error_message = f"Cannot connect to LLM API after {max_retries} attempts. Please verify the service is running."
-                logger.error(error_message)
-                raise ConnectionError(error_message) from last_exception
-            raise last_exception
-        return wrapper
-    return decorator
+SIMILARITY_MODEL_NAME = "all-distilroberta-v1"
+
+# Per-request deadlines for provider calls (seconds)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# Wall-clock limit for one test: both prompts, retries and backoff included
+TEST_DEADLINE_SECONDS = float(os.getenv("TEST_DEADLINE_SECONDS", "300"))
+
+
+def get_similarity_model():
+    """Shared scoring model, loaded on first use via the model registry."""
+    return model_registry.get(SIMILARITY_MODEL_NAME)
 
 
 def evaluate_response(text1, text2, model):
     """
     Evaluate similarity between two texts.
     """
-    emb_a = model.encode([text1])
-    emb_b = model.encode([text2])
-    similarities = np.dot(emb_a, emb_b.T) / \
-        (np.linalg.norm(emb_a) * np.linalg.norm(emb_b))
-    return similarities.item()
+    return float(cosine_scores([(str(text1), str(text2))], model)[0])
 
 
 class PromptCompletion:
-    def __init__(self, model_provider, model, system_content, url, temperature=0, top_p=0, max_tokens=100, api_key=None, stream=False):
+    def __init__(self, model_provider, model, system_content, url, temperature=0, top_p=0, max_tokens=100, api_key=None, stream=False, use_cache=True,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT):
         self.model_provider = model_provider.lower()
         self.model = model
         self.system_content = system_content
@@ -118,46 +50,33 @@ class PromptCompletion:
         self.api_key = api_key or None
         self.stream = stream
         self.url = url
-
-        # Configure litellm with appropriate API keys
-        self._configure_litellm()
+        # use_cache=False forces fresh calls even when a cached answer exists
+        self.use_cache = use_cache
+        # Deadlines live on each request, never on the process-wide socket default
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # The only retry layer: per-run budget plus a breaker per endpoint
+        self.retry_budget = RetryBudget()
+        self._retry_policy = RetryPolicy(self.retry_budget)
+
+        # Per-instance credentials and connection pool; litellm globals
+        # are never touched, so several jobs can share one worker
+        self.client = get_provider_client(
+            self.model_provider, self.api_key, self.url)
 
         # Log current rate limit status
         self._log_rate_limit_status()
 
-    def _configure_litellm(self):
-        """Configure LiteLLM with the appropriate API keys and settings."""
-        if self.model_provider == "openai":
-            litellm.api_key = self.api_key or "dummy_openai_api_key"
-        elif self.model_provider == "claude":
-            litellm.api_key = self.api_key or "dummy_claude_api_key"
-            litellm.api_base = "https://api.anthropic.com/v1"
-        elif self.model_provider == "gemini":
-            litellm.api_key = self.api_key or "dummy_gemini_api_key"
-        # elif self.model_provider == "lm_studio":
-        #     # For LM Studio, we do not use an API key.
-        #     # We also expect the user to specify the URL when constructing this object.
-        #     logger.info(
-        #         "LM Studio selected. Ensure that the URL is provided by the user.")
-        #     # Do not override or set litellm.api_key and do not set LM Studio base URL from env.
-        # elif self.model_provider == "typhoon":
-        #     # Custom configuration for Typhoon if needed.
-        #     pass
-        # elif self.model_provider == "custom":
-        #     pass
-
     def _log_rate_limit_status(self):
         """Log current rate limit status for this provider"""
         try:
-            from ..utils.model_rate_limits import MODEL_RATE_LIMITS
-
-            limits = MODEL_RATE_LIMITS.get(self.model_provider, {})
-            if isinstance(limits, dict):
-                model_limit = limits.get(self.model, limits.get("default", 15))
-            else:
-                model_limit = limits
+            from ..utils.model_rate_limits import get_rate_limits
 
-            logger.info(f"{self.model_provider} rate limit: {model_limit} RPM")
+            rpm, tpm = get_rate_limits(self.model_provider, self.model)
+            logger.info(
+                f"{self.model_provider} rate limit: {rpm} RPM, {tpm or 'unlimited'} TPM")
         except Exception as e:
             logger.warning(f"Error logging rate limit status: {e}")
 
@@ -184,45 +103,147 @@ class PromptCompletion:
             return f"lm_studio/{self.model}"
         return self.model
 
-    @robust_llm_retry(max_retries=5, initial_backoff=3.0, max_backoff=90.0)
-    def generate_completion(self, prompt, batch=False, chain_of_thought=False):
-        """
-        Generate completion using LiteLLM for all providers.
-        """
-        try:
+    def _completion_kwargs(self, prompt, is_async=False):
+        """Request arguments shared by the sync and async LiteLLM calls."""
+        return dict(
+            # Key, base URL and pooled client for this instance
+            **self.client.request_kwargs(is_async),
             # Format model name for litellm
-            model_name = self._get_litellm_model_name()
-
+            model=self._get_litellm_model_name(),
             # Create messages in the format expected by LiteLLM
-            messages = [
+            messages=[
                 {"role": "system", "content": self.system_content},
                 {"role": "user", "content": prompt}
-            ]
-
-            # Make the completion request
-            response = litellm.completion(
-                model=model_name,
-                messages=messages,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                max_tokens=self.max_tokens,
-                stream=False,  # No streaming support for simplicity
-                timeout=30
-            )
-
-            # Extract the response content
-            response_content = response.choices[0].message.content
-            return response_content
-
-        except litellm.exceptions.RateLimitError as e:
-            logger.warning(
-                f"Rate limit error with {self.model_provider}: {str(e)}")
-            raise Exception(
-                f"Rate limit exceeded for {self.model_provider}: {str(e)}")
+            ],
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_tokens=self.max_tokens,
+            stream=False,  # No streaming support for simplicity
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+
+    @property
+    def attempt_deadline(self):
+        """Hard cap on one attempt, even if a server keeps trickling bytes."""
+        return self.connect_timeout + self.read_timeout
+
+    def completion_key(self, prompt):
+        """Identifies a request: same key means the same completion."""
+        return (self.model_provider, self.model, self.url, self.system_content,
+                self.temperature, self.top_p, self.max_tokens, prompt)
+
+    def _estimated_tokens(self, prompt):
+        return estimate_tokens(self.system_content, prompt, max_tokens=self.max_tokens)
+
+    @staticmethod
+    def _usage_tokens(response):
+        usage = getattr(response, "usage", None)
+        return getattr(usage, "total_tokens", None) if usage else None
+
+    def _cache_key(self, prompt):
+        """
+        Fingerprint for the persistent completion cache, or None when the
+        request should not be cached. Only deterministic (temperature 0)
+        requests are cached.
+        """
+        if not self.use_cache or self.temperature != 0 or get_completion_cache() is None:
+            return None
+        return request_fingerprint(
+            self.model_provider, self.model, self.system_content, prompt,
+            self.temperature, self.top_p, self.max_tokens, self.url)
+
+    def _cached(self, key):
+        cached = get_completion_cache().get(key)
+        if cached is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+        return cached
+
+    def cache_stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_ratio": round(self.cache_hits / lookups, 4) if lookups else None,
+        }
 
-        except Exception as e:
-            # Let the retry decorator handle other errors
-            raise
+    def generate_completion(self, prompt, batch=False, chain_of_thought=False, deadline=None):
+        """
+        Generate completion using LiteLLM for all providers, answering from
+        the persistent completion cache when possible. `deadline` is a
+        time.monotonic() value after which no further retries start.
+        """
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+        response = self._request_completion(prompt, deadline)
+        if key is not None and response is not None:
+            get_completion_cache().put(key, response)
+        return response
+
+    async def agenerate_completion(self, prompt):
+        """
+        Async counterpart of generate_completion built on litellm.acompletion.
+        Cancelling the awaiting task aborts the in-flight HTTP request.
+        """
+        key = self._cache_key(prompt)
+        loop = asyncio.get_running_loop()
+        if key is not None:
+            # SQLite calls may wait on a lock; keep them off the event loop
+            cached = await loop.run_in_executor(None, self._cached, key)
+            if cached is not None:
+                return cached
+        response = await self._arequest_completion(prompt)
+        if key is not None and response is not None:
+            await loop.run_in_executor(None, get_completion_cache().put, key, response)
+        return response
+
+    def retry_stats(self):
+        return self.retry_budget.stats()
+
+    def _circuit_breaker(self):
+        return get_circuit_breaker(self.model_provider, self.url)
+
+    def _request_completion(self, prompt, deadline=None):
+        """Call the provider through the retry policy."""
+        return self._retry_policy.call(
+            lambda: self._attempt_completion(prompt), self._circuit_breaker(), deadline=deadline)
+
+    async def _arequest_completion(self, prompt):
+        return await self._retry_policy.acall(
+            lambda: self._aattempt_completion(prompt), self._circuit_breaker())
+
+    def _attempt_completion(self, prompt):
+        """
+        One provider call. Every attempt first takes its RPM/TPM share
+        from the shared limiter.
+        """
+        tokens = self._estimated_tokens(prompt)
+        rate_limiter.acquire(self.model_provider, self.model, tokens)
+
+        # Make the completion request
+        response = litellm.completion(**self._completion_kwargs(prompt))
+        rate_limiter.record_usage(
+            self.model_provider, self.model, tokens, self._usage_tokens(response))
+
+        # Extract the response content
+        return response.choices[0].message.content
+
+    async def _aattempt_completion(self, prompt):
+        tokens = self._estimated_tokens(prompt)
+        await rate_limiter.aacquire(self.model_provider, self.model, tokens)
+
+        # The adaptive window decides how many requests may be in flight
+        async with get_concurrency(self.model_provider, self.model).slot():
+            response = await asyncio.wait_for(
+                litellm.acompletion(**self._completion_kwargs(prompt, is_async=True)),
+                timeout=self.attempt_deadline)
+        await rate_limiter.arecord_usage(
+            self.model_provider, self.model, tokens, self._usage_tokens(response))
+        return response.choices[0].message.content
 
 
 class Test:
@@ -243,70 +264,109 @@ class Test:
         self.completion_model = None
         self.error = None
 
-    def _make_api_call(self, text, max_retries=5):
+    def _make_api_call(self, text, deadline=None):
         """
-        Attempt to send the API call using LiteLLM via PromptCompletion.
-        For rate limit errors, retry with backoff.
+        Send one prompt via PromptCompletion, which owns all retrying.
+        A call that still fails is recorded as an "ERROR: ..." response.
+        """
+        try:
+            return self.completion_model.generate_completion(text, deadline=deadline)
+        except Exception as e:
+            logger.error(f"LLM call failed for test {self.name}: {str(e)}")
+            return f"ERROR: {str(e)}"
+
+    async def _amake_api_call(self, text):
+        """
+        Async counterpart of _make_api_call, using agenerate_completion.
+        """
+        try:
+            return await self.completion_model.agenerate_completion(text)
+        except Exception as e:
+            logger.error(f"LLM call failed for test {self.name}: {str(e)}")
+            return f"ERROR: {str(e)}"
+
+    def run(self, completion_model: PromptCompletion, score: bool = True):
+        """
+        Query the model for the original and perturbed prompts. With
+        score=False the similarity scoring is left to a batched pass
+        (see PromptOps.scoring.score_tests).
         """
-        attempt = 0
-        backoff_time = 3.0
-        while True:
-            try:
-                response = self.completion_model.generate_completion(text)
-                return response
-            except Exception as e:
-                error_message = str(e).lower()
-                # Check if the error relates to rate limit or quota
-                if any(phrase in error_message for phrase in ["rate limit", "quota", "capacity", "too many"]):
-                    attempt += 1
-                    jitter = random.uniform(0.5, 1.5)
-                    wait_time = backoff_time * jitter
-
-                    logger.warning(
-                        f"Rate limit hit on attempt {attempt} for test {self.name}. "
-                        f"Waiting {wait_time:.2f}s before retry.")
-
-                    time.sleep(wait_time)
-
-                    # Double the backoff for next attempt if needed
-                    backoff_time = min(backoff_time * 2, 120.0)
-                else:
-                    # For non-rate limit errors, cap the number of retries
-                    attempt += 1
-                    if attempt >= max_retries:
-                        logger.error(
-                            f"Non rate-limit error after {max_retries} attempts for test {self.name}: {str(e)}")
-                        return f"ERROR: {str(e)}"
-                    else:
-                        sleep_time = min(2.0 * attempt, 5.0)
-                        logger.warning(
-                            f"Error on attempt {attempt} for test {self.name}: {str(e)}. Waiting {sleep_time:.2f}s before retry.")
-                        time.sleep(sleep_time)
-
-    def run(self, completion_model: PromptCompletion):
         try:
             self.completion_model = completion_model
             logger.info(f"Running test: {self.name}")
-            self.original_response = self._make_api_call(self.prompt)
+            deadline = time.monotonic() + TEST_DEADLINE_SECONDS
+            self.original_response = self._make_api_call(self.prompt, deadline)
             if isinstance(self.original_response, str) and self.original_response.startswith("ERROR:"):
                 self.error = self.original_response
                 self.score_original = 0
                 return
 
-            # Add delay between calls to respect rate limits
-            provider = self.completion_model.model_provider.lower()
-            # Simple delay based on provider - could use more sophisticated approach
-            time.sleep(1.0)  # Base delay between calls
-
             if self.perturb_text:
-                self.perturb_response = self._make_api_call(self.perturb_text)
-
-            if self.original_response:
-                self.score_original = evaluate_response(
-                    self.original_response, self.expected_result, similarity_model)
-            if self.perturb_response:
-                self.score_perturb = evaluate_response(
-                    self.perturb_response, self.expected_result, similarity_model)
+                if time.monotonic() >= deadline:
+                    self.perturb_response = self._deadline_error()
+                else:
+                    self.perturb_response = self._make_api_call(
+                        self.perturb_text, deadline)
+
+            if score:
+                score_tests([self], get_similarity_model(),
+                            cache=get_embedding_cache(SIMILARITY_MODEL_NAME))
+        except Exception as e:
+            logger.error(f"Error running test {self.name}: {str(e)}")
+            self.error = str(e)
+            self.original_response = f"ERROR: {str(e)}"
+            if self.score_original is None:
+                self.score_original = 0
+
+    def _aoriginal_call(self, memo):
+        if memo is None:
+            return self._amake_api_call(self.prompt)
+        return memo.get(self.completion_model.completion_key(self.prompt),
+                        lambda: self._amake_api_call(self.prompt))
+
+    @staticmethod
+    def _deadline_error():
+        return f"ERROR: Test exceeded its {TEST_DEADLINE_SECONDS:g}s deadline"
+
+    async def _aquery(self, memo):
+        # Each response is stored as soon as it arrives, so a deadline
+        # keeps whatever already finished. The perturbed prompt is only
+        # paid for once the original has an answer to compare it with.
+        self.original_response = await self._aoriginal_call(memo)
+        if not self.perturb_text:
+            return
+        if isinstance(self.original_response, str) and self.original_response.startswith("ERROR:"):
+            return
+        self.perturb_response = await self._amake_api_call(self.perturb_text)
+
+    async def arun(self, completion_model: PromptCompletion, memo=None):
+        """
+        Async variant of run() used by the AsyncTestEngine. The perturbed
+        prompt is requested once the original succeeds (tests themselves
+        run concurrently); scoring is always left to the batched pass.
+        With a CompletionMemo, tests that share an original prompt share
+        a single request for it. Anything still outstanding after
+        TEST_DEADLINE_SECONDS is cancelled.
+        """
+        try:
+            self.completion_model = completion_model
+            logger.info(f"Running test: {self.name}")
+            try:
+                await asyncio.wait_for(self._aquery(memo), timeout=TEST_DEADLINE_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Test {self.name} cut off after {TEST_DEADLINE_SECONDS:g}s")
+                if self.original_response is None:
+                    self.original_response = self._deadline_error()
+                if self.perturb_text and self.perturb_response is None:
+                    self.perturb_response = self._deadline_error()
+
+            if isinstance(self.original_response, str) and self.original_response.startswith("ERROR:"):
+                self.error = self.original_response
+                self.score_original = 0
+                self.perturb_response = None
+                if memo is not None:
+                    memo.forget(completion_model.completion_key(self.prompt))
         except Exception as e:
             logger.error(f"Error running test {self.name}: {str(e)}")
             self.error = str(e)
@@ -0,0 +1,397 @@
+# api/PromptOps/test_batch.py
+
+import asyncio
+import logging
+import math
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .async_engine import AsyncTestEngine, run_sync
+from .completion_memo import CompletionMemo
+from .embedding_cache import get_embedding_cache
+from .scoring import cosine_scores
+from .test import SIMILARITY_MODEL_NAME, Test, get_similarity_model
+from ..core.result_pages import INTERNED_FIELDS, build_rows
+
+logger = logging.getLogger(__name__)
+
+
+class StringTable:
+    """Interns values so each distinct one is stored once; None is -1."""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        # Keyed by type too, so equal values of different types (1, 1.0
+        # and True) keep codes of their own
+        self._codes: Dict[Tuple[type, Any], int] = {}
+
+    def intern(self, value: Any) -> int:
+        if value is None:
+            return -1
+        key = (type(value), value)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value: Any) -> int:
+        """Code of an already interned value; -2 (matching no row) if never seen."""
+        return self._codes.get((type(value), value), -2)
+
+    def __getitem__(self, code: int) -> Any:
+        return None if code < 0 else self.values[code]
+
+
+class _BatchTest(Test):
+    """
+    A Test materialized from one batch row while it runs. Its results are
+    written back to the batch when it finishes, and the object is dropped.
+    """
+
+    def __init__(self, batch: "TestBatch", pos: int):
+        super().__init__(**batch.test_kwargs(pos))
+        self._batch = batch
+        self._pos = pos
+
+    async def arun(self, completion_model: Any, memo=None):
+        # A test cancelled by an abort is not stored: whatever it got back
+        # so far is incomplete, and the row runs again on resume
+        await super().arun(completion_model, memo=memo)
+        self._batch.finish(self._pos, self)
+
+
+def _floats(column: array) -> np.ndarray:
+    # Copy, so the array is not left exporting its buffer (which would
+    # stop it from growing)
+    return np.frombuffer(column, dtype=np.float64).copy() if len(column) else np.zeros(0)
+
+
+def _ints(column: array) -> np.ndarray:
+    return np.frombuffer(column, dtype=np.int32).copy() if len(column) else np.zeros(0, dtype=np.int32)
+
+
+class TestBatch:
+    """
+    Columnar storage for a large set of tests.
+
+    Instead of one Test object (and later one result dict) per row, every
+    attribute is a column: text columns hold codes into a shared
+    StringTable, so a context or original answer repeated across thousands
+    of perturbations is stored once; scores are float arrays with NaN for
+    "not scored". Test objects only exist while a row is in flight on the
+    engine, and result dicts are only built for the rows asked for.
+
+    With a `checkpoint` (see services.job_checkpoint.JobCheckpoint), each
+    finished row is recorded as it completes, and rows it already holds
+    are skipped when the batch is run again. A `progress` reporter (see
+    services.job_progress.JobProgress) is told about every finished row.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.names: List[str] = []
+        self._codes: Dict[str, array] = {field: array('i') for field in INTERNED_FIELDS}
+        self.score_original = array('d')
+        self.score_perturb = array('d')
+        self.ran = array('b')
+        self.aborted = False
+        self.checkpoint: Any = None
+        self.progress: Any = None
+        self._fail: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, prompt: Any, expected_result: Any, description: Optional[str] = None,
+            perturb_method: Optional[str] = None, perturb_text: Any = None,
+            pass_condition: str = "increase", test_type: Optional[str] = None) -> int:
+        """Append one test (same arguments as Test) and return its row."""
+        intern = self.strings.intern
+        self.names.append(name)
+        self._codes["description"].append(intern(description))
+        self._codes["test_type"].append(intern(test_type))
+        self._codes["pass_condition"].append(intern(pass_condition))
+        self._codes["prompt"].append(intern(prompt))
+        self._codes["expected_result"].append(intern(expected_result))
+        self._codes["perturb_text"].append(intern(perturb_text))
+        for field in ("response_original", "response_perturb", "error"):
+            self._codes[field].append(-1)
+        self.score_original.append(math.nan)
+        self.score_perturb.append(math.nan)
+        self.ran.append(0)
+        self._fail = None
+        return len(self.names) - 1
+
+    @classmethod
+    def from_tests(cls, tests: Iterable[Any]) -> "TestBatch":
+        batch = cls()
+        for test in tests:
+            pos = batch.add(test.name, test.prompt, test.expected_result,
+                            description=test.description,
+                            perturb_text=test.perturb_text,
+                            pass_condition=test.pass_condition,
+                            test_type=test.test_type)
+            batch.store(pos, test)
+        return batch
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "TestBatch":
+        """Rebuild a batch from to_payload() output."""
+        batch = cls()
+        for value in payload["strings"]:
+            batch.strings.intern(value)
+        batch.names = list(payload["name"])
+        for field in INTERNED_FIELDS:
+            batch._codes[field] = array('i', payload[field])
+        for field in ("score_original", "score_perturb"):
+            setattr(batch, field, array(
+                'd', (math.nan if s is None else s for s in payload[field])))
+        batch.ran = array('b', (batch._finished(pos) for pos in range(len(batch.names))))
+        return batch
+
+    def _text(self, field: str, pos: int) -> Any:
+        return self.strings[self._codes[field][pos]]
+
+    def _finished(self, pos: int) -> bool:
+        """
+        Whether row `pos` has all its responses: the original one, and the
+        perturbed one too if the row has a perturbation (unless the
+        original failed, which drops the perturbed response).
+        """
+        original = self._text("response_original", pos)
+        if original is None:
+            return False
+        if not self._text("perturb_text", pos) or self._codes["response_perturb"][pos] >= 0:
+            return True
+        return isinstance(original, str) and original.startswith("ERROR:")
+
+    def test_kwargs(self, pos: int) -> Dict[str, Any]:
+        test_type = self._text("test_type", pos)
+        return {
+            "name": self.names[pos],
+            "prompt": self._text("prompt", pos),
+            "expected_result": self._text("expected_result", pos),
+            "description": self._text("description", pos),
+            "perturb_method": test_type,
+            "perturb_text": self._text("perturb_text", pos),
+            "pass_condition": self._text("pass_condition", pos),
+            "test_type": test_type,
+        }
+
+    def store(self, pos: int, test: Any):
+        """Copy a finished test's responses, scores and error into row `pos`."""
+        intern = self.strings.intern
+        self._codes["response_original"][pos] = intern(test.original_response)
+        self._codes["response_perturb"][pos] = intern(test.perturb_response)
+        self._codes["error"][pos] = intern(test.error)
+        self.score_original[pos] = math.nan if test.score_original is None else float(test.score_original)
+        self.score_perturb[pos] = math.nan if test.score_perturb is None else float(test.score_perturb)
+        self.ran[pos] = self._finished(pos)
+        self._fail = None
+
+    def finish(self, pos: int, test: Any):
+        """Store a row that just finished running and checkpoint it."""
+        self.store(pos, test)
+        if self.checkpoint is not None:
+            self.checkpoint.record(self, pos)
+        if self.progress is not None:
+            self.progress.record(self, pos)
+
+    def responses(self, pos: int) -> Tuple[Any, Any]:
+        return self._text("response_original", pos), self._text("response_perturb", pos)
+
+    def error(self, pos: int) -> Optional[str]:
+        return self._text("error", pos)
+
+    def test_type(self, pos: int) -> Optional[str]:
+        return self._text("test_type", pos)
+
+    def restore_responses(self, pos: int, original: Any, perturb: Any):
+        """Mark a row as already run with these responses (scores are recomputed)."""
+        self._codes["response_original"][pos] = self.strings.intern(original)
+        self._codes["response_perturb"][pos] = self.strings.intern(perturb)
+        self._codes["error"][pos] = -1
+        self.score_original[pos] = math.nan
+        self.score_perturb[pos] = math.nan
+        self.ran[pos] = self._finished(pos)
+        self._fail = None
+
+    def iter_tests(self, rows: Optional[Iterable[int]] = None) -> Iterator[_BatchTest]:
+        """Lazily materialize rows as runnable tests, one at a time."""
+        for pos in (range(len(self)) if rows is None else rows):
+            yield _BatchTest(self, pos)
+
+    def all_ran(self, start: int, stop: int) -> bool:
+        return all(self.ran[start:stop])
+
+    # ---------- execution ----------
+
+    def run(self, completion_model: Any, abort_check_fn: Optional[Callable[[], bool]] = None,
+            memo: Optional[CompletionMemo] = None, max_in_flight: Optional[int] = None):
+        """Blocking wrapper around arun for synchronous callers."""
+        if not len(self):
+            logger.warning("No tests to run in the batch.")
+            return
+        run_sync(self.arun(completion_model, abort_check_fn,
+                           memo=memo, max_in_flight=max_in_flight))
+
+    async def arun(self, completion_model: Any, abort_check_fn: Optional[Callable[[], bool]] = None,
+                   memo: Optional[CompletionMemo] = None, max_in_flight: Optional[int] = None):
+        """
+        Run every row that has not run yet on the async engine, then
+        score them in one batch.
+        """
+        if not len(self):
+            logger.warning("No tests to run in the batch.")
+            return
+        start_time = time.time()
+        if self.checkpoint is not None:
+            self.checkpoint.restore(self)
+        pending = [pos for pos in range(len(self)) if not self.ran[pos]]
+        if self.progress is not None:
+            self.progress.start(self, pending)
+        engine = AsyncTestEngine(
+            completion_model,
+            max_in_flight=max_in_flight,
+            abort_check_fn=abort_check_fn,
+            memo=memo
+        )
+        try:
+            completed = await engine.run(self.iter_tests(pending), total=len(pending))
+        finally:
+            if self.checkpoint is not None:
+                await self.checkpoint.aflush()
+            if self.progress is not None:
+                await self.progress.aflush()
+        self.aborted = engine.aborted
+        if self.aborted:
+            logger.warning("Test batch execution aborted.")
+
+        if self.progress is not None:
+            self.progress.set_phase("Scoring responses")
+        # Embedding is CPU-bound; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.score_all)
+        logger.info(
+            f"Test batch execution completed in {time.time() - start_time:.2f}s. "
+            f"Processed {completed}/{len(pending)} tests ({len(self) - len(pending)} already done).")
+
+    def score_all(self, model: Any = None):
+        """
+        Fill in every missing score with one batched embedding pass.
+        Same rules as scoring.score_tests, read straight from the columns.
+        """
+        cache = None
+        if model is None:
+            model = get_similarity_model()
+            cache = get_embedding_cache(SIMILARITY_MODEL_NAME)
+
+        pairs: List[Tuple[str, str]] = []
+        targets: List[Tuple[array, int]] = []
+        expected_codes = self._codes["expected_result"]
+        for scores, field in ((self.score_original, "response_original"),
+                              (self.score_perturb, "response_perturb")):
+            responses = self._codes[field]
+            for pos in range(len(self)):
+                response = self.strings[responses[pos]]
+                if response and math.isnan(scores[pos]):
+                    pairs.append((str(response), str(self.strings[expected_codes[pos]])))
+                    targets.append((scores, pos))
+        if not pairs:
+            return
+        try:
+            values = cosine_scores(pairs, model, cache=cache)
+        except Exception as e:
+            logger.error(f"Error scoring test batch: {str(e)}")
+            return
+        for (scores, pos), value in zip(targets, values):
+            scores[pos] = float(value)
+        self._fail = None
+        logger.info(
+            f"Scored {len(pairs)} responses across {len(self)} tests in one batch")
+
+    # ---------- summaries ----------
+
+    def fail_mask(self) -> np.ndarray:
+        """Per-row fail flag, with the same rules as Test.summarize()."""
+        if self._fail is None:
+            original = _floats(self.score_original)
+            perturb = _floats(self.score_perturb)
+            conditions = _ints(self._codes["pass_condition"])
+            scored = ~np.isnan(original) & ~np.isnan(perturb)
+            with np.errstate(invalid="ignore"):
+                increase = (conditions == self.strings.code("increase")) & (
+                    (perturb < original) | (original < 0.8))
+                decrease = (conditions == self.strings.code("decrease")) & (
+                    perturb >= original)
+            self._fail = scored & (increase | decrease)
+        return self._fail
+
+    def summarize(self, start: int = 0, stop: Optional[int] = None, aborted: bool = False,
+                  test_id: Optional[str] = None) -> Dict[str, Any]:
+        """Summary of rows [start, stop), in TestSuite.summarize()'s format."""
+        fail = self.fail_mask()[start:stop]
+        total_tests = int(fail.size)
+        failures = int(fail.sum())
+        passes = total_tests - failures
+        summary: Dict[str, Any] = {
+            "total_tests": total_tests,
+            "failures": failures,
+            "passes": passes,
+            "pass_rate": (passes / total_tests) * 100 if total_tests > 0 else 0
+        }
+        if aborted:
+            summary["aborted"] = True
+        if test_id:
+            summary["test_id"] = test_id
+
+        test_types: Dict[Any, Dict[str, Any]] = {}
+        if total_tests:
+            codes, inverse = np.unique(
+                _ints(self._codes["test_type"])[start:stop], return_inverse=True)
+            totals = np.bincount(inverse)
+            type_failures = np.bincount(inverse, weights=fail)
+            for code, total, type_fails in zip(codes.tolist(), totals.tolist(), type_failures.tolist()):
+                type_fails = int(type_fails)
+                test_types[self.strings[code]] = {
+                    "total": total,
+                    "failures": type_fails,
+                    "passes": total - type_fails,
+                    "pass_rate": ((total - type_fails) / total) * 100
+                }
+        summary["by_test_type"] = test_types
+        return summary
+
+    def to_payload(self) -> Dict[str, Any]:
+        """
+        Plain-list form of the batch for storage and transport; decoded
+        page by page with core.result_pages.build_rows.
+        """
+        payload: Dict[str, Any] = {"strings": self.strings.values, "name": list(self.names)}
+        for field in INTERNED_FIELDS:
+            payload[field] = self._codes[field].tolist()
+        for field, scores in (("score_original", self.score_original), ("score_perturb", self.score_perturb)):
+            payload[field] = [None if math.isnan(s) else s for s in scores]
+        payload["fail"] = self.fail_mask().tolist()
+        return payload
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Result dicts for rows [start, stop), as Test.summarize() returns them."""
+        return build_rows(self.to_payload(), start, stop)
+
+    def score_records(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Just name, test_type and score_original per row, for score aggregation."""
+        if stop is None:
+            stop = len(self)
+        test_types = self._codes["test_type"]
+        return [
+            {
+                "name": self.names[pos],
+                "test_type": self.strings[test_types[pos]],
+                "score_original": None if math.isnan(self.score_original[pos]) else self.score_original[pos],
+            }
+            for pos in range(start, stop)
+        ]
@@ -1,19 +1,23 @@
 # api/PromptOps/test_suite.py
-import concurrent.futures
+import asyncio
 import logging
 import os
 import pickle
 import time
-import random
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 import pandas as pd
 import json
 
+from .async_engine import AsyncTestEngine, run_sync
+from .completion_memo import CompletionMemo
+from .embedding_cache import get_embedding_cache
+from .scoring import score_tests
+
 logger = logging.getLogger(__name__)
 
 
 class TestSuite:
-    def __init__(self, max_workers: int = 5, test_id: str = None):
+    def __init__(self, max_workers: Optional[int] = None, test_id: str = None):
         self.tests: List[Any] = []
         self.max_workers = max_workers
         self.test_id = test_id
@@ -25,111 +29,80 @@ class TestSuite:
             f"Added test: {test.name}. Total tests now: {len(self.tests)}")
 
     def add_tests(self, tests: List[Any]):
-        for test in tests:
-            self.add_test(test)
+        self.tests.extend(tests)
+        logger.debug(
+            f"Added {len(tests)} tests. Total tests now: {len(self.tests)}")
 
     def clear(self):
         logger.info(f"Clearing {len(self.tests)} tests from the suite.")
         self.tests = []
 
-    def run_all(self, completion_model: Any, abort_check_fn=None):
+    def run_all(self, completion_model: Any, abort_check_fn=None, memo: Optional[CompletionMemo] = None):
+        """
+        Blocking wrapper around arun_all for synchronous callers.
+        """
+        if not self.tests:
+            logger.warning("No tests to run in the suite.")
+            return
+        run_sync(self.arun_all(completion_model, abort_check_fn, memo=memo))
+
+    async def arun_all(self, completion_model: Any, abort_check_fn=None, engine: Optional[AsyncTestEngine] = None, memo: Optional[CompletionMemo] = None):
+        """
+        Run every test on the async engine, then score them in one batch.
+        Passing a job-wide memo lets several suites share original-prompt
+        completions.
+        """
         if not self.tests:
             logger.warning("No tests to run in the suite.")
             return
         start_time = time.time()
-        total_tests = len(self.tests)
-        completed_tests = 0
-
-        # We assume all tests use the same provider from completion_model.
-        provider = getattr(
-            completion_model, 'model_provider', 'default').lower()
-
-        logger.info(
-            f"Starting test suite with {total_tests} tests for provider: {provider}")
-
-        # Set concurrency based on provider
-        provider_concurrency = self.max_workers
-        if provider in ('openai', 'claude'):
-            provider_concurrency = min(3, self.max_workers)
-        elif provider in ('gemini', 'typhoon'):
-            provider_concurrency = min(4, self.max_workers)
-        logger.info(
-            f"Using concurrency level of {provider_concurrency} for provider {provider}")
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=provider_concurrency) as executor:
-            futures = {executor.submit(
-                test.run, completion_model): test for test in self.tests}
-            for future in concurrent.futures.as_completed(futures):
-                test = futures[future]
-                completed_tests += 1
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"Error executing test {test.name}: {str(e)}")
-                    test.error = str(e)
-                if abort_check_fn and abort_check_fn():
-                    logger.warning(
-                        f"Aborting test suite execution after {completed_tests}/{total_tests} tests")
-                    self.aborted = True
-                    for f in futures:
-                        if not f.done():
-                            f.cancel()
-                    break
-                if (completed_tests % 10 == 0) or (completed_tests == total_tests) or (completed_tests == 1):
-                    elapsed = time.time() - start_time
-                    avg_time = elapsed / completed_tests if completed_tests > 0 else 0
-                    remaining = (total_tests - completed_tests) * avg_time
-                    logger.info(
-                        f"Completed {completed_tests}/{total_tests} tests. Elapsed: {elapsed:.1f}s, Est. remaining: {remaining:.1f}s")
-                    if completed_tests % (provider_concurrency * 2) == 0:
-                        delay = random.uniform(0.5, 2.0)
-                        logger.debug(
-                            f"Adding small delay of {delay:.2f}s between batches")
-                        time.sleep(delay)
+        if engine is None:
+            engine = AsyncTestEngine(
+                completion_model,
+                max_in_flight=self.max_workers,
+                abort_check_fn=abort_check_fn,
+                memo=memo
+            )
+        completed_tests = await engine.run(self.tests)
+        self.aborted = engine.aborted
         if self.aborted:
             logger.warning("Test suite execution aborted.")
+
+        # Embedding is CPU-bound; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.score_all)
         duration = time.time() - start_time
         logger.info(
-            f"Test suite execution completed in {duration:.2f}s. Processed {completed_tests}/{total_tests} tests.")
+            f"Test suite execution completed in {duration:.2f}s. Processed {completed_tests}/{len(self.tests)} tests.")
+
+    def score_all(self, model: Any = None):
+        """
+        Score every completed test in one batched embedding pass.
+        """
+        cache = None
+        if model is None:
+            from .test import get_similarity_model, SIMILARITY_MODEL_NAME
+            model = get_similarity_model()
+            cache = get_embedding_cache(SIMILARITY_MODEL_NAME)
+        try:
+            score_tests(self.tests, model, cache=cache)
+        except Exception as e:
+            logger.error(f"Error scoring test suite: {str(e)}")
+
+    def to_batch(self):
+        """
+        Columnar copy of the suite's tests and results (see
+        PromptOps.test_batch.TestBatch).
+        """
+        from .test_batch import TestBatch
+        batch = TestBatch.from_tests(self.tests)
+        batch.aborted = self.aborted
+        return batch
 
     def summarize(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-        results = [test.summarize() for test in self.tests]
-        total_tests = len(results)
-        failures = sum(1 for r in results if r.get('fail', False))
-        passes = total_tests - failures
-        summary = {
-            "total_tests": total_tests,
-            "failures": failures,
-            "passes": passes,
-            "pass_rate": (passes / total_tests) * 100 if total_tests > 0 else 0
-        }
-        if self.aborted:
-            summary["aborted"] = True
-        if self.test_id:
-            summary["test_id"] = self.test_id
-
-        # Group results by test_type
-        test_types: Dict[str, Dict[str, Any]] = {}
-        for result in results:
-            test_type = result.get('test_type', 'unknown')
-            if test_type not in test_types:
-                test_types[test_type] = {
-                    "total": 0, "failures": 0, "passes": 0}
-            test_types[test_type]["total"] += 1
-            if result.get('fail', False):
-                test_types[test_type]["failures"] += 1
-            else:
-                test_types[test_type]["passes"] += 1
-
-        for t, counts in test_types.items():
-            if counts["total"] > 0:
-                counts["pass_rate"] = (
-                    counts["passes"] / counts["total"]) * 100
-            else:
-                counts["pass_rate"] = 0
-        summary["by_test_type"] = test_types
-
-        logger.info(f"Summarized test suite: {json.dumps(summary)}")
+        batch = self.to_batch()
+        results = batch.records()
+        summary = batch.summarize(aborted=self.aborted, test_id=self.test_id)
+        logger.info(f"Summarized test suite: {json.dumps(summary, default=str)}")
         return results, summary
 
     def export_results(self, filename: str, file_format: str = 'csv', overwrite: bool = False):
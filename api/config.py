@@ -1,7 +1,6 @@
 # api/config.py
 from environs import Env
 from pathlib import Path
-import api.utils.nltk_setup as _
 
 # point at your .env
 env_path = Path(__file__).parent / ".env"
@@ -21,6 +20,12 @@ class Settings:
 
     # Redis Configuration
     REDIS_URL = env.str("REDIS_URL", default="redis://localhost:6379")
+    # Shared connection pool of each process (see utils/redis_pool.py);
+    # callers wait up to REDIS_POOL_TIMEOUT seconds for a free connection
+    REDIS_MAX_CONNECTIONS = env.int("REDIS_MAX_CONNECTIONS", default=50)
+    REDIS_POOL_TIMEOUT = env.float("REDIS_POOL_TIMEOUT", default=10.0)
+    REDIS_SOCKET_TIMEOUT = env.float("REDIS_SOCKET_TIMEOUT", default=5.0)
+    REDIS_CONNECT_TIMEOUT = env.float("REDIS_CONNECT_TIMEOUT", default=2.0)
 
     # Celery Configuration
     CELERY_BROKER_URL = env.str(
@@ -35,6 +40,10 @@ class Settings:
                                      default=["json"])
     CELERY_TIMEZONE = env.str("CELERY_TIMEZONE", default="UTC")
     CELERY_ENABLE_UTC = env.bool("CELERY_ENABLE_UTC", default=True)
+    # Tasks are acked late, so the Redis broker hands an unacked task to
+    # another worker after this long; keep it above the longest job
+    CELERY_VISIBILITY_TIMEOUT = env.int(
+        "CELERY_VISIBILITY_TIMEOUT", default=43200)  # 12 hours
 
     # WebSocket Configuration
     WEBSOCKET_PORT = env.int("WEBSOCKET_PORT", default=3001)
@@ -43,9 +52,23 @@ class Settings:
     DEBUG = env.bool("DEBUG", default=False)
     ENVIRONMENT = env.str("ENVIRONMENT", default="development")
 
+    # Embedding models loaded when a Celery worker process starts
+    PRELOAD_EMBEDDING_MODELS = env.list("PRELOAD_EMBEDDING_MODELS",
+                                        subcast=str,
+                                        default=["all-distilroberta-v1"])
+
+    # Share RPM/TPM budgets (MODEL_RATE_LIMITS) across workers via Redis
+    RATE_LIMIT_ENABLED = env.bool("RATE_LIMIT_ENABLED", default=True)
+
     # Test Settings
     TEST_TIMEOUT = env.int("TEST_TIMEOUT", default=3600)  # 1 hour
     MAX_CONCURRENT_TESTS = env.int("MAX_CONCURRENT_TESTS", default=10)
+    # How long a job's checkpoint (plan, finished rows, config) is kept
+    # for resuming after a worker loss or an abort
+    CHECKPOINT_TTL_SECONDS = env.int("CHECKPOINT_TTL_SECONDS", default=86400)
+    # A RUNNING test can be resumed once no worker holds its run lock and
+    # its progress has not moved for this long
+    RESUME_STALE_SECONDS = env.int("RESUME_STALE_SECONDS", default=120)
 
     # Cleanup Settings
     TEST_RETENTION_HOURS = env.int("TEST_RETENTION_HOURS", default=24)
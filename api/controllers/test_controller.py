@@ -4,17 +4,23 @@ import json
 import logging
 import uuid
 import time
-from fastapi import APIRouter, UploadFile, Form, HTTPException, File, Depends, Header
-from typing import Dict, Any, Optional
+from fastapi import APIRouter, UploadFile, Form, HTTPException, File, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel, ValidationError
 
-from api.utils.crypto import decrypt_api_key, is_encrypted
+from api.config import Settings
+from api.utils.crypto import decrypt_api_key, encrypt_api_key, is_encrypted
+from ..core.result_pages import page_bounds
+from ..services import result_store
 from ..services.test_status_manager import test_status_manager, TestStatus
-from ..services.test_processor import TestConfig, process_test_task
+from ..services.status_stream import status_broadcaster
+from ..services.task_queue import TestConfig, enqueue_test
 from ..services.input_data_service import InputDataService
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+settings = Settings()
 
 
 async def get_current_user_id(
@@ -38,6 +44,7 @@ class CreateTestRequest(BaseModel):
     url: Optional[str] = None
     project_id: str
     project_type: str
+    fresh_completions: bool = False
 
 
 class TestController:
@@ -83,7 +90,14 @@ class TestController:
                 project_id=request.project_id,
                 project_type=request.project_type,
                 test_id=test_id,
-                file_path=file_path
+                file_path=file_path,
+                fresh_completions=request.fresh_completions
+            )
+            # Kept for resuming; the provider key is only ever stored encrypted
+            await self.status_manager.save_config(
+                test_id,
+                config.copy(update={"api_key": encrypt_api_key(api_key) if api_key else None}).json(),
+                settings.CHECKPOINT_TTL_SECONDS
             )
             # 5) Queue the Celery task
             await self.status_manager.update_status(
@@ -91,7 +105,7 @@ class TestController:
                 TestStatus.QUEUED,
                 progress="Test queued for processing"
             )
-            process_test_task.delay(config.json())
+            enqueue_test(config)
             logger.info(f"Test {test_id} queued successfully")
             return {
                 "test_id": test_id,
@@ -118,7 +132,65 @@ class TestController:
             }
         return test_info.to_dict()
 
-    async def get_test_results(self, test_id: str) -> Dict[str, Any]:
+    async def _page_results(
+        self, test_id: str, meta: Dict[str, Any], offset: int, limit: Optional[int],
+        robust_offset: int, robust_limit: Optional[int]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Expand only the requested page of tests into result dicts (a limit
+        of None means every remaining row), reading just the chunks they
+        are stored in.
+        """
+        robust_all = meta.get("robust_results", [])
+        r_begin, r_end = page_bounds(0, len(robust_all), robust_offset, robust_limit)
+        start, stop = meta.get("result_rows", [0, 0])
+        begin, end = page_bounds(start, stop, offset, limit)
+        positions = list(range(begin, end))
+        groups = []
+        for entry in robust_all[r_begin:r_end]:
+            entry = dict(entry)
+            g_start, g_stop = entry.pop("rows")
+            groups.append((entry, len(positions), len(positions) + g_stop - g_start))
+            positions.extend(range(g_start, g_stop))
+        rows = await self.status_manager.get_result_rows(test_id, meta, positions)
+        results = rows[:end - begin]
+        robust_page = []
+        for entry, first, last in groups:
+            entry["results"] = rows[first:last]
+            robust_page.append(entry)
+        pagination = {
+            "results": {"offset": offset, "limit": limit, "total": stop - start},
+            "robust_results": {"offset": robust_offset, "limit": robust_limit, "total": len(robust_all)},
+        }
+        return results, robust_page, pagination
+
+    async def get_test_progress(self, test_id: str) -> Dict[str, Any]:
+        test_info = await self.status_manager.get_test(test_id)
+        if not test_info:
+            raise HTTPException(status_code=404, detail="Test not found")
+        counters = await self.status_manager.get_progress(test_id)
+        return {
+            "test_id": test_id,
+            "status": test_info.status.value,
+            "progress": test_info.progress,
+            "counters": counters
+        }
+
+    async def get_partial_results(self, test_id: str, offset: int, limit: int) -> Dict[str, Any]:
+        test_info = await self.status_manager.get_test(test_id)
+        if not test_info:
+            raise HTTPException(status_code=404, detail="Test not found")
+        partial = await self.status_manager.get_partial_results(test_id, offset, limit)
+        return {"test_id": test_id, "status": test_info.status.value, **partial}
+
+    async def get_test_results(
+        self,
+        test_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        robust_offset: int = 0,
+        robust_limit: Optional[int] = None
+    ) -> Dict[str, Any]:
         # 1) Fetch stored test
         test_info = await self.status_manager.get_test(test_id)
         if not test_info:
@@ -129,41 +201,108 @@ class TestController:
                 status_code=400,
                 detail=f"Test results not available. Current status: {test_info.status.value}"
             )
-        raw = test_info.results or {}
+        raw = await self.status_manager.get_result_meta(test_id)
         # 3) Validate existence
-        if not raw.get("results") and not raw.get("robust_results"):
+        if not raw or not raw.get("total_rows"):
             raise HTTPException(status_code=500, detail="Results missing")
-        # 4) Ensure summary
-        results_list = raw.get("results", [])
-        total = len(results_list)
-        failures = sum(1 for r in results_list if r.get("fail"))
-        passes = total - failures
-        raw["summary"] = {
-            "total_tests": total,
-            "failures": failures,
-            "passes": passes,
-            "pass_rate": (passes / total * 100) if total > 0 else 0,
-        }
-        # 5) Wrap under one top-level `results`
+        # 4) Summary was computed when the results were stored
+        summary = raw["summaries"]["results"]
+        # 5) Build only the requested page of rows
+        results, robust_results, pagination = await self._page_results(
+            test_id, raw, offset, limit, robust_offset, robust_limit)
+        # 6) Wrap under one top-level `results`
         return {
             "results": {
-                "results":            raw.get("results", []),
-                "robust_results":     raw.get("robust_results", []),
-                "summary":            raw["summary"],
+                "results":            results,
+                "robust_results":     robust_results,
+                "summary":            summary,
                 "index_scores":       raw.get("index_scores", {}),
                 "overall_robust_score": raw.get("overall_robust_score"),
                 "overall_score":      raw.get("overall_score", {}),
                 "performance_score":  raw.get("performance_score", {}),
-                "error":              raw.get("error")
+                "error":              raw.get("error"),
+                "pagination":         pagination
             }
         }
 
+    async def _require_results(self, test_id: str) -> Dict[str, Any]:
+        test_info = await self.status_manager.get_test(test_id)
+        if not test_info:
+            raise HTTPException(status_code=404, detail="Test not found")
+        if not test_info.results_available:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Test results not available. Current status: {test_info.status.value}"
+            )
+        meta = await self.status_manager.get_result_meta(test_id)
+        if not meta:
+            raise HTTPException(status_code=410, detail="Test results have expired")
+        return meta
+
+    async def get_result_summary(self, test_id: str) -> Dict[str, Any]:
+        """
+        Scores and per-topic summaries, without any per-test rows.
+        result_rows and each robustness group's rows are [start, stop)
+        ranges of the row numbers /results/rows returns.
+        """
+        meta = await self._require_results(test_id)
+        return {
+            "test_id": test_id,
+            "total_rows": meta["total_rows"],
+            "result_rows": meta.get("result_rows", [0, 0]),
+            "summary": meta["summaries"]["results"],
+            "topics": meta["summaries"]["topics"],
+            "index_scores": meta.get("index_scores", {}),
+            "overall_robust_score": meta.get("overall_robust_score"),
+            "overall_score": meta.get("overall_score", {}),
+            "performance_score": meta.get("performance_score", {}),
+            "robust_results": meta.get("robust_results", []),
+            "error": meta.get("error"),
+        }
+
+    async def get_result_rows(
+        self,
+        test_id: str,
+        offset: int,
+        limit: int,
+        topic: Optional[str] = None,
+        outcome: Optional[str] = None,
+        score_field: str = "score_perturb",
+        min_score: Optional[float] = None,
+        max_score: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """One page of tests matching the filters, each with its row number and topic."""
+        if outcome is not None and outcome not in result_store.OUTCOMES:
+            raise HTTPException(status_code=400, detail=f"outcome must be one of {result_store.OUTCOMES}")
+        if score_field not in result_store.SCORE_FIELDS:
+            raise HTTPException(status_code=400, detail=f"score_field must be one of {result_store.SCORE_FIELDS}")
+        meta = await self._require_results(test_id)
+        index = await self.status_manager.get_result_index(test_id)
+        matches = result_store.select(
+            index, topic, outcome, score_field, min_score, max_score)
+        page = matches[offset:offset + limit]
+        rows = await self.status_manager.get_result_rows(test_id, meta, page)
+        for pos, row in zip(page, rows):
+            row["row"] = pos
+            row["topic"] = index["topics"][index["topic"][pos]]
+        return {
+            "test_id": test_id,
+            "rows": rows,
+            "offset": offset,
+            "limit": limit,
+            "total": len(matches),
+            "summary": meta["summaries"]["topics"].get(topic) if topic else meta["summaries"]["results"],
+        }
+
     async def abort_test(self, test_id: str) -> Dict[str, Any]:
         test_info = await self.status_manager.get_test(test_id)
         if not test_info:
             return {"status": "warning", "message": f"Test {test_id} not found"}
         if test_info.status in [TestStatus.COMPLETED, TestStatus.ERROR, TestStatus.ABORTED]:
             return {"status": "warning", "message": f"Test {test_id} already finished"}
+        # The worker sees the flag within about a second and cancels
+        # queued and in-flight calls
+        await self.status_manager.request_abort(test_id)
         await self.status_manager.update_status(
             test_id,
             TestStatus.ABORTED,
@@ -172,6 +311,44 @@ class TestController:
         return {"status": "success", "message": f"Test {test_id} aborted successfully"}
 
 
+    async def resume_test(self, test_id: str) -> Dict[str, Any]:
+        """
+        Queue an interrupted test again. The worker continues from the
+        job's checkpoint, so tests that already have a response are not
+        sent to the model again.
+        """
+        test_info = await self.status_manager.get_test(test_id)
+        if not test_info:
+            raise HTTPException(status_code=404, detail="Test not found")
+        if test_info.status in (TestStatus.QUEUED, TestStatus.COMPLETED):
+            return {"status": "warning", "message": f"Test {test_id} is {test_info.status.value}; nothing to resume"}
+        # A worker that was killed or redeployed leaves its test RUNNING;
+        # only a test no worker is running any more can be resumed
+        if test_info.status == TestStatus.RUNNING and await self.status_manager.worker_alive(
+                test_id, settings.RESUME_STALE_SECONDS):
+            return {"status": "warning", "message": f"Test {test_id} is still running; nothing to resume"}
+        config_json = await self.status_manager.get_config(test_id)
+        if not config_json:
+            raise HTTPException(
+                status_code=410, detail=f"Test {test_id} can no longer be resumed")
+        config = TestConfig.parse_raw(config_json)
+        if config.api_key and is_encrypted(config.api_key):
+            config.api_key = decrypt_api_key(config.api_key)
+        await self.status_manager.clear_abort(test_id)
+        await self.status_manager.update_status(
+            test_id,
+            TestStatus.QUEUED,
+            progress="Test queued for resume"
+        )
+        enqueue_test(config)
+        logger.info(f"Test {test_id} queued for resume")
+        return {
+            "test_id": test_id,
+            "status": "queued",
+            "message": "Test queued to resume from its checkpoint."
+        }
+
+
 test_controller = TestController()
 
 
@@ -190,6 +367,7 @@ async def create_test(
     url: Optional[str] = Form(None),
     project_id: str = Form(...),
     project_type: str = Form(...),
+    fresh_completions: bool = Form(False),
     user_id: str = Depends(get_current_user_id)
 ):
     try:
@@ -207,7 +385,8 @@ async def create_test(
             api_key=api_key,
             url=url,
             project_id=project_id,
-            project_type=project_type
+            project_type=project_type,
+            fresh_completions=fresh_completions
         )
         return await test_controller.create_test(file, blocks, request, user_id)
     except json.JSONDecodeError as e:
@@ -221,9 +400,74 @@ async def get_test_status(test_id: str):
     return await test_controller.get_test_status(test_id)
 
 
+@router.get("/tests/{test_id}/events")
+async def stream_test_status(test_id: str):
+    """
+    Server-sent events for one test: a "snapshot" of its status, then
+    "update" events carrying only the fields that changed, until it
+    completes, fails or is aborted. Replaces polling /status.
+    """
+    return StreamingResponse(
+        status_broadcaster.stream(test_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/tests/{test_id}/progress")
+async def get_test_progress(test_id: str):
+    return await test_controller.get_test_progress(test_id)
+
+
+@router.get("/tests/{test_id}/partial-results")
+async def get_partial_results(
+    test_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=1000)
+):
+    return await test_controller.get_partial_results(test_id, offset, limit)
+
+
 @router.get("/tests/{test_id}/results")
-async def get_test_results(test_id: str):
-    return await test_controller.get_test_results(test_id)
+async def get_test_results(
+    test_id: str,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=0),
+    robust_offset: int = Query(0, ge=0),
+    robust_limit: Optional[int] = Query(None, ge=0)
+):
+    return await test_controller.get_test_results(
+        test_id, offset, limit, robust_offset, robust_limit)
+
+
+@router.get("/tests/{test_id}/results/summary")
+async def get_result_summary(test_id: str):
+    return await test_controller.get_result_summary(test_id)
+
+
+@router.get("/tests/{test_id}/results/rows")
+async def get_result_rows(
+    test_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=1000),
+    topic: Optional[str] = Query(None),
+    outcome: Optional[str] = Query(None, description="pass or fail"),
+    score_field: str = Query("score_perturb"),
+    min_score: Optional[float] = Query(None),
+    max_score: Optional[float] = Query(None)
+):
+    """
+    Paginated per-test results, filtered by topic ("robustness" for
+    robustness tests), outcome and a score range. Only the compressed
+    chunks holding the returned page are read.
+    """
+    return await test_controller.get_result_rows(
+        test_id, offset, limit, topic, outcome, score_field, min_score, max_score)
+
+
+@router.post("/tests/{test_id}/resume")
+async def resume_test(test_id: str):
+    return await test_controller.resume_test(test_id)
 
 
 @router.post("/tests/{test_id}/abort")
@@ -2,7 +2,6 @@
 
 import logging
 import pandas as pd
-import json
 from typing import Any, Dict, List, Tuple, Optional
 
 from ..utils.csv_helpers import read_csv_safely, save_to_temp_csv
@@ -12,28 +11,103 @@ from ..utils.abort_handler import abort_handler, check_abort
 from ..services.perturbation_service import PerturbationService
 from ..services.formatter_service import FormatterService
 from ..services.test_executor import TestExecutor
+from ..services.job_checkpoint import JobCheckpoint
+from ..PromptOps.completion_memo import CompletionMemo
+from .scores import process_score, calculate_performance_score  # noqa: F401  (re-exported)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-def process_test_robust(
+def prepare_robust_tests(
     file_path: str,
     shot_type: str,
     template: str,
     num: int,
-    completion: Any = None,
     test_id: Optional[str] = None,
     project_type: str = 'qa'
-) -> Dict[str, Any]:
+) -> Optional[pd.DataFrame]:
     """
-    Process test data with robust perturbations and support for abortion.
+    Build the robust test rows without running them.
     Steps:
       1. Read CSV
       2. Apply robust perturbations
       3. Merge extra columns
       4. Format prompts
-      5. Execute tests
+    Returns the formatted rows, or None if the test was aborted.
+    """
+    # 1) Read input CSV
+    df = read_csv_safely(file_path)
+    logger.info(f"Successfully read file with {len(df)} rows")
+    if test_id:
+        abort_handler.set_progress(test_id, "CSV file read")
+    if test_id and check_abort(test_id):
+        logger.info(f"Test {test_id} aborted after reading file")
+        return None
+
+    # 2) Apply robust perturbations
+    perturb_service = PerturbationService()
+    perturbed_df = perturb_service.apply_robust(df, num)
+    logger.info(
+        f"Perturbations applied; generated {len(perturbed_df)} rows")
+    if test_id:
+        abort_handler.set_progress(test_id, "Perturbations applied")
+    if test_id and check_abort(test_id):
+        logger.info(f"Test {test_id} aborted after perturbation")
+        return None
+
+    # 3) Merge original columns back
+    extras = df.drop(
+        columns=["Question", "Expected_answer"], errors="ignore")
+    merged = perturbed_df.merge(
+        extras,
+        left_on="Original_Question_Index",
+        right_index=True,
+        how="left"
+    )
+    output_merged = "merged_perturbation_results.csv"
+    merged.to_csv(output_merged, index=False)
+    logger.info("Merged results CSV saved.")
+    if test_id:
+        abort_handler.set_progress(test_id, "Merged CSV saved")
+    if test_id and check_abort(test_id):
+        logger.info(f"Test {test_id} aborted after merging")
+        return None
+
+    # 4) Format prompts using FormatterService
+    fmt = FormatterService(output_merged, template, project_type=project_type)
+    formatted = fmt.format_all(shot_type=shot_type, perturb_type="robust")
+    logger.info("Formatted robust data via FormatterService.")
+    if test_id:
+        abort_handler.set_progress(test_id, "Data formatted")
+    if test_id and check_abort(test_id):
+        logger.info(f"Test {test_id} aborted after formatting")
+        return None
+
+    # Persist prompts CSV
+    prompts_csv = "robust_new_formatted_one_shot.csv"
+    fmt.save_csv(formatted, prompts_csv)
+
+    # Convert to DataFrame for execution
+    robust_df = pd.DataFrame(formatted)
+    logger.info(
+        f"Ready to execute robust tests; columns: {list(robust_df.columns)}")
+    return robust_df
+
+
+def process_test_robust(
+    file_path: str,
+    shot_type: str,
+    template: str,
+    num: int,
+    completion: Any = None,
+    test_id: Optional[str] = None,
+    project_type: str = 'qa',
+    memo: Optional[CompletionMemo] = None
+) -> Dict[str, Any]:
+    """
+    Process test data with robust perturbations and support for abortion:
+    prepare the robust rows, then execute them.
     """
     try:
         # Register for abort notifications
@@ -44,66 +118,14 @@ def process_test_robust(
         if completion is None:
             completion = create_completion()
 
-        # 1) Read input CSV
-        df = read_csv_safely(file_path)
-        logger.info(f"Successfully read file with {len(df)} rows")
-        if test_id:
-            abort_handler.active_tests[test_id]["progress"] = "CSV file read"
-        if test_id and check_abort(test_id):
-            logger.info(f"Test {test_id} aborted after reading file")
+        robust_df = prepare_robust_tests(
+            file_path, shot_type, template, num, test_id, project_type)
+        if robust_df is None:
             return {"index_scores": {}, "robust_results": [], "aborted": True}
 
-        # 2) Apply robust perturbations
-        perturb_service = PerturbationService()
-        perturbed_df = perturb_service.apply_robust(df, num)
-        logger.info(
-            f"Perturbations applied; generated {len(perturbed_df)} rows")
-        if test_id:
-            abort_handler.active_tests[test_id]["progress"] = "Perturbations applied"
-        if test_id and check_abort(test_id):
-            logger.info(f"Test {test_id} aborted after perturbation")
-            return {"index_scores": {}, "robust_results": [], "aborted": True}
-
-        # 3) Merge original columns back
-        extras = df.drop(
-            columns=["Question", "Expected_answer"], errors="ignore")
-        merged = perturbed_df.merge(
-            extras,
-            left_on="Original_Question_Index",
-            right_index=True,
-            how="left"
-        )
-        output_merged = "merged_perturbation_results.csv"
-        merged.to_csv(output_merged, index=False)
-        logger.info("Merged results CSV saved.")
-        if test_id:
-            abort_handler.active_tests[test_id]["progress"] = "Merged CSV saved"
-        if test_id and check_abort(test_id):
-            logger.info(f"Test {test_id} aborted after merging")
-            return {"index_scores": {}, "robust_results": [], "aborted": True}
-
-        # 4) Format prompts using FormatterService
-        fmt = FormatterService(output_merged, template, project_type=project_type)
-        formatted = fmt.format_all(shot_type=shot_type, perturb_type="robust")
-        logger.info("Formatted robust data via FormatterService.")
-        if test_id:
-            abort_handler.active_tests[test_id]["progress"] = "Data formatted"
-        if test_id and check_abort(test_id):
-            logger.info(f"Test {test_id} aborted after formatting")
-            return {"index_scores": {}, "robust_results": [], "aborted": True}
-
-        # Persist prompts CSV
-        prompts_csv = "robust_new_formatted_one_shot.csv"
-        fmt.save_csv(formatted, prompts_csv)
-
-        # Convert to DataFrame for execution
-        robust_df = pd.DataFrame(formatted)
-        logger.info(
-            f"Ready to execute robust tests; columns: {list(robust_df.columns)}")
-
         # 5) Execute tests via TestExecutor
         executor = TestExecutor(
-            completion_model=completion, test_id=test_id, max_workers=5)
+            completion_model=completion, test_id=test_id, memo=memo)
         return executor.run_robust(robust_df)
 
     except Exception as e:
@@ -113,21 +135,66 @@ def process_test_robust(
         return {"index_scores": {}, "robust_results": [], "error": str(e)}
 
 
-def process_test(
+def prepare_basic_tests(
     file_path: str,
     shot_type: str,
     template: str,
     perturbation_types: List[str],
-    completion: Any = None,
     test_id: Optional[str] = None,
     project_type: str = 'qa'
-) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+) -> Optional[List[Tuple[str, str]]]:
     """
-    Process non-robust tests:
+    Build the non-robust test inputs without running them.
+    Steps:
       1. Read CSV
       2. Save clean CSV
       3. Format prompts for each perturbation
-      4. Execute tests
+    Returns [(perturb_type, formatted_csv)], or None if the test was aborted.
+    """
+    # 1) Read input CSV
+    df = read_csv_safely(file_path)
+    logger.info(f"Successfully read file with {len(df)} rows")
+    if test_id and check_abort(test_id):
+        logger.info(f"Test {test_id} aborted after reading file")
+        return None
+
+    # 2) Save a standardized CSV
+    temp_csv = save_to_temp_csv(df, prefix="input_data_", suffix=".csv")
+    logger.info(f"Saved clean CSV to: {temp_csv}")
+    if test_id and check_abort(test_id):
+        logger.info(f"Test {test_id} aborted after saving CSV")
+        return None
+
+    # 3) Format prompts for each perturbation
+    fmt = FormatterService(temp_csv, template, project_type=project_type)
+    csv_files: List[Tuple[str, str]] = []
+    for pt in perturbation_types:
+        if test_id:
+            abort_handler.set_progress(test_id, f"Formatting data for {pt}")
+        formatted = fmt.format_all(shot_type=shot_type, perturb_type=pt)
+        if test_id and check_abort(test_id):
+            logger.info(
+                f"Test {test_id} aborted during formatting for {pt}")
+            return None
+        out_csv = f"formatted_{pt}_output.csv"
+        fmt.save_csv(formatted, out_csv)
+        csv_files.append((pt, out_csv))
+    return csv_files
+
+
+def process_test(
+    file_path: str,
+    shot_type: str,
+    template: str,
+    perturbation_types: List[str],
+    completion: Any = None,
+    test_id: Optional[str] = None,
+    project_type: str = 'qa',
+    memo: Optional[CompletionMemo] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Process non-robust tests: prepare the formatted prompts for each
+    perturbation, then execute them.
     Returns: (results_list, summary_dict)
     """
     try:
@@ -136,39 +203,14 @@ def process_test(
         if completion is None:
             completion = create_completion()
 
-        # 1) Read input CSV
-        df = read_csv_safely(file_path)
-        logger.info(f"Successfully read file with {len(df)} rows")
-        if test_id and check_abort(test_id):
-            logger.info(f"Test {test_id} aborted after reading file")
+        csv_files = prepare_basic_tests(
+            file_path, shot_type, template, perturbation_types, test_id, project_type)
+        if csv_files is None:
             return [], {"aborted": True}
 
-        # 2) Save a standardized CSV
-        temp_csv = save_to_temp_csv(df, prefix="input_data_", suffix=".csv")
-        logger.info(f"Saved clean CSV to: {temp_csv}")
-        if test_id and check_abort(test_id):
-            logger.info(f"Test {test_id} aborted after saving CSV")
-            return [], {"aborted": True}
-
-        # 3) Format prompts for each perturbation
-        fmt = FormatterService(temp_csv, template, project_type=project_type)
-        csv_files: List[Tuple[str, str]] = []
-        for pt in perturbation_types:
-            if test_id:
-                abort_handler.active_tests[test_id][
-                    "progress"] = f"Formatting data for {pt}"
-            formatted = fmt.format_all(shot_type=shot_type, perturb_type=pt)
-            if test_id and check_abort(test_id):
-                logger.info(
-                    f"Test {test_id} aborted during formatting for {pt}")
-                return [], {"aborted": True}
-            out_csv = f"formatted_{pt}_output.csv"
-            fmt.save_csv(formatted, out_csv)
-            csv_files.append((pt, out_csv))
-
         # 4) Execute tests via TestExecutor
         executor = TestExecutor(
-            completion_model=completion, test_id=test_id, max_workers=5)
+            completion_model=completion, test_id=test_id, memo=memo)
         return executor.run_basic(csv_files)
 
     except Exception as e:
@@ -178,107 +220,59 @@ def process_test(
         return [], {"error": str(e), "total_tests": 0, "failures": 0, "passes": 0}
 
 
-def process_score(index_scores=None, summary=None):
+def process_job(
+    file_path: str,
+    shot_type: str,
+    template: str,
+    perturbation_types: List[str],
+    robust_percentage: Optional[int] = None,
+    completion: Any = None,
+    test_id: Optional[str] = None,
+    project_type: str = 'qa',
+    memo: Optional[CompletionMemo] = None
+) -> Dict[str, Any]:
+    """
+    Prepare every topic (and robustness, when robust_percentage is set)
+    first, then run all of their tests in one scheduler pass so the whole
+    job shares one concurrency and rate budget. The job is checkpointed
+    under its test_id; if a checkpoint already exists (the task was
+    redelivered or resumed) it continues from there instead.
+    Returns {"batch", "result_rows", "summary", "index_scores",
+    "robust_results"} (see TestExecutor.run_job).
     """
-    Process test scores and calculate overall metrics.
+    empty = {"batch": None, "result_rows": [0, 0], "summary": {},
+             "index_scores": {}, "robust_results": []}
+    try:
+        if test_id and test_id not in abort_handler.active_tests:
+            abort_handler.register_test(test_id)
+        if completion is None:
+            completion = create_completion()
 
-    Args:
-        index_scores (dict): Dictionary of index scores from robust tests
-        summary (dict): Summary from non-robust tests
+        executor = TestExecutor(
+            completion_model=completion, test_id=test_id, memo=memo)
+        checkpoint = JobCheckpoint(test_id) if test_id else None
+        saved_plan = checkpoint.load_plan() if checkpoint else None
+        if saved_plan is not None:
+            return executor.resume_job(saved_plan, checkpoint)
 
-    Returns:
-        str: JSON string with overall score metrics
-    """
-    if summary is None:
-        summary = {'total_tests': 0, 'failures': 0}
-
-    overall_total_tests = 0
-    overall_failures = 0
-    threshold = 0.7
-    if index_scores is None:
-        index_scores = {}
-
-    for index, score in index_scores.items():
-        overall_total_tests += 1
-        if score < threshold * 100:
-            overall_failures += 1
-
-    overall_total_tests += summary.get('total_tests', 0)
-    overall_failures += summary.get('failures', 0)
-    overall_pass = overall_total_tests - overall_failures
-    overall_failure_rate = (
-        overall_failures / overall_total_tests) * 100 if overall_total_tests > 0 else 0
-    overall_pass_rate = (overall_pass / overall_total_tests) * \
-        100 if overall_total_tests > 0 else 0
-
-    result = {
-        "overall_total_tests": overall_total_tests,
-        "overall_failures": overall_failures,
-        "overall_failure_rate": overall_failure_rate,
-        "overall_pass": overall_pass,
-        "overall_pass_rate": overall_pass_rate
-    }
-
-    if summary.get('aborted'):
-        result['aborted'] = True
-
-    return json.dumps(result, indent=4)
-
-
-def calculate_performance_score(detailed_scores=None, results=None):
-    """
-    Calculate performance scores for all perturbation types.
+        csv_files: List[Tuple[str, str]] = []
+        if perturbation_types:
+            csv_files = prepare_basic_tests(
+                file_path, shot_type, template, perturbation_types, test_id, project_type)
+            if csv_files is None:
+                return {**empty, "aborted": True}
 
-    Args:
-        detailed_scores: List of robust test results
-        results: List of non-robust test results
+        robust_df = None
+        if robust_percentage is not None:
+            robust_df = prepare_robust_tests(
+                file_path, shot_type, template, robust_percentage, test_id, project_type)
+            if robust_df is None:
+                return {**empty, "aborted": True}
 
-    Returns:
-        str: JSON string with performance scores
-    """
-    if detailed_scores is None:
-        detailed_scores = []
-    if results is None:
-        results = []
-
-    detailed_scores_values = []
-    for score in detailed_scores:
-        for result in score.get('results', []):
-            detailed_scores_values.append(result.get('score_original', 0))
-
-    all_scores = detailed_scores_values + \
-        [result.get('score_original', 0) for result in results]
-    if not all_scores:
-        overall_performance_score = 0
-    else:
-        overall_performance_score = sum(all_scores) / len(all_scores)
-
-    perturbation_scores = {}
-    for result in results:
-        test_type = result.get('test_type') or result.get(
-            'name', '').split("#")[0].strip().lower()
-        if test_type not in perturbation_scores:
-            perturbation_scores[test_type] = []
-        perturbation_scores[test_type].append(result.get('score_original', 0))
-
-    if detailed_scores:
-        if 'robust' not in perturbation_scores:
-            perturbation_scores['robust'] = []
-        for detailed_score in detailed_scores:
-            perturbation_scores['robust'].append(
-                detailed_score.get('score', 0))
-
-    perturbation_averages = {}
-    for perturbation, scores in perturbation_scores.items():
-        if scores:
-            perturbation_averages[perturbation] = sum(scores) / len(scores)
-        else:
-            perturbation_averages[perturbation] = 0
-
-    result_data = {
-        "overall_performance_score": overall_performance_score,
-        **perturbation_averages,
-    }
-
-    logging.info(f"calculate_performance_score result: {result_data}")
-    return json.dumps(result_data, indent=4)
+        return executor.run_job(csv_files, robust_df, checkpoint=checkpoint)
+
+    except Exception as e:
+        logger.error(f"Error in process_job: {e}", exc_info=True)
+        if test_id:
+            abort_handler.complete_test(test_id)
+        return {**empty, "error": str(e)}
@@ -0,0 +1,75 @@
+# File: api/core/result_pages.py
+"""
+Row access for stored test results.
+
+Workers store a job's tests as one columnar payload (see
+PromptOps.test_batch.TestBatch.to_payload): every distinct prompt,
+context, answer and response is stored once in "strings", and the text
+columns hold indexes into it (-1 for None). Row dicts are only built
+here, for the page a client asked for. Kept free of numpy/pandas so the
+web tier can serve pages without the worker stack.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# Columns holding indexes into payload["strings"]
+INTERNED_FIELDS = (
+    "description",
+    "test_type",
+    "pass_condition",
+    "prompt",
+    "expected_result",
+    "perturb_text",
+    "response_original",
+    "response_perturb",
+    "error",
+)
+# Columns holding plain values
+VALUE_FIELDS = ("name", "score_original", "score_perturb", "fail")
+
+
+def payload_length(payload: Dict[str, Any]) -> int:
+    return len(payload.get("name", []))
+
+
+def page_bounds(start: int, stop: int, offset: int, limit: Optional[int]) -> Tuple[int, int]:
+    """Absolute [begin, end) of one page inside the row range [start, stop)."""
+    begin = min(stop, start + max(0, offset))
+    end = stop if limit is None else min(stop, begin + max(0, limit))
+    return begin, end
+
+
+def build_rows(payload: Dict[str, Any], start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Per-test result dicts for rows [start, stop), in the same shape
+    Test.summarize() produces.
+    """
+    if stop is None:
+        stop = payload_length(payload)
+    strings = payload["strings"]
+
+    def text(field: str, i: int) -> Any:
+        code = payload[field][i]
+        return None if code < 0 else strings[code]
+
+    rows = []
+    for i in range(start, stop):
+        row = {
+            'name': payload["name"][i],
+            'description': text("description", i),
+            'test_type': text("test_type", i),
+            'prompt': text("prompt", i),
+            'expected_result': text("expected_result", i),
+            'perturb_text': text("perturb_text", i),
+            'pass_condition': text("pass_condition", i),
+            'response_original': text("response_original", i),
+            'response_perturb': text("response_perturb", i),
+            'score_original': payload["score_original"][i],
+            'score_perturb': payload["score_perturb"][i],
+            'fail': payload["fail"][i]
+        }
+        error = text("error", i)
+        if error:
+            row['error'] = error
+        rows.append(row)
+    return rows
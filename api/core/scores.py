@@ -0,0 +1,115 @@
+# File: api/core/scores.py
+"""
+Pure score aggregation helpers. Kept free of pandas/litellm/PromptOps
+imports so the web tier can aggregate results without loading the
+test-execution stack.
+"""
+
+import json
+import logging
+
+
+def process_score(index_scores=None, summary=None):
+    """
+    Process test scores and calculate overall metrics.
+
+    Args:
+        index_scores (dict): Dictionary of index scores from robust tests
+        summary (dict): Summary from non-robust tests
+
+    Returns:
+        str: JSON string with overall score metrics
+    """
+    if summary is None:
+        summary = {'total_tests': 0, 'failures': 0}
+
+    overall_total_tests = 0
+    overall_failures = 0
+    threshold = 0.7
+    if index_scores is None:
+        index_scores = {}
+
+    for index, score in index_scores.items():
+        overall_total_tests += 1
+        if score < threshold * 100:
+            overall_failures += 1
+
+    overall_total_tests += summary.get('total_tests', 0)
+    overall_failures += summary.get('failures', 0)
+    overall_pass = overall_total_tests - overall_failures
+    overall_failure_rate = (
+        overall_failures / overall_total_tests) * 100 if overall_total_tests > 0 else 0
+    overall_pass_rate = (overall_pass / overall_total_tests) * \
+        100 if overall_total_tests > 0 else 0
+
+    result = {
+        "overall_total_tests": overall_total_tests,
+        "overall_failures": overall_failures,
+        "overall_failure_rate": overall_failure_rate,
+        "overall_pass": overall_pass,
+        "overall_pass_rate": overall_pass_rate
+    }
+
+    if summary.get('aborted'):
+        result['aborted'] = True
+
+    return json.dumps(result, indent=4)
+
+
+def calculate_performance_score(detailed_scores=None, results=None):
+    """
+    Calculate performance scores for all perturbation types.
+
+    Args:
+        detailed_scores: List of robust test results
+        results: List of non-robust test results
+
+    Returns:
+        str: JSON string with performance scores
+    """
+    if detailed_scores is None:
+        detailed_scores = []
+    if results is None:
+        results = []
+
+    detailed_scores_values = []
+    for score in detailed_scores:
+        for result in score.get('results', []):
+            detailed_scores_values.append(result.get('score_original', 0))
+
+    all_scores = detailed_scores_values + \
+        [result.get('score_original', 0) for result in results]
+    if not all_scores:
+        overall_performance_score = 0
+    else:
+        overall_performance_score = sum(all_scores) / len(all_scores)
+
+    perturbation_scores = {}
+    for result in results:
+        test_type = result.get('test_type') or result.get(
+            'name', '').split("#")[0].strip().lower()
+        if test_type not in perturbation_scores:
+            perturbation_scores[test_type] = []
+        perturbation_scores[test_type].append(result.get('score_original', 0))
+
+    if detailed_scores:
+        if 'robust' not in perturbation_scores:
+            perturbation_scores['robust'] = []
+        for detailed_score in detailed_scores:
+            perturbation_scores['robust'].append(
+                detailed_score.get('score', 0))
+
+    perturbation_averages = {}
+    for perturbation, scores in perturbation_scores.items():
+        if scores:
+            perturbation_averages[perturbation] = sum(scores) / len(scores)
+        else:
+            perturbation_averages[perturbation] = 0
+
+    result_data = {
+        "overall_performance_score": overall_performance_score,
+        **perturbation_averages,
+    }
+
+    logging.info(f"calculate_performance_score result: {result_data}")
+    return json.dumps(result_data, indent=4)
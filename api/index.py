@@ -1,3 +1,6 @@
+from .utils import startup_report
+startup_report.mark_import_start()
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -6,13 +9,15 @@ from starlette.requests import Request
 from starlette.responses import RedirectResponse
 import logging
 import os
-import redis
 from contextlib import asynccontextmanager
 
 from .config import Settings
+from .utils.redis_pool import redis_pools
+from .services.test_status_manager import test_status_manager
 from .controllers.test_controller import router as test_router
 from .routers import calculate_scores, applicability
-import api.utils.nltk_setup as _  # ensure NLTK is initialized
+
+startup_report.mark_import_end()
 
 # Prevent parallelism warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -48,23 +53,25 @@ async def get_api_key(api_key_header: str = Depends(api_key_header)):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up API service...")
-    # Initialize Redis connection
-    redis_url = settings.REDIS_URL or "redis://redis:6379/0"
+    startup_report.log_report()
+    # One Redis pool for the whole process, shared by every endpoint
     try:
-        redis_client = redis.from_url(redis_url, decode_responses=True)
-        redis_client.ping()
-        logger.info(f"Redis connection established at {redis_url}")
+        await redis_pools.startup()
     except Exception as e:
-        logger.error(f"Failed to connect to Redis at {redis_url}: {e}")
+        logger.error(f"Failed to connect to Redis at {settings.REDIS_URL}: {e}")
+    # Status messages keep this process's cache of status reads current
+    await test_status_manager.start_listener()
 
     yield
 
     # Shutdown
     logger.info("Shutting down API service...")
+    logger.info(f"Redis pool stats: {redis_pools.stats()}")
+    await test_status_manager.stop_listener()
     try:
-        redis_client.close()
+        await redis_pools.shutdown()
     except Exception as e:
-        logger.error(f"Error closing Redis connection: {e}")
+        logger.error(f"Error closing Redis connections: {e}")
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -119,18 +126,23 @@ app.include_router(
 @app.get("/health", tags=["health"])
 async def health_check():
     try:
-        redis_client = redis.from_url(
-            settings.REDIS_URL or "redis://redis:6379/0")
-        redis_client.ping()
+        await redis_pools.async_client().ping()
         redis_status = "healthy"
     except Exception as e:
         redis_status = f"unhealthy: {e}"
     return {
         "status": "healthy",
         "message": "API is running",
-        "components": {"redis": redis_status}
+        "components": {"redis": redis_status},
+        "redis_pool": redis_pools.stats()
     }
 
+
+@app.get("/health/startup", tags=["health"])
+async def startup_health():
+    """Import time, RSS and any worker-only modules loaded in this process."""
+    return startup_report.build_report()
+
 # Root endpoint (requires auth)
 
 
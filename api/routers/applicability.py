@@ -2,28 +2,33 @@ import json
 import tempfile
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
-import pandas as pd
-
-from ..core.applicability_logic import (
-    taxonomy, ner, temporal, negation, coreference, srl, logic, vocab, fairness, robustness, check_applicability
-)
 
 router = APIRouter()
 
-perturbation_function_map = {
-    "Taxonomy": taxonomy,
-    "NER": ner,
-    "Temporal": temporal,
-    "Negation": negation,
-    "Coreference": coreference,
-    "SRL": srl,
-    "Logic": logic,
-    "Vocabulary": vocab,
-    "Fairness": fairness,
-    "Robustness": robustness
+PERTURBATION_FUNCTION_NAMES = {
+    "Taxonomy": "taxonomy",
+    "NER": "ner",
+    "Temporal": "temporal",
+    "Negation": "negation",
+    "Coreference": "coreference",
+    "SRL": "srl",
+    "Logic": "logic",
+    "Vocabulary": "vocab",
+    "Fairness": "fairness",
+    "Robustness": "robustness"
 }
 
 
+def _applicability_logic():
+    """
+    Import spaCy/NLTK-backed applicability checks on first use, so they
+    are not loaded into every web process at startup.
+    """
+    import api.utils.nltk_setup as _  # ensure NLTK is initialized
+    from ..core import applicability_logic
+    return applicability_logic
+
+
 @router.post("/applicability")
 async def process_applicability(request: Request):
     try:
@@ -50,12 +55,14 @@ async def process_applicability(request: Request):
                 detail=f"CSV content or file name missing. Received fields: {list(payload.keys())}"
             )
 
+        applicability_logic = _applicability_logic()
         functions_to_use = []
         # print(f"Functions to use: {[f.__name__ for f in functions_to_use]}")
         # print(f"Perturbation names received: {perturbation_names}")
         for name in perturbation_names:
             # Convert name to lowercase to match dictionary keys
-            func = perturbation_function_map.get(name)
+            func_name = PERTURBATION_FUNCTION_NAMES.get(name)
+            func = getattr(applicability_logic, func_name) if func_name else None
             if not func:
                 print(f"Unknown perturbation: {name}")
                 raise HTTPException(
@@ -66,8 +73,10 @@ async def process_applicability(request: Request):
             tmp.write(csv_content)
             tmp_path = tmp.name
 
-        result_json_str = check_applicability(tmp_path, functions_to_use)
+        result_json_str = applicability_logic.check_applicability(
+            tmp_path, functions_to_use)
         try:
+            import pandas as pd
             df = pd.read_csv(tmp_path)
             # print(f"CSV columns: {df.columns.tolist()}")
             # print(f"CSV row count: {len(df)}")
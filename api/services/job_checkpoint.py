@@ -0,0 +1,230 @@
+# File: api/services/job_checkpoint.py
+"""
+Checkpoints for long test runs.
+
+A job's plan (the prepared TestBatch with its row ranges) is saved before
+any LLM call is made, and every finished row is appended as it
+completes. When the Celery task is redelivered after a worker died, or
+the job is resumed through the API, the plan is loaded instead of
+preparing the inputs again (perturbations are random and partly
+LLM-generated, so a re-prepared job would not line up), and every row
+that already has a response is skipped.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from api.config import Settings
+from api.utils.background_writer import BackgroundWriter
+from api.utils.redis_pool import redis_pools
+from api.utils.shared_utils import convert_numpy_types
+
+logger = logging.getLogger(__name__)
+
+settings = Settings()
+
+# Buffered rows are written (on a background thread) once this many have
+# finished, or after FLUSH_INTERVAL seconds, whichever comes first
+FLUSH_EVERY = 25
+FLUSH_INTERVAL = 2.0
+
+# A run lock expires this long after its worker stops renewing it
+RUN_LOCK_TTL = 60
+RUN_LOCK_HEARTBEAT = 20
+
+# Delete / extend the lock only while it still holds our token
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def run_lock_key(test_id: str) -> str:
+    return f"test_run_lock:{test_id}"
+
+
+def _is_error(response: Any) -> bool:
+    return isinstance(response, str) and response.startswith("ERROR:")
+
+
+class JobCheckpoint:
+    """Plan and finished rows of one test job, kept in Redis."""
+
+    def __init__(self, test_id: str, client: Optional[redis.Redis] = None,
+                 ttl_seconds: int = settings.CHECKPOINT_TTL_SECONDS):
+        self.test_id = test_id
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+        self._plan_key = f"test_checkpoint:{test_id}:plan"
+        self._rows_key = f"test_checkpoint:{test_id}:rows"
+        self._pending: Dict[str, str] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._writer = BackgroundWriter(f"checkpoint-{test_id}")
+
+    def _redis(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis_pools.sync_client()
+        return self._client
+
+    # ---------- plan ----------
+
+    def save_plan(self, batch: Any, result_rows: List[int], groups: Dict[Any, Tuple[int, int]]):
+        plan = convert_numpy_types({
+            "batch": batch.to_payload(),
+            "result_rows": result_rows,
+            "groups": [[idx, start, stop] for idx, (start, stop) in groups.items()],
+        })
+        try:
+            self._redis().set(self._plan_key, json.dumps(plan), ex=self.ttl_seconds)
+            logger.info(f"Saved checkpoint plan for {self.test_id} ({len(batch)} tests)")
+        except redis.RedisError as e:
+            logger.warning(f"Could not save checkpoint plan for {self.test_id}: {e}")
+
+    def load_plan(self) -> Optional[Dict[str, Any]]:
+        try:
+            data = self._redis().get(self._plan_key)
+        except redis.RedisError as e:
+            logger.warning(f"Could not load checkpoint plan for {self.test_id}: {e}")
+            return None
+        if not data:
+            return None
+        plan = json.loads(data)
+        plan["groups"] = {idx: (start, stop) for idx, start, stop in plan["groups"]}
+        return plan
+
+    # ---------- rows ----------
+
+    def record(self, batch: Any, pos: int):
+        """
+        Buffer one finished row. Rows that ended in an error, or lack a
+        response they need, are not kept and run again on resume.
+        """
+        original, perturb = batch.responses(pos)
+        if not batch.ran[pos] or _is_error(original) or _is_error(perturb):
+            return
+        with self._lock:
+            self._pending[str(pos)] = json.dumps([original, perturb])
+            due = (len(self._pending) >= FLUSH_EVERY
+                   or time.monotonic() - self._last_flush >= FLUSH_INTERVAL)
+        if due:
+            # Called on the engine's event loop; never wait for Redis there
+            self._writer.submit(self.flush)
+
+    async def aflush(self):
+        """Write every buffered row, waiting off the event loop."""
+        await self._writer.run(self.flush)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            pipe.hset(self._rows_key, mapping=pending)
+            pipe.expire(self._rows_key, self.ttl_seconds)
+            pipe.expire(self._plan_key, self.ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(
+                f"Could not checkpoint {len(pending)} rows for {self.test_id}: {e}")
+
+    def restore(self, batch: Any) -> int:
+        """Copy saved responses into the batch; returns how many rows were restored."""
+        try:
+            rows = self._redis().hgetall(self._rows_key)
+        except redis.RedisError as e:
+            logger.warning(f"Could not load checkpointed rows for {self.test_id}: {e}")
+            return 0
+        restored = 0
+        for pos, value in rows.items():
+            pos = int(pos)
+            if pos < len(batch):
+                original, perturb = json.loads(value)
+                batch.restore_responses(pos, original, perturb)
+                restored += 1
+        if restored:
+            logger.info(f"Restored {restored} finished tests for {self.test_id} from checkpoint")
+        return restored
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+        try:
+            self._redis().delete(self._plan_key, self._rows_key)
+        except redis.RedisError as e:
+            logger.warning(f"Could not clear checkpoint for {self.test_id}: {e}")
+
+
+class JobRunLock:
+    """
+    Marks a test as being run by one worker. Celery can deliver the same
+    task twice (a visibility timeout, or a redelivery while the first
+    worker is still alive); the second delivery finds the lock held and
+    exits. The holder renews the lock from a heartbeat thread, so the
+    lock of a worker that died expires within RUN_LOCK_TTL seconds.
+    """
+
+    def __init__(self, test_id: str, client: Optional[redis.Redis] = None,
+                 ttl_seconds: int = RUN_LOCK_TTL):
+        self.test_id = test_id
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+        self._key = run_lock_key(test_id)
+        self._token = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _redis(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis_pools.sync_client()
+        return self._client
+
+    def acquire(self) -> bool:
+        """True when this worker may run the test."""
+        try:
+            acquired = self._redis().set(self._key, self._token, nx=True, ex=self.ttl_seconds)
+        except redis.RedisError as e:
+            # Without Redis the job cannot report anything either; let it run
+            logger.warning(f"Could not take the run lock of {self.test_id}: {e}")
+            return True
+        if not acquired:
+            return False
+        self._thread = threading.Thread(
+            target=self._heartbeat, name=f"run-lock-{self.test_id}", daemon=True)
+        self._thread.start()
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(RUN_LOCK_HEARTBEAT):
+            try:
+                if not self._redis().eval(_EXTEND_SCRIPT, 1, self._key, self._token, self.ttl_seconds):
+                    logger.warning(f"Run lock of {self.test_id} was lost")
+                    return
+            except redis.RedisError as e:
+                logger.warning(f"Could not renew the run lock of {self.test_id}: {e}")
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self._redis().eval(_RELEASE_SCRIPT, 1, self._key, self._token)
+        except redis.RedisError as e:
+            logger.warning(f"Could not release the run lock of {self.test_id}: {e}")
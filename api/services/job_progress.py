@@ -0,0 +1,222 @@
+# File: api/services/job_progress.py
+"""
+Live progress of running test jobs.
+
+The worker keeps structured counters in a Redis hash (tests done/total
+overall and per topic, failures, LLM calls, retries, ETA) and appends
+every finished test to a Redis list, so clients can follow a large run
+while it is still going. Updates are buffered and applied in one
+MULTI/EXEC, so readers never see counters and rows out of step.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+
+from api.config import Settings
+from api.utils.background_writer import BackgroundWriter
+from api.utils.redis_pool import redis_pools
+
+logger = logging.getLogger(__name__)
+
+settings = Settings()
+
+# Buffered updates are written (on a background thread) once this many
+# tests have finished, or after FLUSH_INTERVAL seconds, whichever comes first
+FLUSH_EVERY = 20
+FLUSH_INTERVAL = 1.0
+
+
+def progress_key(test_id: str) -> str:
+    return f"test_progress:{test_id}"
+
+
+def partial_results_key(test_id: str) -> str:
+    return f"test_partial:{test_id}"
+
+
+def parse_progress(raw: Dict[str, str]) -> Dict[str, Any]:
+    """Turn the counters hash into the shape the API returns."""
+    def number(field: str, cast: Callable = int) -> Any:
+        value = raw.get(field)
+        return cast(value) if value not in (None, "") else None
+
+    topics: Dict[str, Dict[str, int]] = {}
+    for field, value in raw.items():
+        if field.startswith("topic:"):
+            name, counter = field[len("topic:"):].rsplit(":", 1)
+            topics.setdefault(name, {"done": 0, "total": 0})[counter] = int(value)
+    return {
+        "phase": raw.get("phase"),
+        "total": number("total") or 0,
+        "done": number("done") or 0,
+        "failed": number("failed") or 0,
+        "topics": topics,
+        "calls": number("calls"),
+        "retries": number("retries"),
+        "eta_seconds": number("eta_seconds", float),
+        "started_at": number("started_at", float),
+        "updated_at": number("updated_at", float),
+    }
+
+
+class JobProgress:
+    """
+    Progress reporter for one job's TestBatch.
+
+    `row_topics` names the topic each batch row belongs to; `stats_fn`
+    returns the completion model's call statistics (RetryBudget.stats()).
+    """
+
+    def __init__(self, test_id: str, row_topics: List[str],
+                 stats_fn: Optional[Callable[[], Dict[str, Any]]] = None,
+                 client: Optional[redis.Redis] = None,
+                 ttl_seconds: int = settings.TEST_RETENTION_HOURS * 3600):
+        self.test_id = test_id
+        self.row_topics = row_topics
+        self.stats_fn = stats_fn
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+        self._key = progress_key(test_id)
+        self._rows_key = partial_results_key(test_id)
+        self._lock = threading.Lock()
+        self._pending_rows: List[str] = []
+        self._pending_topics: Dict[str, int] = {}
+        self._pending_failed = 0
+        self._last_flush = time.monotonic()
+        self._started = time.monotonic()
+        self._total = 0
+        self._done = 0
+        self._done_this_run = 0
+        self._writer = BackgroundWriter(f"progress-{test_id}")
+
+    def _redis(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis_pools.sync_client()
+        return self._client
+
+    def _write(self, apply: Callable[[Any], None], what: str):
+        try:
+            pipe = self._redis().pipeline(transaction=True)
+            apply(pipe)
+            pipe.expire(self._key, self.ttl_seconds)
+            pipe.expire(self._rows_key, self.ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not update {what} for {self.test_id}: {e}")
+
+    def start(self, batch: Any, pending: List[int]):
+        """Reset the counters for a run of `pending` rows; other rows count as done."""
+        totals: Dict[str, int] = {}
+        for topic in self.row_topics:
+            totals[topic] = totals.get(topic, 0) + 1
+        remaining: Dict[str, int] = {}
+        for pos in pending:
+            topic = self.row_topics[pos]
+            remaining[topic] = remaining.get(topic, 0) + 1
+        self._started = time.monotonic()
+        self._total = len(batch)
+        self._done = len(batch) - len(pending)
+        self._done_this_run = 0
+        fields: Dict[str, Any] = {
+            "phase": f"Running {len(pending)} tests",
+            "total": self._total,
+            "done": self._done,
+            "failed": 0,
+            "started_at": time.time(),
+            "updated_at": time.time(),
+        }
+        for topic, total in totals.items():
+            fields[f"topic:{topic}:total"] = total
+            fields[f"topic:{topic}:done"] = total - remaining.get(topic, 0)
+        # Rows finished by an earlier attempt (restored from a checkpoint)
+        pending_rows = set(pending)
+        restored = [json.dumps(self._row(batch, pos), default=str)
+                    for pos in range(len(batch)) if pos not in pending_rows]
+
+        def apply(pipe):
+            pipe.delete(self._key, self._rows_key)
+            pipe.hset(self._key, mapping=fields)
+            if restored:
+                pipe.rpush(self._rows_key, *restored)
+        self._write(apply, "progress")
+
+    def set_phase(self, phase: str):
+        self._write(lambda pipe: pipe.hset(
+            self._key, mapping={"phase": phase, "updated_at": time.time()}), "progress phase")
+
+    @staticmethod
+    def _row(batch: Any, pos: int) -> Dict[str, Any]:
+        original, perturb = batch.responses(pos)
+        row = {
+            "row": pos,
+            "name": batch.names[pos],
+            "test_type": batch.test_type(pos),
+            "response_original": original,
+            "response_perturb": perturb,
+        }
+        error = batch.error(pos)
+        if error:
+            row["error"] = error
+        return row
+
+    def record(self, batch: Any, pos: int):
+        """Buffer one finished test and its partial result."""
+        if not batch.ran[pos]:
+            # Cancelled by an abort before it got an answer
+            return
+        error = batch.error(pos)
+        topic = self.row_topics[pos]
+        with self._lock:
+            self._pending_rows.append(json.dumps(self._row(batch, pos), default=str))
+            self._pending_topics[topic] = self._pending_topics.get(topic, 0) + 1
+            if error:
+                self._pending_failed += 1
+            due = (len(self._pending_rows) >= FLUSH_EVERY
+                   or time.monotonic() - self._last_flush >= FLUSH_INTERVAL)
+        if due:
+            # Called on the engine's event loop; never wait for Redis there
+            self._writer.submit(self.flush)
+
+    async def aflush(self):
+        """Write every buffered update, waiting off the event loop."""
+        await self._writer.run(self.flush)
+
+    def _eta(self) -> Optional[float]:
+        if not self._done_this_run:
+            return None
+        rate = self._done_this_run / max(time.monotonic() - self._started, 1e-6)
+        return round((self._total - self._done) / rate, 1)
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending_rows = self._pending_rows, []
+            topics, self._pending_topics = self._pending_topics, {}
+            failed, self._pending_failed = self._pending_failed, 0
+            self._last_flush = time.monotonic()
+            self._done += len(rows)
+            self._done_this_run += len(rows)
+        if not rows:
+            return
+        fields: Dict[str, Any] = {"updated_at": time.time()}
+        eta = self._eta()
+        if eta is not None:
+            fields["eta_seconds"] = eta
+        if self.stats_fn is not None:
+            stats = self.stats_fn()
+            fields["calls"] = stats.get("requests", 0)
+            fields["retries"] = stats.get("retries", 0)
+
+        def apply(pipe):
+            pipe.hincrby(self._key, "done", len(rows))
+            if failed:
+                pipe.hincrby(self._key, "failed", failed)
+            for topic, count in topics.items():
+                pipe.hincrby(self._key, f"topic:{topic}:done", count)
+            pipe.hset(self._key, mapping=fields)
+            pipe.rpush(self._rows_key, *rows)
+        self._write(apply, "progress")
@@ -4,7 +4,7 @@ import json
 import logging
 from typing import Any, Dict, List
 
-from ..core.logic import process_score, calculate_performance_score
+from ..core.scores import process_score, calculate_performance_score
 
 
 class ResultAggregator:
@@ -0,0 +1,277 @@
+# api/services/result_store.py
+"""
+Compressed, chunked storage of finished test results.
+
+A finished job's results are split into:
+
+    test_result_meta:{id}    JSON: scores, summaries, robustness groups
+    test_result_chunks:{id}  hash of zlib-compressed JSON blobs: "index"
+                             and one field per CHUNK_ROWS tests
+
+Chunks keep the columnar layout of TestBatch payloads (see
+core.result_pages), with every distinct string stored once per chunk.
+The index holds each test's topic, fail flag and scores, so a filtered
+page only decompresses the chunks its rows live in. Summaries are
+computed once, when the results are stored. Kept free of numpy/pandas so
+the web tier can serve pages without the worker stack.
+"""
+
+import json
+import logging
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from redis.client import NEVER_DECODE
+
+from api.core.result_pages import INTERNED_FIELDS, build_rows, payload_length
+
+logger = logging.getLogger(__name__)
+
+# Tests per compressed chunk
+CHUNK_ROWS = 500
+COMPRESS_LEVEL = 6
+SCORE_FIELDS = ("score_original", "score_perturb")
+OUTCOMES = ("pass", "fail")
+
+
+def meta_key(test_id: str) -> str:
+    return f"test_result_meta:{test_id}"
+
+
+def chunks_key(test_id: str) -> str:
+    return f"test_result_chunks:{test_id}"
+
+
+def legacy_key(test_id: str) -> str:
+    """Results stored as one JSON document, before they were chunked."""
+    return f"test_results:{test_id}"
+
+
+def _compress(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), COMPRESS_LEVEL)
+
+
+def _decompress(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob))
+
+
+# ---------- packing ----------
+
+def _intern_rows(rows: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Columnar payload from result dicts (results from before TestBatch)."""
+    strings: List[str] = []
+    codes: Dict[str, int] = {}
+    payload: Dict[str, Any] = {"strings": strings}
+    for field in INTERNED_FIELDS:
+        column = []
+        for row in rows:
+            value = row.get(field)
+            if value is None:
+                column.append(-1)
+                continue
+            value = str(value)
+            if value not in codes:
+                codes[value] = len(strings)
+                strings.append(value)
+            column.append(codes[value])
+        payload[field] = column
+    payload["name"] = [row.get("name") for row in rows]
+    payload["score_original"] = [row.get("score_original") for row in rows]
+    payload["score_perturb"] = [row.get("score_perturb") for row in rows]
+    payload["fail"] = [bool(row.get("fail")) for row in rows]
+    return payload
+
+
+def _slice_payload(payload: Dict[str, Any], start: int, stop: int) -> Dict[str, Any]:
+    """Rows [start, stop) as a payload of their own, holding only their strings."""
+    source = payload["strings"]
+    strings: List[str] = []
+    remap: Dict[int, int] = {}
+    chunk: Dict[str, Any] = {"strings": strings}
+    for field in INTERNED_FIELDS:
+        column = []
+        for code in payload[field][start:stop]:
+            if code < 0:
+                column.append(-1)
+                continue
+            if code not in remap:
+                remap[code] = len(strings)
+                strings.append(source[code])
+            column.append(remap[code])
+        chunk[field] = column
+    for field in ("name", "score_original", "score_perturb", "fail"):
+        chunk[field] = payload[field][start:stop]
+    return chunk
+
+
+def _outcomes(fails: Sequence[bool]) -> Dict[str, Any]:
+    total = len(fails)
+    failures = sum(1 for fail in fails if fail)
+    passes = total - failures
+    return {
+        "total_tests": total,
+        "failures": failures,
+        "passes": passes,
+        "pass_rate": (passes / total * 100) if total > 0 else 0,
+    }
+
+
+def _mean(values: Sequence[Optional[float]]) -> Optional[float]:
+    scored = [v for v in values if v is not None]
+    return sum(scored) / len(scored) if scored else None
+
+
+def pack(results: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], List[bytes]]:
+    """
+    Split a job's results (as the worker assembles them) into metadata,
+    the per-test index and the compressed row chunks.
+    """
+    meta = dict(results)
+    payload = meta.pop("batch", None)
+    robust = [dict(entry) for entry in meta.pop("robust_results", None) or []]
+    rows = meta.pop("results", None) or []
+    if payload:
+        result_rows = list(meta.pop("result_rows", None) or [0, 0])
+    else:
+        # Results from before TestBatch carry one dict per test
+        rows = list(rows)
+        result_rows = [0, len(rows)]
+        for entry in robust:
+            group = entry.pop("results", None) or []
+            entry["rows"] = [len(rows), len(rows) + len(group)]
+            rows.extend(group)
+        payload = _intern_rows(rows)
+        meta.pop("result_rows", None)
+    total = payload_length(payload)
+
+    # Topic of every row: the test type for topic tests, else "robustness"
+    strings = payload["strings"]
+    row_topics = ["robustness"] * total
+    for pos in range(*result_rows):
+        code = payload["test_type"][pos]
+        row_topics[pos] = strings[code] if code >= 0 else "unknown"
+    topic_names = list(dict.fromkeys(row_topics))
+    topic_codes = {name: code for code, name in enumerate(topic_names)}
+
+    by_topic: Dict[str, List[int]] = {}
+    for pos, topic in enumerate(row_topics):
+        by_topic.setdefault(topic, []).append(pos)
+    fails = payload["fail"]
+    topics = {}
+    for topic, positions in by_topic.items():
+        topics[topic] = _outcomes([fails[pos] for pos in positions])
+        for field in SCORE_FIELDS:
+            topics[topic][f"mean_{field}"] = _mean([payload[field][pos] for pos in positions])
+
+    meta.update({
+        "result_rows": result_rows,
+        "robust_results": robust,
+        "total_rows": total,
+        "chunk_rows": CHUNK_ROWS,
+        "summaries": {
+            "results": _outcomes(fails[result_rows[0]:result_rows[1]]),
+            "topics": topics,
+        },
+    })
+    index = {
+        "topics": topic_names,
+        "topic": [topic_codes[topic] for topic in row_topics],
+        "fail": [bool(fail) for fail in fails],
+        "score_original": payload["score_original"],
+        "score_perturb": payload["score_perturb"],
+    }
+    chunks = [_compress(_slice_payload(payload, start, min(start + CHUNK_ROWS, total)))
+              for start in range(0, total, CHUNK_ROWS)]
+    return meta, index, chunks
+
+
+def select(
+    index: Dict[str, Any],
+    topic: Optional[str] = None,
+    outcome: Optional[str] = None,
+    score_field: str = "score_perturb",
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+) -> List[int]:
+    """Positions of the tests matching every given filter, in order."""
+    positions = range(len(index["fail"]))
+    if topic is not None:
+        if topic not in index["topics"]:
+            return []
+        code = index["topics"].index(topic)
+        positions = [pos for pos in positions if index["topic"][pos] == code]
+    if outcome is not None:
+        want_fail = outcome == "fail"
+        positions = [pos for pos in positions if index["fail"][pos] == want_fail]
+    if min_score is not None or max_score is not None:
+        scores = index[score_field]
+        low = float("-inf") if min_score is None else min_score
+        high = float("inf") if max_score is None else max_score
+        positions = [pos for pos in positions
+                     if scores[pos] is not None and low <= scores[pos] <= high]
+    return list(positions)
+
+
+# ---------- Redis I/O ----------
+
+async def save_results(client: Any, test_id: str, results: Dict[str, Any],
+                       ttl_seconds: int) -> Dict[str, Any]:
+    """Replace a test's stored results; returns the metadata written."""
+    meta, index, chunks = pack(results)
+    blobs = {"index": _compress(index)}
+    blobs.update({str(i): chunk for i, chunk in enumerate(chunks)})
+    pipe = client.pipeline(transaction=True)
+    pipe.delete(meta_key(test_id), chunks_key(test_id), legacy_key(test_id))
+    pipe.set(meta_key(test_id), json.dumps(meta), ex=ttl_seconds)
+    pipe.hset(chunks_key(test_id), mapping=blobs)
+    pipe.expire(chunks_key(test_id), ttl_seconds)
+    await pipe.execute()
+    logger.info(
+        f"Stored results of {test_id}: {meta['total_rows']} tests in {len(chunks)} chunks, "
+        f"{sum(len(b) for b in blobs.values())} bytes compressed")
+    return meta
+
+
+async def _blobs(client: Any, test_id: str, fields: Sequence[str]) -> List[Optional[bytes]]:
+    # Chunks are binary; read them raw even on a decode_responses client
+    return await client.execute_command(
+        "HMGET", chunks_key(test_id), *fields, **{NEVER_DECODE: []})
+
+
+async def load_meta(client: Any, test_id: str) -> Optional[Dict[str, Any]]:
+    """A test's result metadata; results stored in one piece are chunked on first read."""
+    data = await client.get(meta_key(test_id))
+    if data:
+        return json.loads(data)
+    legacy = await client.get(legacy_key(test_id))
+    if not legacy:
+        return None
+    ttl = await client.ttl(legacy_key(test_id))
+    meta = await save_results(client, test_id, json.loads(legacy),
+                              ttl if ttl > 0 else 86_400)
+    logger.info(f"Chunked stored results of {test_id}")
+    return meta
+
+
+async def load_index(client: Any, test_id: str) -> Optional[Dict[str, Any]]:
+    blob, = await _blobs(client, test_id, ["index"])
+    return _decompress(blob) if blob else None
+
+
+async def load_rows(client: Any, test_id: str, meta: Dict[str, Any],
+                    positions: Sequence[int]) -> List[Dict[str, Any]]:
+    """Result dicts (Test.summarize() shape) of the given tests, in the order given."""
+    size = meta["chunk_rows"]
+    needed = sorted({pos // size for pos in positions})
+    if not needed:
+        return []
+    blobs = await _blobs(client, test_id, [str(n) for n in needed])
+    chunks = {n: _decompress(blob) for n, blob in zip(needed, blobs) if blob}
+    rows = []
+    for pos in positions:
+        chunk = chunks.get(pos // size)
+        if chunk is None:
+            raise KeyError(f"Missing result chunk {pos // size} of {test_id}")
+        offset = pos % size
+        rows.extend(build_rows(chunk, offset, offset + 1))
+    return rows
@@ -0,0 +1,143 @@
+# api/services/status_stream.py
+"""
+Server-sent event streams of test status.
+
+Every status change is published on test_status:{test_id}. Instead of
+each client polling GET /status (a Redis read and a TestInfo decode
+per poll), clients keep one event stream open. Each web process holds a
+single pub/sub connection with one channel subscription per watched
+test, however many clients watch it. Messages already carry only the
+changed status fields; they are merged into the last known state and
+whatever actually changed is fanned out to the watchers. Results are
+never streamed; results_available says when they are ready.
+"""
+
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from api.services.test_status_manager import TestStatus, TestStatusManager, test_status_manager
+
+logger = logging.getLogger(__name__)
+
+# Events queued per watcher before the oldest are dropped for a slow client
+WATCHER_QUEUE_SIZE = 100
+# Comment line sent when nothing happened, so proxies keep the stream open
+KEEPALIVE_SECONDS = 15.0
+
+TERMINAL_STATUSES = {TestStatus.COMPLETED.value,
+                     TestStatus.ERROR.value, TestStatus.ABORTED.value}
+
+
+def _delta(previous: Optional[Dict[str, Any]], update: Dict[str, Any]) -> Dict[str, Any]:
+    if previous is None:
+        return update
+    return {k: v for k, v in update.items() if previous.get(k) != v}
+
+
+def _event(name: str, data: Dict[str, Any]) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class StatusBroadcaster:
+    """Fans test_status pub/sub messages out to the stream watchers of this process."""
+
+    def __init__(self, status_manager: TestStatusManager):
+        self.status_manager = status_manager
+        self._watchers: Dict[str, Set[asyncio.Queue]] = {}
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._pubsub: Any = None
+        self._reader: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _channel(test_id: str) -> str:
+        return f"test_status:{test_id}"
+
+    async def _subscribe(self, test_id: str):
+        if self._pubsub is None:
+            self._pubsub = self.status_manager._get_redis().pubsub()
+        await self._pubsub.subscribe(self._channel(test_id))
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._read())
+
+    async def _unsubscribe(self, test_id: str):
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self._channel(test_id))
+
+    async def _read(self):
+        """Dispatch messages while any test is watched."""
+        while self._watchers:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Status stream read failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            test_id = message["channel"].split(":", 1)[1]
+            try:
+                self._dispatch(test_id, json.loads(message["data"]))
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Bad status message for {test_id}: {e}")
+
+    def _dispatch(self, test_id: str, update: Dict[str, Any]):
+        previous = self._states.get(test_id)
+        delta = _delta(previous, update)
+        self._states[test_id] = {**(previous or {}), **update}
+        if not delta:
+            return
+        for queue in self._watchers.get(test_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(delta)
+
+    @asynccontextmanager
+    async def watch(self, test_id: str) -> AsyncIterator[asyncio.Queue]:
+        """A queue of status deltas for one test while the context is open."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=WATCHER_QUEUE_SIZE)
+        first = test_id not in self._watchers
+        self._watchers.setdefault(test_id, set()).add(queue)
+        try:
+            if first:
+                await self._subscribe(test_id)
+            yield queue
+        finally:
+            watchers = self._watchers.get(test_id)
+            if watchers is not None:
+                watchers.discard(queue)
+                if not watchers:
+                    del self._watchers[test_id]
+                    self._states.pop(test_id, None)
+                    await self._unsubscribe(test_id)
+
+    async def stream(self, test_id: str) -> AsyncIterator[str]:
+        """
+        SSE body: a "snapshot" event with the current status, then an
+        "update" event per change until the test reaches a final status.
+        """
+        async with self.watch(test_id) as queue:
+            info = await self.status_manager.get_test(test_id, refresh=True)
+            if info is None:
+                yield _event("error", {"test_id": test_id, "status": TestStatus.NOT_FOUND.value})
+                return
+            state = info.to_dict()
+            # Deltas that arrived while the snapshot was read are newer
+            self._states[test_id] = {**state, **self._states.get(test_id, {})}
+            yield _event("snapshot", state)
+            status = state["status"]
+            while status not in TERMINAL_STATUSES:
+                try:
+                    delta = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                status = delta.get("status", status)
+                yield _event("update", delta)
+
+
+# ---------------- singleton ----------------
+status_broadcaster = StatusBroadcaster(test_status_manager)
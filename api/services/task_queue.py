@@ -0,0 +1,51 @@
+# File: api/services/task_queue.py
+"""
+Celery app and task payload shared by the web tier and the workers.
+
+The API only needs to *enqueue* work, so it talks to Celery by task name
+through this module and never imports the worker code (litellm, torch,
+spaCy, pandas) that lives behind api.services.test_processor.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from celery import Celery
+from pydantic import BaseModel
+
+from api.config import Settings
+
+settings = Settings()
+celery_app = Celery(
+    'test_processor',
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND
+)
+# The test task is acked late; without a long visibility timeout the
+# broker would hand a run longer than an hour to a second worker
+celery_app.conf.broker_transport_options = {
+    "visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT
+}
+
+PROCESS_TEST_TASK = 'process_test_task'
+
+
+class TestConfig(BaseModel):
+    shot_type: str
+    template: str
+    topics: List[str]
+    topic_configs: Optional[Dict[str, Any]] = None
+    system_content: Optional[str] = None
+    model_provider: str
+    model: str
+    api_key: Optional[str] = None
+    url: Optional[str] = None
+    project_id: str
+    test_id: str
+    file_path: str
+    # Skip the persistent completion cache and call the model for everything
+    fresh_completions: bool = False
+
+
+def enqueue_test(config: TestConfig):
+    """Queue a test run for the workers without importing the task itself."""
+    return celery_app.send_task(PROCESS_TEST_TASK, args=[config.json()])
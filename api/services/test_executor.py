@@ -1,17 +1,53 @@
 # api/services/test_executor.py
 
-import concurrent.futures
+import json
 import pandas as pd
 import logging
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
-from ..PromptOps.test_suite import TestSuite
-from ..PromptOps.test import Test
+from ..core.result_pages import build_rows
+from ..PromptOps.completion_memo import CompletionMemo
+from ..PromptOps.test_batch import TestBatch
 from ..utils.abort_handler import abort_handler, check_abort
+from .job_checkpoint import JobCheckpoint
+from .job_progress import JobProgress
 
 logger = logging.getLogger(__name__)
 
 
+def _coalesce(df: pd.DataFrame, *columns: str) -> List[Any]:
+    """
+    Per row, the first value among `columns` that is present and
+    non-empty (else None), as a plain list.
+    """
+    candidates = [df[c].tolist() for c in columns if c in df.columns]
+    if not candidates:
+        return [None] * len(df)
+    return [
+        next((v for v in values if v is not None and v == v and v != ""), None)
+        for values in zip(*candidates)
+    ]
+
+
+@dataclass
+class JobPlan:
+    """Every test of one job in a single batch, with where each part lives."""
+    batch: TestBatch
+    # Row range of the topic tests; None when the job has no topics
+    result_rows: Optional[List[int]]
+    # Original_Question_Index -> row range of its robust tests
+    groups: Dict[Any, Tuple[int, int]]
+
+    def row_topics(self) -> List[str]:
+        """Topic of every row: the test type for topic tests, else "robustness"."""
+        topics = ["robustness"] * len(self.batch)
+        if self.result_rows is not None:
+            for pos in range(*self.result_rows):
+                topics[pos] = self.batch.test_type(pos)
+        return topics
+
+
 class TestExecutor:
     """
     Encapsulates test‐suite construction, concurrent execution, and summarization
@@ -22,101 +58,175 @@ class TestExecutor:
         self,
         completion_model: Any,
         test_id: Optional[str] = None,
-        max_workers: int = 5
+        max_workers: Optional[int] = None,
+        memo: Optional[CompletionMemo] = None
     ):
         self.completion_model = completion_model
         self.test_id = test_id
         self.max_workers = max_workers
+        # Shared original-prompt completions; one memo per job lets every
+        # topic and the robustness run reuse the same baseline answers
+        self.memo = memo
 
-    def run_robust(
-        self,
-        robust_df: pd.DataFrame
-    ) -> Dict[str, Any]:
+    def _abort_check_fn(self):
+        return (lambda: check_abort(self.test_id)) if self.test_id else None
+
+    def _set_progress(self, progress: str, batch: Optional[TestBatch] = None):
+        if self.test_id:
+            abort_handler.set_progress(self.test_id, progress)
+        if batch is not None and batch.progress is not None:
+            batch.progress.set_phase(progress)
+
+    def _call_stats(self) -> Dict[str, Any]:
+        stats = getattr(self.completion_model, "retry_stats", None)
+        return stats() if stats else {}
+
+    def _add_robust_tests(self, batch: TestBatch, robust_df: pd.DataFrame) -> Dict[Any, Tuple[int, int]]:
         """
-        Process a DataFrame of robust‐perturbed rows and return:
-          {
-            "index_scores": { idx: score, … },
-            "robust_results": [ {Original_Question_Index, score, summary, results}, … ]
-          }
+        Append the robust rows to the batch, grouped by
+        Original_Question_Index, and return each group's row range. Rows
+        are partitioned with a single groupby pass and read from plain
+        column lists, never as per-row Series.
         """
-        unique_indices = robust_df['Original_Question_Index'].unique()
-        index_scores: Dict[int, float] = {}
-        detailed_results: List[Dict[str, Any]] = []
+        prompts = _coalesce(robust_df, "Original_Question", "original_prompt")
+        expected = _coalesce(robust_df, "Expected_Answer", "expected_result")
+        perturbs = _coalesce(robust_df, "Perturbation", "perturb_type")
+        pert_texts = _coalesce(robust_df, "Perturbed_Question", "perturb_prompt")
+        labels = robust_df.index.tolist()
+
+        groups: Dict[Any, Tuple[int, int]] = {}
+        grouped = robust_df.groupby('Original_Question_Index', sort=False).indices
+        for idx, positions in grouped.items():
+            start = len(batch)
+            for pos in positions:
+                if not prompts[pos] or not expected[pos]:
+                    continue
+                batch.add(
+                    name=f"Test robust #{labels[pos]+1}",
+                    prompt=prompts[pos],
+                    expected_result=expected[pos],
+                    description="A test with robust perturbation",
+                    perturb_method=perturbs[pos],
+                    test_type=perturbs[pos],
+                    perturb_text=pert_texts[pos]
+                )
+            groups[idx] = (start, len(batch))
+        return groups
 
-        def _process_index(idx: int) -> Optional[Dict[str, Any]]:
+    def _add_basic_tests(self, batch: TestBatch, csv_files: List[Tuple[str, str]]) -> bool:
+        """Append every non-robust test to the batch; False if the test was aborted."""
+        for perturb_type, path in csv_files:
             # Abort check
             if self.test_id and check_abort(self.test_id):
-                logger.info(f"Test {self.test_id} aborted before index {idx}")
-                return None
+                logger.info(
+                    f"Test {self.test_id} aborted before adding tests for {perturb_type}")
+                return False
 
             # Update progress
-            if self.test_id:
-                abort_handler.active_tests[self.test_id][
-                    "progress"] = f"Testing index {idx}"
-
-            # Build a suite just for this index
-            subset = robust_df[robust_df['Original_Question_Index'] == idx]
-            suite = TestSuite()
-            for _, row in subset.iterrows():
-                prompt = row.get("Original_Question") or row.get(
-                    "original_prompt")
-                expected = row.get("Expected_Answer") or row.get(
-                    "expected_result")
-                perturb = row.get("Perturbation") or row.get("perturb_type")
-                pert_text = row.get("Perturbed_Question") or row.get(
-                    "perturb_prompt")
-                if not prompt or not expected:
-                    continue
-                test = Test(
-                    name=f"Test robust #{row.name+1}",
+            self._set_progress(f"Adding tests for {perturb_type}")
+
+            df = pd.read_csv(path)
+            for idx, prompt, expected, pert_text in zip(
+                    df.index.tolist(), df["original_prompt"].tolist(),
+                    df["expected_result"].tolist(), df["perturb_prompt"].tolist()):
+                batch.add(
+                    name=f"Test {perturb_type} #{idx+1}",
                     prompt=prompt,
                     expected_result=expected,
-                    description="A test with robust perturbation",
-                    perturb_method=perturb,
-                    test_type=perturb,
+                    description=f"A test with {perturb_type} perturbation",
+                    perturb_method=perturb_type,
+                    test_type=perturb_type,
                     perturb_text=pert_text
                 )
-                suite.add_test(test)
+        return True
+
+    def _execute(self, batch: TestBatch) -> bool:
+        """
+        Run every test of the job in a single scheduler pass, so they
+        share one provider concurrency window and rate budget.
+        Returns True if the run was aborted.
+        """
+        if not len(batch):
+            return False
+        self._set_progress(f"Running {len(batch)} tests", batch)
+        batch.run(
+            self.completion_model,
+            abort_check_fn=self._abort_check_fn(),
+            memo=self.memo,
+            max_in_flight=self.max_workers)
+        if batch.aborted:
+            logger.info(f"Test {self.test_id} aborted during execution")
+        return batch.aborted
 
-            # Run & summarize
-            suite.run_all(self.completion_model,
-                          abort_check_fn=lambda: check_abort(self.test_id))
-            results, summary = suite.summarize()
+    @staticmethod
+    def _summarize_robust(batch: TestBatch, groups: Dict[Any, Tuple[int, int]], aborted: bool) -> Dict[str, Any]:
+        """
+        Per-index scores and summaries. Each robust_results entry points at
+        its tests through "rows" ([start, stop) in the batch) instead of
+        carrying the result dicts.
+        """
+        index_scores: Dict[int, float] = {}
+        detailed_results: List[Dict[str, Any]] = []
+        for idx, (start, stop) in groups.items():
+            if start == stop:
+                continue
+            # After an abort only fully-run indices are reported
+            if aborted and not batch.all_ran(start, stop):
+                continue
+            summary = batch.summarize(start, stop, aborted=aborted)
             total = summary.get("total_tests", 0)
             fails = summary.get("failures", 0)
             score = (total - fails) / total * 100 if total > 0 else 0
-
-            return {
+            index_scores[idx] = score
+            detailed_results.append({
                 "Original_Question_Index": idx,
                 "score": score,
                 "summary": summary,
-                "results": results
-            }
-
-        # Execute in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as execr:
-            futures = {execr.submit(_process_index, idx)
-                                    : idx for idx in unique_indices}
-            for future in concurrent.futures.as_completed(futures):
-                res = future.result()
-                if res:
-                    i = res["Original_Question_Index"]
-                    index_scores[i] = res["score"]
-                    detailed_results.append(res)
-                if self.test_id and check_abort(self.test_id):
-                    logger.info(
-                        f"Test {self.test_id} aborted during robust execution")
-                    break
-
-        # Finalize
-        if self.test_id:
-            abort_handler.complete_test(self.test_id)
-
+                "rows": [start, stop]
+            })
         return {
             "index_scores": index_scores,
             "robust_results": detailed_results
         }
 
+    @staticmethod
+    def _summarize_basic(batch: TestBatch, stop: int, aborted: bool) -> Dict[str, Any]:
+        if not stop:
+            return {"total_tests": 0, "failures": 0, "passes": 0}
+        summary = batch.summarize(0, stop, aborted=aborted)
+        logger.info(f"Summarized basic tests: {json.dumps(summary, default=str)}")
+        return summary
+
+    def _finish(self):
+        if self.test_id:
+            abort_handler.complete_test(self.test_id)
+
+    def run_robust(
+        self,
+        robust_df: pd.DataFrame
+    ) -> Dict[str, Any]:
+        """
+        Process a DataFrame of robust‐perturbed rows and return:
+          {
+            "index_scores": { idx: score, … },
+            "robust_results": [ {Original_Question_Index, score, summary, results}, … ]
+          }
+        """
+        if self.test_id and check_abort(self.test_id):
+            logger.info(f"Test {self.test_id} aborted before robust execution")
+            self._finish()
+            return {"index_scores": {}, "robust_results": []}
+
+        batch = TestBatch()
+        groups = self._add_robust_tests(batch, robust_df)
+        aborted = self._execute(batch)
+        robust = self._summarize_robust(batch, groups, aborted)
+        payload = batch.to_payload()
+        for entry in robust["robust_results"]:
+            entry["results"] = build_rows(payload, *entry.pop("rows"))
+        self._finish()
+        return robust
+
     def run_basic(
         self,
         csv_files: List[Tuple[str, str]]
@@ -125,43 +235,91 @@ class TestExecutor:
         Process non-robust tests given a list of (perturb_type, filepath).
         Returns (results_list, summary_dict).
         """
-        suite = TestSuite()
-        for perturb_type, path in csv_files:
-            # Abort check
-            if self.test_id and check_abort(self.test_id):
-                logger.info(
-                    f"Test {self.test_id} aborted before adding tests for {perturb_type}")
-                return [], {"aborted": True}
+        batch = TestBatch()
+        if not self._add_basic_tests(batch, csv_files):
+            return [], {"aborted": True}
+        aborted = self._execute(batch)
+        summary = self._summarize_basic(batch, len(batch), aborted)
+        results = batch.records()
+        self._finish()
+        return results, summary
 
-            # Update progress
-            if self.test_id:
-                abort_handler.active_tests[self.test_id][
-                    "progress"] = f"Adding tests for {perturb_type}"
+    def plan_job(
+        self,
+        csv_files: List[Tuple[str, str]],
+        robust_df: Optional[pd.DataFrame] = None
+    ) -> Optional[JobPlan]:
+        """Put every test of the job into one batch; None if the test was aborted."""
+        batch = TestBatch()
+        if not self._add_basic_tests(batch, csv_files):
+            return None
+        result_rows = [0, len(batch)] if csv_files else None
+        groups = self._add_robust_tests(
+            batch, robust_df) if robust_df is not None else {}
+        return JobPlan(batch, result_rows, groups)
 
-            df = pd.read_csv(path)
-            for idx, row in df.iterrows():
-                test = Test(
-                    name=f"Test {perturb_type} #{idx+1}",
-                    prompt=row["original_prompt"],
-                    expected_result=row["expected_result"],
-                    description=f"A test with {perturb_type} perturbation",
-                    perturb_method=perturb_type,
-                    test_type=perturb_type,
-                    perturb_text=row["perturb_prompt"]
-                )
-                suite.add_test(test)
-
-        # Execute all
-        if suite.tests:
-            suite.run_all(self.completion_model,
-                          abort_check_fn=lambda: check_abort(self.test_id))
-            results, summary = suite.summarize()
-        else:
-            results, summary = [], {
-                "total_tests": 0, "failures": 0, "passes": 0}
-
-        # Finalize
+    def execute_plan(self, plan: JobPlan, checkpoint: Optional[JobCheckpoint] = None) -> Dict[str, Any]:
+        """Run a planned job in one scheduler pass and summarize it (see run_job)."""
+        batch = plan.batch
+        batch.checkpoint = checkpoint
         if self.test_id:
-            abort_handler.complete_test(self.test_id)
+            batch.progress = JobProgress(
+                self.test_id, plan.row_topics(), stats_fn=self._call_stats)
+        job: Dict[str, Any] = {"batch": batch, "result_rows": plan.result_rows or [0, 0],
+                               "summary": {}, "index_scores": {}, "robust_results": []}
+        aborted = self._execute(batch)
+        if plan.result_rows is not None:
+            job["summary"] = self._summarize_basic(
+                batch, plan.result_rows[1], aborted)
+        job.update(self._summarize_robust(batch, plan.groups, aborted))
+        if aborted:
+            job["aborted"] = True
+        self._finish()
+        return job
 
-        return results, summary
+    def run_job(
+        self,
+        csv_files: List[Tuple[str, str]],
+        robust_df: Optional[pd.DataFrame] = None,
+        checkpoint: Optional[JobCheckpoint] = None
+    ) -> Dict[str, Any]:
+        """
+        Run every topic's tests and the robustness groups of one job in a
+        single scheduler pass, then summarize them separately. All tests
+        live in one TestBatch; results point into it by row range:
+          {
+            "batch": TestBatch, "result_rows": [0, n],
+            "summary": {..., "by_test_type": {topic: ...}},
+            "index_scores": {...},
+            "robust_results": [ {Original_Question_Index, score, summary, rows}, … ]
+          }
+        With a checkpoint the plan is saved before anything runs and every
+        finished test is recorded, so the job can be resumed (resume_job).
+        """
+        empty: Dict[str, Any] = {"batch": None, "result_rows": [0, 0], "summary": {},
+                                 "index_scores": {}, "robust_results": [], "aborted": True}
+        if self.test_id and check_abort(self.test_id):
+            logger.info(f"Test {self.test_id} aborted before execution")
+            self._finish()
+            return empty
+
+        plan = self.plan_job(csv_files, robust_df)
+        if plan is None:
+            self._finish()
+            return empty
+        if checkpoint is not None:
+            checkpoint.save_plan(plan.batch, plan.result_rows, plan.groups)
+        return self.execute_plan(plan, checkpoint)
+
+    def resume_job(self, saved_plan: Dict[str, Any], checkpoint: JobCheckpoint) -> Dict[str, Any]:
+        """
+        Continue a job from its checkpoint: the saved plan replaces input
+        preparation and tests that already finished are not run again.
+        """
+        plan = JobPlan(
+            TestBatch.from_payload(saved_plan["batch"]),
+            saved_plan["result_rows"],
+            saved_plan["groups"])
+        logger.info(
+            f"Resuming test {self.test_id} from checkpoint ({len(plan.batch)} tests)")
+        return self.execute_plan(plan, checkpoint)
@@ -3,42 +3,34 @@
 import asyncio
 import logging
 import traceback
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional
 
-from celery import Celery
-from pydantic import BaseModel
+from celery.signals import worker_process_init
 
 import api.utils.nltk_setup as _
 from api.config import Settings
-from api.core.logic import process_test, process_test_robust
+from api.core.logic import process_job
+from api.PromptOps.completion_memo import CompletionMemo
+from api.PromptOps.concurrency import get_concurrency
+from api.PromptOps.model_registry import model_registry
+from api.services.job_checkpoint import RUN_LOCK_TTL, JobCheckpoint, JobRunLock
 from api.services.result_aggregator import ResultAggregator
+from api.services.task_queue import PROCESS_TEST_TASK, TestConfig, celery_app
 from api.services.test_status_manager import test_status_manager, TestStatus
 from api.utils.shared_utils import convert_numpy_types
 from api.utils.model_factory import create_completion
+from api.utils.redis_pool import redis_pools
 
 # Initialize
 settings = Settings()
 logger = logging.getLogger(__name__)
-celery_app = Celery(
-    'test_processor',
-    broker=settings.CELERY_BROKER_URL,
-    backend=settings.CELERY_RESULT_BACKEND
-)
 
 
-class TestConfig(BaseModel):
-    shot_type: str
-    template: str
-    topics: List[str]
-    topic_configs: Optional[Dict[str, Any]] = None
-    system_content: Optional[str] = None
-    model_provider: str
-    model: str
-    api_key: Optional[str] = None
-    url: Optional[str] = None
-    project_id: str
-    test_id: str
-    file_path: str
+@worker_process_init.connect
+def preload_embedding_models(**kwargs):
+    """Load scoring models once per worker process, before the first task."""
+    model_registry.preload(settings.PRELOAD_EMBEDDING_MODELS)
+    logger.info(f"Embedding models ready: {model_registry.stats()}")
 
 
 class TestProcessor:
@@ -53,61 +45,44 @@ class TestProcessor:
                 model=config.model,
                 system_content=sys_cont,
                 url=config.url,
-                api_key=config.api_key
+                api_key=config.api_key,
+                use_cache=not config.fresh_completions
             )
         except Exception as e:
             raise Exception(f"Failed to initialize LLM: {str(e)}")
 
-    async def _run_normal_tests(
+    async def _run_job(
         self,
         test_id: str,
         config: TestConfig,
         topics: List[str],
-        completion: Any
-    ) -> Tuple[List[Any], Dict[str, Any]]:
-        normal_results: List[Any] = []
-        normal_summary = {"total_tests": 0, "failures": 0, "passes": 0}
-        for topic in topics:
-            await self.status_manager.update_status(
-                test_id, TestStatus.RUNNING, progress=f"Formatting data for {topic}"
-            )
-            results, summary = process_test(
-                file_path=config.file_path,
-                shot_type=config.shot_type,
-                template=config.template,
-                perturbation_types=[topic],
-                completion=completion,
-                test_id=test_id
-            )
-            normal_results.extend(results)
-            normal_summary["total_tests"] += summary.get("total_tests", 0)
-            normal_summary["failures"] += summary.get("failures", 0)
-            normal_summary["passes"] += summary.get("passes", 0)
-        if normal_summary["total_tests"] > 0:
-            normal_summary["pass_rate"] = (
-                normal_summary["passes"] / normal_summary["total_tests"] * 100
-            )
-        return normal_results, normal_summary
-
-    async def _run_robust_tests(
-        self,
-        test_id: str,
-        config: TestConfig,
-        percentage: int,
-        completion: Any
+        robust_percentage: Optional[int],
+        completion: Any,
+        memo: Optional[CompletionMemo] = None
     ) -> Dict[str, Any]:
-        return process_test_robust(
+        # Every topic and the robustness groups go through one scheduler
+        # pass, sharing the provider's concurrency window and rate budget
+        return process_job(
             file_path=config.file_path,
             shot_type=config.shot_type,
             template=config.template,
-            num=percentage,
+            perturbation_types=topics,
+            robust_percentage=robust_percentage,
             completion=completion,
-            test_id=test_id
+            test_id=test_id,
+            memo=memo
         )
 
     async def process_test(self, config: TestConfig) -> Dict[str, Any]:
         test_id = config.test_id
         logger.info(f"[Celery] process_test starting for {test_id}")
+        # A late duplicate delivery must not run a finished, failed or
+        # aborted test again; resume_test sets QUEUED before enqueueing
+        info = await self.status_manager.get_test(test_id, refresh=True)
+        if info is None or info.status not in (TestStatus.QUEUED, TestStatus.RUNNING):
+            status = info.status.value if info else "missing"
+            logger.warning(f"[Celery] Skipping {test_id}: test is {status}")
+            return {"skipped": True, "status": status}
         try:
             # mark running
             await self.status_manager.update_status(
@@ -115,57 +90,100 @@ class TestProcessor:
             )
             # build LLM
             completion_instance = await self._create_completion_instance(config)
+            # One baseline completion per unique original prompt for the
+            # whole job: topics and robustness only add perturbed calls
+            baseline_memo = CompletionMemo()
             # split topics
             robust_present = any(
                 t.lower() == "robustness" for t in config.topics)
             non_robust = [t for t in config.topics if t.lower() !=
                           "robustness"]
+            # Per-test results stay in the job's columnar batch; rows are
+            # only expanded into dicts by the results endpoint, per page
             combined: Dict[str, Any] = {
-                "results": [], "summary": {},
+                "batch": None, "result_rows": [0, 0], "summary": {},
                 "index_scores": {}, "robust_results": [],
                 "overall_robust_score": None
             }
-            # run non-robust
-            if non_robust:
-                await self.status_manager.update_status(
-                    test_id, TestStatus.RUNNING,
-                    progress=f"Running tests for topics: {', '.join(non_robust)}"
-                )
-                nr, ns = await self._run_normal_tests(
-                    test_id, config, non_robust, completion_instance
-                )
-                combined["results"] = nr
-                combined["summary"] = ns
-            # run robust
+            pct = None
             if robust_present:
                 pct = (config.topic_configs or {}).get(
                     "robustness", {}).get("swapPercentage", 10)
+            parts = list(non_robust)
+            if robust_present:
+                parts.append(f"robustness ({pct}%)")
+            await self.status_manager.update_status(
+                test_id, TestStatus.RUNNING,
+                progress=f"Running tests for topics: {', '.join(parts)}"
+            )
+            job = await self._run_job(
+                test_id, config, non_robust, pct, completion_instance,
+                memo=baseline_memo
+            )
+            if job.get("error"):
+                # process_job reports failures instead of raising. Keep the
+                # checkpoint so the test can be resumed once the cause is fixed
+                err = f"Error processing test: {job['error']}"
+                logger.error(f"[Celery] {err}")
                 await self.status_manager.update_status(
-                    test_id, TestStatus.RUNNING,
-                    progress=f"Running robustness tests ({pct}%)"
-                )
-                rd = await self._run_robust_tests(
-                    test_id, config, pct, completion_instance
+                    test_id, TestStatus.ERROR,
+                    progress="Test failed",
+                    error=err
                 )
-                combined["index_scores"] = rd.get("index_scores", {})
-                combined["robust_results"] = rd.get("robust_results", [])
+                return {"error": err}
+            batch = job.get("batch")
+            if non_robust:
+                combined["result_rows"] = job.get("result_rows", [0, 0])
+                combined["summary"] = job.get("summary", {})
+            if robust_present:
+                combined["index_scores"] = job.get("index_scores", {})
+                combined["robust_results"] = job.get("robust_results", [])
                 if combined["index_scores"]:
                     combined["overall_robust_score"] = (
                         sum(combined["index_scores"].values())
                         / len(combined["index_scores"])
                     )
+            logger.info(
+                f"[Celery] baseline completions for {test_id}: {baseline_memo.stats()}")
+            combined["completion_cache"] = completion_instance.cache_stats()
+            logger.info(
+                f"[Celery] completion cache for {test_id}: {combined['completion_cache']}")
+            combined["concurrency"] = get_concurrency(
+                config.model_provider, config.model).snapshot()
+            combined["retries"] = completion_instance.retry_stats()
+            logger.info(
+                f"[Celery] retries for {test_id}: {combined['retries']}")
             # final aggregation
             await self.status_manager.update_status(
                 test_id, TestStatus.RUNNING, progress="Calculating final scores"
             )
+            test_scores: List[Dict[str, Any]] = []
+            robust_scores: List[Dict[str, Any]] = []
+            if batch is not None:
+                test_scores = batch.score_records(*combined["result_rows"])
+                robust_scores = [
+                    {**entry, "results": batch.score_records(*entry["rows"])}
+                    for entry in combined["robust_results"]
+                ]
+                combined["batch"] = batch.to_payload()
             agg = ResultAggregator.aggregate(
                 combined["index_scores"],
                 combined["summary"],
-                combined["robust_results"],
-                combined["results"]
+                robust_scores,
+                test_scores
             )
             combined.update(agg)
             final = convert_numpy_types(combined)
+            if job.get("aborted"):
+                # Keep the checkpoint so the job can be resumed, and do not
+                # overwrite the abort with a completed status
+                await self.status_manager.update_status(
+                    test_id, TestStatus.ABORTED,
+                    progress="Test aborted by user",
+                    results=final
+                )
+                return final
+            JobCheckpoint(test_id).clear()
             # mark completed
             await self.status_manager.update_status(
                 test_id, TestStatus.COMPLETED,
@@ -184,9 +202,26 @@ class TestProcessor:
             raise
 
 
-@celery_app.task(bind=True, name='process_test_task')
+# Times a delivery that finds the test's run lock held waits for it
+RUN_LOCK_RETRIES = 3
+
+
+# acks_late + reject_on_worker_lost: if the worker dies mid-run the task
+# is redelivered, and process_job picks the job up from its checkpoint.
+# The run lock keeps a second delivery from running the same test while
+# the first worker is still alive.
+@celery_app.task(bind=True, name=PROCESS_TEST_TASK, acks_late=True, reject_on_worker_lost=True)
 def process_test_task(self, config_json: str):
     cfg = TestConfig.parse_raw(config_json)
+    run_lock = JobRunLock(cfg.test_id)
+    if not run_lock.acquire():
+        # The holder may be a worker process that just died (its task is
+        # redelivered at once); its lock expires within RUN_LOCK_TTL
+        if self.request.retries < RUN_LOCK_RETRIES:
+            raise self.retry(countdown=RUN_LOCK_TTL, max_retries=RUN_LOCK_RETRIES)
+        logger.warning(
+            f"[Celery] {cfg.test_id} is still running on another worker; dropping this delivery")
+        return {"skipped": True, "status": TestStatus.RUNNING.value}
     processor = TestProcessor()
     processor.status_manager.reset()
     loop = asyncio.new_event_loop()
@@ -194,4 +229,6 @@ def process_test_task(self, config_json: str):
     try:
         return loop.run_until_complete(processor.process_test(cfg))
     finally:
+        loop.run_until_complete(redis_pools.close_loop_pools())
         loop.close()
+        run_lock.release()
@@ -1,18 +1,45 @@
 # api/services/test_status_manager.py
+"""
+Test status shared between the API and the workers through Redis.
+
+Each piece of a test lives under its own key, so a status change only
+writes the few fields that changed:
+
+    test:{id}           hash of status fields (TestInfo without results)
+    test_progress:{id}  live counters kept by the worker (job_progress)
+
+Final results are written once, compressed in chunks, and only read
+page by page when a client asks for them (see result_store).
+
+Messages on test_status:{id} carry only the changed fields plus test_id
+and the new version. Every write bumps the hash's version field, which
+lets the API process keep a small cache of status reads that the
+messages keep current (see start_listener). Celery tasks, each on a loop
+of its own, do not listen and always read from Redis.
+"""
 
 from __future__ import annotations
 
 import asyncio
 import json
 import logging
+import time
+from collections import OrderedDict
 from dataclasses import asdict, dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.exceptions import ResponseError
 
 import redis.asyncio as redis
 
 from api.config import Settings
+from api.utils.redis_pool import redis_pools
+from api.utils.abort_handler import ABORT_KEY_TTL, abort_key
+from api.services import result_store
+from api.services.job_checkpoint import run_lock_key
+from api.services.job_progress import parse_progress, partial_results_key, progress_key
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +62,11 @@ class TestInfo:
     status: TestStatus
     progress: str
     error: Optional[str] = None
-    results: Optional[Dict[str, Any]] = None
+    results_available: bool = False
     started_at: Optional[float] = None
     completed_at: Optional[float] = None
     runtime_seconds: Optional[float] = None
+    version: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
         data = asdict(self)
@@ -52,44 +80,124 @@ class TestInfo:
         return cls(**data)
 
 
+# Status hash fields that are not stored as plain strings
+_FLOAT_FIELDS = ("started_at", "completed_at", "runtime_seconds")
+TERMINAL_STATUSES = (TestStatus.COMPLETED, TestStatus.ERROR, TestStatus.ABORTED)
+# Finished tests (status and results) are kept this long
+FINISHED_TTL_SECONDS = 86_400
+# Cached status reads per process, and how long one is trusted without
+# a message confirming it (the bound on staleness if a message is lost)
+CACHE_SIZE = 1000
+CACHE_TTL_SECONDS = 2.0
+
+
+def _status_key(test_id: str) -> str:
+    return f"test:{test_id}"
+
+
+def _channel(test_id: str) -> str:
+    return f"test_status:{test_id}"
+
+
+# Applies one status change if the test exists as a status hash: writes
+# the changed fields (ARGV[5..], field/value pairs), sets the expiry of a
+# finished test (ARGV[3] seconds, 0 for none) and publishes the delta
+# (ARGV[2]) on ARGV[1]. A finished test (ARGV[4] = completion time) also
+# gets its runtime from the stored started_at. The version field is bumped and sent with the delta.
+# Returns the published delta, or false when the test is missing or not
+# stored as a hash.
+_UPDATE_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return false
+end
+local delta = cjson.decode(ARGV[2])
+local fields = {}
+for i = 5, #ARGV do
+    fields[#fields + 1] = ARGV[i]
+end
+if ARGV[4] ~= '' then
+    local started = tonumber(redis.call('HGET', KEYS[1], 'started_at'))
+    if started then
+        local runtime = tonumber(ARGV[4]) - started
+        fields[#fields + 1] = 'runtime_seconds'
+        fields[#fields + 1] = string.format('%.6f', runtime)
+        delta['runtime_seconds'] = runtime
+    end
+end
+redis.call('HSET', KEYS[1], unpack(fields))
+delta['version'] = redis.call('HINCRBY', KEYS[1], 'version', 1)
+local ttl = tonumber(ARGV[3])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+local message = cjson.encode(delta)
+redis.call('PUBLISH', ARGV[1], message)
+return message
+"""
+
+
+def _encode_fields(fields: Dict[str, Any]) -> Dict[str, str]:
+    """Status fields as hash values; None fields are left out."""
+    encoded = {}
+    for name, value in fields.items():
+        if value is None:
+            continue
+        if isinstance(value, TestStatus):
+            value = value.value
+        elif isinstance(value, bool):
+            value = int(value)
+        encoded[name] = str(value)
+    return encoded
+
+
+def _decode_fields(raw: Dict[str, str]) -> Dict[str, Any]:
+    data: Dict[str, Any] = dict(raw)
+    for name in _FLOAT_FIELDS:
+        if name in data:
+            data[name] = float(data[name])
+    if "version" in data:
+        data["version"] = int(data["version"])
+    if "results_available" in data:
+        data["results_available"] = data["results_available"] == "1"
+    return data
+
+
 class TestStatusManager:
     """
     Lazily creates a Redis connection (and PubSub) inside
     the *current* event loop, and auto-rebinds when the loop changes.
+
+    Writes take no lock: each one is a single atomic round trip (a MULTI
+    pipeline or a Lua script), so updates of different tests never wait
+    on each other.
     """
 
     def __init__(self, redis_url: str):
         self._redis_url = redis_url
         self._redis: Optional[redis.Redis] = None
         self._pubsub: Optional[redis.client.PubSub] = None
-        self._local_cache: Dict[str, TestInfo] = {}
-        # no lock yet
-        self._lock: Optional[asyncio.Lock] = None
-
-    def _get_lock(self) -> asyncio.Lock:
-        loop = asyncio.get_running_loop()
-        # if uninitialized or bound to a different loop, (re)create it
-        if self._lock is None or getattr(self._lock, "_loop", None) is not loop:
-            self._lock = asyncio.Lock()
-        return self._lock
+        # test_id -> (info, monotonic time it stops being trusted)
+        self._local_cache: "OrderedDict[str, Tuple[TestInfo, float]]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+        # Only a process that called start_listener caches status reads
+        self._listening = False
 
     def reset(self):
         """
-        Clear any loop-bound clients & locks so that the next use
+        Clear any loop-bound clients so that the next use
         will re-create them on whichever loop is active.
         """
         self._redis = None
         self._pubsub = None
-        self._lock = None
+        self._listener = None
+        self._listening = False
         self._local_cache.clear()
 
     # ---------- lazy resources ----------
 
     def _get_redis(self) -> redis.Redis:
         if self._redis is None:
-            self._redis = redis.from_url(
-                self._redis_url, decode_responses=True
-            )
+            self._redis = redis_pools.async_client(self._redis_url)
         return self._redis
 
     def _get_pubsub(self) -> redis.client.PubSub:
@@ -102,20 +210,24 @@ class TestStatusManager:
     async def create_test(
         self, test_id: str, project_id: str, user_id: str
     ) -> TestInfo:
-        async with self._get_lock():
-            test_info = TestInfo(
-                test_id=test_id,
-                project_id=project_id,
-                user_id=user_id,
-                status=TestStatus.INITIALIZING,
-                progress="Test created",
-                started_at=datetime.now().timestamp(),
-            )
-            await self._store_in_redis(test_info)
-            self._local_cache[test_id] = test_info
-            await self._publish_status_update(test_info)
-            logger.info("Created test %s", test_id)
-            return test_info
+        test_info = TestInfo(
+            test_id=test_id,
+            project_id=project_id,
+            user_id=user_id,
+            status=TestStatus.INITIALIZING,
+            progress="Test created",
+            started_at=datetime.now().timestamp(),
+            version=1,
+        )
+        fields = _encode_fields(test_info.to_dict())
+        pipe = self._get_redis().pipeline(transaction=True)
+        pipe.delete(_status_key(test_id))
+        pipe.hset(_status_key(test_id), mapping=fields)
+        pipe.publish(_channel(test_id), json.dumps(test_info.to_dict()))
+        await pipe.execute()
+        self._remember(test_info)
+        logger.info("Created test %s", test_id)
+        return test_info
 
     async def update_status(
         self,
@@ -125,49 +237,120 @@ class TestStatusManager:
         error: Optional[str] = None,
         results: Optional[Dict[str, Any]] = None,
     ) -> bool:
-        async with self._get_lock():
-            test_info = await self.get_test(test_id)
-            if not test_info:
-                logger.warning("Test %s not found for update", test_id)
-                return False
-
-            test_info.status = status
-            if progress:
-                test_info.progress = progress
-            if error:
-                test_info.error = error
-            if results:
-                test_info.results = results
-
-            now = datetime.now().timestamp()
-            if status in (TestStatus.COMPLETED, TestStatus.ERROR, TestStatus.ABORTED):
-                test_info.completed_at = now
-                if test_info.started_at:
-                    test_info.runtime_seconds = now - test_info.started_at
-
-            await self._store_in_redis(test_info)
-            self._local_cache[test_id] = test_info
-            await self._publish_status_update(test_info)
-            logger.info("Updated test %s → %s", test_id, status.value)
-            return True
-
-    async def get_test(self, test_id: str) -> Optional[TestInfo]:
-        if test_id in self._local_cache:
-            return self._local_cache[test_id]
+        changes: Dict[str, Any] = {"status": status}
+        if progress:
+            changes["progress"] = progress
+        if error:
+            changes["error"] = error
+        if results:
+            changes["results_available"] = True
+        finished = status in TERMINAL_STATUSES
+        now = datetime.now().timestamp()
+        if finished:
+            changes["completed_at"] = now
+
+        fields = _encode_fields(changes)
+        args = [
+            _channel(test_id),
+            json.dumps({"test_id": test_id, **_decode_fields(fields)}),
+            FINISHED_TTL_SECONDS if finished else 0,
+            now if finished else "",
+        ]
+        for name, value in fields.items():
+            args += [name, value]
+        r = self._get_redis()
+        if results:
+            # Stored before the status says they are available
+            await result_store.save_results(r, test_id, results, FINISHED_TTL_SECONDS)
+        message = await r.eval(_UPDATE_SCRIPT, 1, _status_key(test_id), *args)
+        # Missing, or still in the single-JSON format: reading migrates it
+        if message is None and await self._get_from_redis(test_id):
+            message = await r.eval(_UPDATE_SCRIPT, 1, _status_key(test_id), *args)
+        if message is None:
+            logger.warning("Test %s not found for update", test_id)
+            return False
+
+        self._apply_delta(json.loads(message))
+        logger.info("Updated test %s → %s", test_id, status.value)
+        return True
+
+    async def get_test(self, test_id: str, refresh: bool = False) -> Optional[TestInfo]:
+        """The test's status; refresh=True skips this process's cache."""
+        self._ensure_listener()
+        entry = self._local_cache.get(test_id)
+        if not refresh and entry is not None and entry[1] > time.monotonic():
+            self._local_cache.move_to_end(test_id)
+            return entry[0]
 
         data = await self._get_from_redis(test_id)
         if data:
-            info = TestInfo.from_dict(data)
-            self._local_cache[test_id] = info
-            return info
+            return self._remember(TestInfo.from_dict(data))
+        self._local_cache.pop(test_id, None)
         return None
 
+    async def get_result_meta(self, test_id: str) -> Optional[Dict[str, Any]]:
+        """Scores, precomputed summaries and row layout of a test's results."""
+        return await result_store.load_meta(self._get_redis(), test_id)
+
+    async def get_result_index(self, test_id: str) -> Optional[Dict[str, Any]]:
+        """Topic, fail flag and scores of every stored test, for filtering."""
+        return await result_store.load_index(self._get_redis(), test_id)
+
+    async def get_result_rows(self, test_id: str, meta: Dict[str, Any],
+                              positions: List[int]) -> List[Dict[str, Any]]:
+        return await result_store.load_rows(self._get_redis(), test_id, meta, positions)
+
+    async def request_abort(self, test_id: str):
+        """Raise the shared abort flag the worker running the test polls."""
+        await self._get_redis().set(abort_key(test_id), 1, ex=ABORT_KEY_TTL)
+
+    async def clear_abort(self, test_id: str):
+        await self._get_redis().delete(abort_key(test_id))
+
+    async def get_progress(self, test_id: str) -> Optional[Dict[str, Any]]:
+        """Structured counters of a running (or finished) job, if it has any."""
+        raw = await self._get_redis().hgetall(progress_key(test_id))
+        return parse_progress(raw) if raw else None
+
+    async def worker_alive(self, test_id: str, stale_seconds: float) -> bool:
+        """
+        Whether a worker is still running the test: it holds the test's
+        run lock, or the job's progress moved within stale_seconds.
+        """
+        pipe = self._get_redis().pipeline(transaction=False)
+        pipe.exists(run_lock_key(test_id))
+        pipe.hget(progress_key(test_id), "updated_at")
+        locked, updated_at = await pipe.execute()
+        if locked:
+            return True
+        return bool(updated_at) and time.time() - float(updated_at) < stale_seconds
+
+    async def get_partial_results(self, test_id: str, offset: int, limit: int) -> Dict[str, Any]:
+        """Tests finished so far, in completion order."""
+        r = self._get_redis()
+        key = partial_results_key(test_id)
+        total = await r.llen(key)
+        rows = await r.lrange(key, offset, offset + limit - 1) if limit > 0 else []
+        return {
+            "results": [json.loads(row) for row in rows],
+            "offset": offset,
+            "total": total,
+        }
+
+    async def save_config(self, test_id: str, config_json: str, ttl_seconds: int):
+        """Keep a job's TestConfig so the job can be resumed later."""
+        await self._get_redis().set(f"test_config:{test_id}", config_json, ex=ttl_seconds)
+
+    async def get_config(self, test_id: str) -> Optional[str]:
+        return await self._get_redis().get(f"test_config:{test_id}")
+
     async def subscribe_to_test(self, test_id: str, callback):
-        channel = f"test_status:{test_id}"
+        """Call `callback` with each status delta (changed fields plus test_id)."""
+        channel = _channel(test_id)
 
         async def handler(message):
             if message["type"] == "message":
-                await callback(TestInfo.from_dict(json.loads(message["data"])))
+                await callback(json.loads(message["data"]))
 
         await self._get_pubsub().subscribe(**{channel: handler})
         logger.info("Subscribed to %s", channel)
@@ -175,30 +358,129 @@ class TestStatusManager:
     async def cleanup_old_tests(self, max_age_seconds: int = 86_400):
         now = datetime.now().timestamp()
         removed = 0
-        async with self._get_lock():
-            for tid, info in list(self._local_cache.items()):
-                if info.completed_at and now - info.completed_at > max_age_seconds:
-                    del self._local_cache[tid]
-                    removed += 1
+        for tid, (info, expires) in list(self._local_cache.items()):
+            finished_long_ago = info.completed_at and now - info.completed_at > max_age_seconds
+            if finished_long_ago or expires <= time.monotonic():
+                del self._local_cache[tid]
+                removed += 1
         logger.info("Cleaned %d old tests from cache", removed)
 
-    # ---------- internal helpers ----------
+    # ---------- local cache ----------
 
-    async def _store_in_redis(self, info: TestInfo):
-        r = self._get_redis()
-        key = f"test:{info.test_id}"
-        await r.set(key, json.dumps(info.to_dict()))
-        if info.status in (TestStatus.COMPLETED, TestStatus.ERROR, TestStatus.ABORTED):
-            await r.expire(key, 86_400)
+    def _remember(self, info: TestInfo) -> TestInfo:
+        """Cache a status read unless a newer version is already cached."""
+        if not self._listening:
+            # Nothing would keep the entry current
+            return info
+        entry = self._local_cache.get(info.test_id)
+        if entry is not None and entry[0].version > info.version:
+            info = entry[0]
+        self._local_cache[info.test_id] = (info, time.monotonic() + CACHE_TTL_SECONDS)
+        self._local_cache.move_to_end(info.test_id)
+        while len(self._local_cache) > CACHE_SIZE:
+            self._local_cache.popitem(last=False)
+        return info
+
+    def _apply_delta(self, delta: Dict[str, Any]):
+        """
+        Bring a cached status up to date with a published delta. Deltas
+        already reflected in the cache are ignored; when one was missed,
+        the entry is dropped and the next read goes to Redis.
+        """
+        test_id = delta.get("test_id")
+        entry = self._local_cache.get(test_id)
+        version = delta.get("version")
+        if entry is None or version is None:
+            return
+        info = entry[0]
+        if version <= info.version:
+            return
+        if version != info.version + 1:
+            del self._local_cache[test_id]
+            return
+        for name, value in delta.items():
+            setattr(info, name, TestStatus(value) if name == "status" else value)
+        self._local_cache[test_id] = (info, time.monotonic() + CACHE_TTL_SECONDS)
+
+    async def start_listener(self):
+        """
+        Keep this process's status cache current from the published
+        deltas, on the running loop. Called once by the API at startup.
+        """
+        self._listening = True
+        self._ensure_listener()
+
+    async def stop_listener(self):
+        """Stop listening (before the loop's pools close) and drop the cache."""
+        self._listening = False
+        listener, self._listener = self._listener, None
+        if listener is not None and not listener.done():
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+        self._local_cache.clear()
 
-    async def _get_from_redis(self, test_id: str) -> Optional[Dict[str, Any]]:
-        data = await self._get_redis().get(f"test:{test_id}")
-        return json.loads(data) if data else None
+    def _ensure_listener(self):
+        """Restart the listener of a listening process if it stopped."""
+        if not self._listening:
+            return
+        loop = asyncio.get_running_loop()
+        if self._listener is None or self._listener.done() or self._listener.get_loop() is not loop:
+            self._listener = loop.create_task(self._listen())
+
+    async def _listen(self):
+        """Apply every status message to the cache of this process."""
+        pubsub = self._get_redis().pubsub()
+        try:
+            await pubsub.psubscribe(_channel("*"))
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message["type"] == "pmessage":
+                    self._apply_delta(json.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Entries may have missed updates; the next read restarts the listener
+            logger.warning("Status cache listener stopped: %s", e)
+            self._local_cache.clear()
+        finally:
+            await pubsub.aclose()
 
-    async def _publish_status_update(self, info: TestInfo):
-        await self._get_redis().publish(
-            f"test_status:{info.test_id}", json.dumps(info.to_dict())
-        )
+    # ---------- internal helpers ----------
+
+    async def _get_from_redis(self, test_id: str) -> Optional[Dict[str, Any]]:
+        r = self._get_redis()
+        try:
+            raw = await r.hgetall(_status_key(test_id))
+        except ResponseError:
+            return await self._migrate_legacy(test_id)
+        return _decode_fields(raw) if raw else None
+
+    async def _migrate_legacy(self, test_id: str) -> Optional[Dict[str, Any]]:
+        """Split a test stored as one JSON string (status plus results) into the new keys."""
+        r = self._get_redis()
+        key = _status_key(test_id)
+        data = await r.get(key)
+        if not data:
+            return None
+        info = json.loads(data)
+        results = info.pop("results", None)
+        info["results_available"] = bool(results)
+        ttl = await r.ttl(key)
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping=_encode_fields(info))
+        if results:
+            # Chunked by result_store when first read
+            pipe.set(result_store.legacy_key(test_id), json.dumps(results))
+        if ttl > 0:
+            pipe.expire(key, ttl)
+            pipe.expire(result_store.legacy_key(test_id), ttl)
+        await pipe.execute()
+        logger.info("Migrated stored status of test %s", test_id)
+        return _decode_fields(_encode_fields(info))
 
 
 # ---------------- singleton ----------------
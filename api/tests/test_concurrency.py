@@ -0,0 +1,68 @@
+# api/tests/test_concurrency.py
+
+import asyncio
+
+import pytest
+
+from api.PromptOps import concurrency
+from api.PromptOps.concurrency import AdaptiveConcurrency, is_overload_error
+
+
+def test_success_grows_the_window_additively():
+    controller = AdaptiveConcurrency("p/m", max_window=10, initial_window=4)
+    controller.on_success(1.0)
+    assert controller.window == pytest.approx(4.25)
+    for _ in range(100):
+        controller.on_success(1.0)
+    assert controller.window == 10
+
+
+def test_slow_responses_hold_the_window():
+    controller = AdaptiveConcurrency("p/m", max_window=10, initial_window=4)
+    controller.on_success(1.0)
+    window = controller.window
+    controller.on_success(concurrency.LATENCY_TOLERANCE * 1.0 + 1.0)
+    assert controller.window == window
+
+
+def test_overload_halves_the_window_once_per_cooldown():
+    controller = AdaptiveConcurrency("p/m", max_window=32, initial_window=16)
+    controller.on_overload()
+    assert controller.window == 8
+    controller.on_overload()
+    assert controller.window == 8
+    assert controller.overloads == 2
+
+
+def test_window_never_drops_below_the_minimum(monkeypatch):
+    monkeypatch.setattr(concurrency, "DECREASE_COOLDOWN", 0)
+    controller = AdaptiveConcurrency("p/m", max_window=8, initial_window=3, min_window=2)
+    controller.on_overload()
+    controller.on_overload()
+    assert controller.window == 2
+
+
+def test_slot_feeds_outcomes_back():
+    controller = AdaptiveConcurrency("p/m", max_window=16, initial_window=8)
+
+    async def run():
+        async with controller.slot():
+            assert controller.in_flight == 1
+        with pytest.raises(RuntimeError):
+            async with controller.slot():
+                raise RuntimeError("429 Too Many Requests")
+
+    asyncio.run(run())
+    assert controller.in_flight == 0
+    assert controller.successes == 1
+    assert controller.window == pytest.approx((8 + 1 / 8) / 2)
+
+
+@pytest.mark.parametrize("error, overload", [
+    (asyncio.TimeoutError(), True),
+    (Exception("Rate limit reached"), True),
+    (Exception("model is overloaded"), True),
+    (ValueError("invalid prompt"), False),
+])
+def test_is_overload_error(error, overload):
+    assert is_overload_error(error) is overload
@@ -0,0 +1,92 @@
+# api/tests/test_result_store.py
+
+from api.core.result_pages import build_rows
+from api.services import result_store
+from api.services.result_store import _decompress, pack, select
+
+
+def _row(i, test_type="typos", fail=False, score_perturb=0.5):
+    return {
+        "name": f"t{i}",
+        "description": None,
+        "test_type": test_type,
+        "prompt": f"prompt {i % 3}",
+        "expected_result": "expected",
+        "perturb_text": f"perturbed {i}",
+        "pass_condition": "increase",
+        "response_original": "answer",
+        "response_perturb": f"answer {i}",
+        "score_original": 0.9,
+        "score_perturb": score_perturb,
+        "fail": fail,
+    }
+
+
+def _results(monkeypatch, chunk_rows=2):
+    monkeypatch.setattr(result_store, "CHUNK_ROWS", chunk_rows)
+    topic_rows = [_row(0, fail=True, score_perturb=0.1), _row(1),
+                  _row(2, test_type="negation", score_perturb=None)]
+    robust_rows = [_row(3, test_type=None, score_perturb=0.7), _row(4, test_type=None, fail=True)]
+    return {
+        "results": topic_rows,
+        "robust_results": [{"Original_Question_Index": 0, "score": 50.0, "results": robust_rows}],
+        "overall_score": 66.7,
+    }, topic_rows + robust_rows
+
+
+def _stored_rows(meta, chunks, positions):
+    size = meta["chunk_rows"]
+    rows = []
+    for pos in positions:
+        chunk = _decompress(chunks[pos // size])
+        rows.extend(build_rows(chunk, pos % size, pos % size + 1))
+    return rows
+
+
+def test_pack_round_trips_rows_through_chunks(monkeypatch):
+    results, rows = _results(monkeypatch)
+    meta, index, chunks = pack(results)
+    assert meta["total_rows"] == 5
+    assert len(chunks) == 3
+    assert meta["result_rows"] == [0, 3]
+    assert meta["robust_results"] == [{"Original_Question_Index": 0, "score": 50.0, "rows": [3, 5]}]
+    assert meta["overall_score"] == 66.7
+    assert _stored_rows(meta, chunks, range(5)) == rows
+
+
+def test_pack_precomputes_summaries(monkeypatch):
+    results, _ = _results(monkeypatch)
+    meta, _, _ = pack(results)
+    summaries = meta["summaries"]
+    assert summaries["results"] == {"total_tests": 3, "failures": 1, "passes": 2,
+                                    "pass_rate": 2 / 3 * 100}
+    assert set(summaries["topics"]) == {"typos", "negation", "robustness"}
+    assert summaries["topics"]["typos"]["mean_score_perturb"] == 0.3
+    assert summaries["topics"]["negation"]["mean_score_perturb"] is None
+    assert summaries["topics"]["robustness"]["failures"] == 1
+
+
+def test_select_filters_then_rows_load(monkeypatch):
+    results, rows = _results(monkeypatch)
+    meta, index, chunks = pack(results)
+    assert select(index) == [0, 1, 2, 3, 4]
+    assert select(index, topic="typos") == [0, 1]
+    assert select(index, topic="missing") == []
+    assert select(index, outcome="fail") == [0, 4]
+    assert select(index, topic="robustness", outcome="pass") == [3]
+    assert select(index, min_score=0.5) == [1, 3, 4]
+    assert select(index, max_score=0.5) == [0, 1, 4]
+    assert select(index, score_field="score_original", min_score=0.95) == []
+    positions = select(index, outcome="fail")
+    assert _stored_rows(meta, chunks, positions) == [rows[0], rows[4]]
+
+
+def test_pack_keeps_batch_payloads_columnar(monkeypatch):
+    results, rows = _results(monkeypatch, chunk_rows=500)
+    meta, _, chunks = pack(results)
+    payload = _decompress(chunks[0])
+    meta, index, chunks = pack({"batch": payload, "result_rows": [0, 3],
+                                "robust_results": [{"Original_Question_Index": 0, "rows": [3, 5]}]})
+    assert meta["result_rows"] == [0, 3]
+    assert index["topics"] == ["typos", "negation", "robustness"]
+    assert _stored_rows(meta, chunks, range(5)) == rows
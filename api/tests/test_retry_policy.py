@@ -0,0 +1,157 @@
+# api/tests/test_retry_policy.py
+
+import asyncio
+import socket
+import time
+from email.utils import formatdate
+
+import pytest
+
+from api.PromptOps.retry_policy import (
+    FATAL, RATE_LIMITED, TRANSIENT, UNKNOWN,
+    CircuitBreaker, CircuitOpenError, RetryBudget,
+    classify_error, retry_after_seconds,
+)
+
+
+class _Response:
+    def __init__(self, status_code=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class _HTTPError(Exception):
+    def __init__(self, message="", status_code=None, headers=None, code=None):
+        super().__init__(message)
+        self.response = _Response(status_code, headers)
+        if code is not None:
+            self.code = code
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+class ServiceUnavailableError(Exception):
+    pass
+
+
+# ---------- classify_error ----------
+
+@pytest.mark.parametrize("error, kind", [
+    (_HTTPError("slow down", status_code=429), RATE_LIMITED),
+    (RateLimitError("try later"), RATE_LIMITED),
+    (Exception("Too Many Requests"), RATE_LIMITED),
+    (_HTTPError("payment", status_code=402), FATAL),
+    (_HTTPError("You exceeded your current quota", status_code=429), FATAL),
+    (_HTTPError("quota", status_code=429, code="insufficient_quota"), FATAL),
+    (_HTTPError("bad request", status_code=400), FATAL),
+    (AuthenticationError("bad key"), FATAL),
+    (CircuitOpenError("open"), FATAL),
+    (_HTTPError("boom", status_code=503), TRANSIENT),
+    (ServiceUnavailableError("down"), TRANSIENT),
+    (ConnectionError("refused"), TRANSIENT),
+    (socket.timeout("timed out"), TRANSIENT),
+    (asyncio.TimeoutError(), TRANSIENT),
+    (ValueError("odd"), UNKNOWN),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+# ---------- retry_after_seconds ----------
+
+def test_retry_after_seconds_reads_seconds_and_milliseconds():
+    assert retry_after_seconds(_HTTPError(headers={"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(_HTTPError(headers={"Retry-After": "-3"})) == 0.0
+    assert retry_after_seconds(_HTTPError(headers={"retry-after-ms": "1500", "retry-after": "9"})) == 1.5
+
+
+def test_retry_after_seconds_reads_http_dates():
+    error = _HTTPError(headers={"retry-after": formatdate(time.time() + 30, usegmt=True)})
+    assert 25 <= retry_after_seconds(error) <= 30
+
+
+def test_retry_after_seconds_without_a_usable_header():
+    assert retry_after_seconds(ValueError("no response")) is None
+    assert retry_after_seconds(_HTTPError(headers={})) is None
+    assert retry_after_seconds(_HTTPError(headers={"retry-after": "soon"})) is None
+
+
+# ---------- RetryBudget ----------
+
+def test_retry_budget_allows_minimum_plus_ratio_of_requests():
+    budget = RetryBudget(ratio=0.5, min_retries=2)
+    assert budget.try_spend(1.0)
+    assert budget.try_spend(1.0)
+    assert not budget.try_spend(1.0)
+    for _ in range(4):
+        budget.record_request()
+    assert budget.try_spend(0.5)
+    assert budget.try_spend(0.5)
+    assert not budget.try_spend(0.5)
+    stats = budget.stats()
+    assert stats["retries"] == 4
+    assert stats["budget_exhausted"] == 2
+    assert stats["backoff_seconds"] == 3.0
+
+
+# ---------- CircuitBreaker ----------
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("p", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.on_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("p", failure_threshold=2, reset_timeout=60)
+    breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("p", failure_threshold=1, reset_timeout=0)
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.on_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = CircuitBreaker("p", failure_threshold=5, reset_timeout=0)
+    for _ in range(5):
+        breaker.on_failure()
+    breaker.before_call()
+    breaker.reset_timeout = 60
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_neutral_outcome_frees_the_probe():
+    breaker = CircuitBreaker("p", failure_threshold=1, reset_timeout=0)
+    breaker.on_failure()
+    breaker.before_call()
+    breaker.on_neutral()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
@@ -0,0 +1,107 @@
+# api/tests/test_test_batch.py
+
+import math
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("litellm")
+
+# Aliased so pytest does not try to collect them as test classes
+from api.PromptOps.test import Test as PromptTest  # noqa: E402
+from api.PromptOps.test_batch import StringTable, TestBatch as Batch  # noqa: E402
+
+
+def _result(original="a", perturb="b", score_original=None, score_perturb=None, error=None):
+    return SimpleNamespace(original_response=original, perturb_response=perturb, error=error,
+                           score_original=score_original, score_perturb=score_perturb)
+
+
+def _batch(rows):
+    """rows: (test_type, pass_condition, score_original, score_perturb)"""
+    batch = Batch()
+    for i, (test_type, condition, original, perturb) in enumerate(rows):
+        pos = batch.add(f"t{i}", "prompt", "expected", perturb_text="perturbed",
+                        pass_condition=condition, test_type=test_type)
+        batch.store(pos, _result(score_original=original, score_perturb=perturb))
+    return batch
+
+
+def _summarized_fail(condition, original, perturb):
+    test = PromptTest("t", "prompt", "expected", perturb_text="perturbed", pass_condition=condition)
+    test.score_original, test.score_perturb = original, perturb
+    return test.summarize()["fail"]
+
+
+def test_string_table_keeps_types_apart():
+    table = StringTable()
+    codes = [table.intern(v) for v in (1, True, 1.0, "1", 1)]
+    assert codes == [0, 1, 2, 3, 0]
+    assert table.intern(None) == -1
+    assert table[1] is True
+    assert table.code(True) == 1
+    assert table.code("missing") == -2
+
+
+@pytest.mark.parametrize("condition, original, perturb", [
+    ("increase", 0.9, 0.95),
+    ("increase", 0.9, 0.85),
+    ("increase", 0.7, 0.95),
+    ("decrease", 0.9, 0.5),
+    ("decrease", 0.5, 0.5),
+    ("increase", None, 0.9),
+    ("decrease", 0.9, None),
+])
+def test_fail_mask_matches_test_summarize(condition, original, perturb):
+    batch = _batch([("typos", condition, original, perturb)])
+    assert bool(batch.fail_mask()[0]) == _summarized_fail(condition, original, perturb)
+
+
+def test_fail_mask_follows_new_scores():
+    batch = _batch([("typos", "increase", 0.9, 0.95)])
+    assert not batch.fail_mask()[0]
+    batch.store(0, _result(score_original=0.9, score_perturb=0.1))
+    assert batch.fail_mask()[0]
+
+
+def test_summarize_counts_by_test_type():
+    batch = _batch([
+        ("typos", "increase", 0.9, 0.95),
+        ("typos", "increase", 0.9, 0.5),
+        ("negation", "decrease", 0.9, 0.2),
+        ("negation", "decrease", 0.9, 0.95),
+    ])
+    summary = batch.summarize(aborted=True, test_id="job")
+    assert summary["total_tests"] == 4
+    assert summary["failures"] == 2
+    assert summary["passes"] == 2
+    assert summary["pass_rate"] == 50
+    assert summary["aborted"] is True
+    assert summary["test_id"] == "job"
+    assert summary["by_test_type"] == {
+        "typos": {"total": 2, "failures": 1, "passes": 1, "pass_rate": 50},
+        "negation": {"total": 2, "failures": 1, "passes": 1, "pass_rate": 50},
+    }
+
+
+def test_summarize_a_row_range():
+    batch = _batch([
+        ("typos", "increase", 0.9, 0.5),
+        ("negation", "decrease", 0.9, 0.2),
+        ("negation", "decrease", 0.9, 0.2),
+    ])
+    summary = batch.summarize(1, 3)
+    assert summary["total_tests"] == 2
+    assert summary["failures"] == 0
+    assert list(summary["by_test_type"]) == ["negation"]
+    assert batch.summarize(3, 3) == {
+        "total_tests": 0, "failures": 0, "passes": 0, "pass_rate": 0, "by_test_type": {}}
+
+
+def test_payload_round_trip():
+    batch = _batch([("typos", "increase", 0.9, 0.5), ("negation", "decrease", None, None)])
+    batch.store(1, _result(original="ERROR: boom", perturb=None, error="ERROR: boom"))
+    rebuilt = Batch.from_payload(batch.to_payload())
+    assert rebuilt.records() == batch.records()
+    assert list(rebuilt.ran) == [1, 1]
+    assert math.isnan(rebuilt.score_original[1])
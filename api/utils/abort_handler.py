@@ -1,25 +1,91 @@
 # utils/abort_handler.py
 
+import os
 import time
 import threading
 import uuid
 import logging
-from typing import Dict, Any, Callable, Optional
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import redis
+
+from api.config import Settings
+from api.utils.redis_pool import redis_pools
 
 logger = logging.getLogger(__name__)
 
+# How long a "not aborted" answer from Redis is trusted before asking again
+ABORT_CACHE_SECONDS = float(os.getenv("ABORT_CACHE_SECONDS", "0.5"))
+# Abort flags outlive any test run
+ABORT_KEY_TTL = 86_400
+# After a Redis error, only use local flags for this long
+REDIS_RETRY_INTERVAL = 30.0
+
+
+def abort_key(test_id: str) -> str:
+    """Redis key that marks a test as aborted, for every process."""
+    return f"test_abort:{test_id}"
+
 
 class AbortHandler:
     """
     Utility class to manage active tests and handle aborts.
     This is designed to be a singleton across the FastAPI application.
+
+    Aborts are also signalled through Redis (abort_key), so a request
+    handled by the API process reaches the Celery worker running the
+    test. Workers read the key at most every ABORT_CACHE_SECONDS per
+    test; once seen, the abort is remembered locally.
     """
 
-    def __init__(self):
+    def __init__(self, redis_url: Optional[str] = None):
         self.active_tests: Dict[str, Dict[str, Any]] = {}
         self.cleanup_lock = threading.Lock()
+        self._redis_url = redis_url
+        self._redis: Optional[redis.Redis] = None
+        self._redis_down_until = 0.0
+        # test_id -> (checked_at, aborted) for the last Redis lookup
+        self._remote_flags: Dict[str, Tuple[float, bool]] = {}
         self._start_cleanup_thread()
 
+    def _client(self) -> Optional[redis.Redis]:
+        if not self._redis_url or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = redis_pools.sync_client(self._redis_url)
+        return self._redis
+
+    def _mark_redis_down(self, e: Exception):
+        logger.warning(
+            f"Abort flags unavailable in Redis, using local flags for {REDIS_RETRY_INTERVAL:.0f}s: {e}")
+        self._redis_down_until = time.time() + REDIS_RETRY_INTERVAL
+
+    def _remote_aborted(self, test_id: str) -> bool:
+        now = time.monotonic()
+        checked_at, aborted = self._remote_flags.get(test_id, (0.0, False))
+        if aborted or now - checked_at < ABORT_CACHE_SECONDS:
+            return aborted
+        client = self._client()
+        if client is None:
+            return False
+        try:
+            aborted = bool(client.exists(abort_key(test_id)))
+        except redis.RedisError as e:
+            self._mark_redis_down(e)
+            return False
+        self._remote_flags[test_id] = (now, aborted)
+        return aborted
+
+    def signal_abort(self, test_id: str):
+        """Set the shared abort flag so every process sees the abort."""
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.set(abort_key(test_id), 1, ex=ABORT_KEY_TTL)
+        except redis.RedisError as e:
+            self._mark_redis_down(e)
+
     def register_test(self, test_id: Optional[str] = None) -> str:
         """
         Register a new test in the abort handler.
@@ -53,12 +119,32 @@ class AbortHandler:
         Returns:
             True if the test has been aborted, False otherwise
         """
-        if test_id not in self.active_tests:
-            return False
+        info = self.active_tests.get(test_id)
+        if info is not None:
+            # Update last activity time
+            info["last_activity"] = time.time()
+            if info["aborted"]:
+                return True
+
+        if self._remote_aborted(test_id):
+            if info is not None:
+                info["aborted"] = True
+            return True
+        return False
+
+    def set_progress(self, test_id: str, progress: str):
+        """
+        Record a test's current step. Tests that are no longer active
+        (completed, or pruned by cleanup_old_tests) are skipped.
 
-        # Update last activity time
-        self.active_tests[test_id]["last_activity"] = time.time()
-        return self.active_tests[test_id]["aborted"]
+        Args:
+            test_id: The test ID
+            progress: Description of the current step
+        """
+        info = self.active_tests.get(test_id)
+        if info is not None:
+            info["progress"] = progress
+            info["last_activity"] = time.time()
 
     def abort_test(self, test_id: str) -> bool:
         """
@@ -70,6 +156,7 @@ class AbortHandler:
         Returns:
             True if the test was found and aborted, False otherwise
         """
+        self.signal_abort(test_id)
         if test_id not in self.active_tests:
             logger.warning(f"Abort request for unknown test: {test_id}")
             return False
@@ -85,6 +172,7 @@ class AbortHandler:
         Args:
             test_id: The test ID to complete
         """
+        self._remote_flags.pop(test_id, None)
         if test_id in self.active_tests:
             with self.cleanup_lock:
                 logger.info(f"Completing test {test_id}")
@@ -136,7 +224,7 @@ class AbortHandler:
 
 
 # Create a singleton instance
-abort_handler = AbortHandler()
+abort_handler = AbortHandler(Settings().REDIS_URL)
 
 
 def check_abort(test_id: str, interval: int = 10) -> bool:
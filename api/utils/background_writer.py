@@ -0,0 +1,30 @@
+# api/utils/background_writer.py
+"""
+Redis writes handed off to a thread of their own.
+
+Job checkpoints and progress counters are updated while hundreds of LLM
+calls are in flight on the engine's event loop; a blocking round trip
+there would stall every one of them. A BackgroundWriter runs the writes
+on one thread, in the order they were submitted, and lets the loop wait
+for them without blocking when it needs them done.
+"""
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class BackgroundWriter:
+    """Runs submitted calls one at a time, in submission order, off the caller's thread."""
+
+    def __init__(self, name: str):
+        # The thread is started on first use and exits once the writer is
+        # garbage collected
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        return self._executor.submit(fn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn after every earlier submission, without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
@@ -4,6 +4,7 @@ api/utils/crypto.py
 Tiny helper that mirrors lib/encryption.ts (AES-256-CBC with IV prepended).
 
 • is_encrypted(text)  – quick regex check
+• encrypt_api_key(text) -> str
 • decrypt_api_key(text) -> str
 """
 
@@ -15,7 +16,7 @@ import hashlib
 from typing import Final
 
 from Crypto.Cipher import AES        # pycryptodome
-from Crypto.Util.Padding import unpad
+from Crypto.Util.Padding import pad, unpad
 
 
 # ---------- config ----------
@@ -79,6 +80,17 @@ def is_encrypted(text: str | None) -> bool:
     return bool(text) and bool(_ENC_RE.fullmatch(text))   # type: ignore[arg-type]
 
 
+def encrypt_api_key(plaintext: str) -> str:
+    """
+    Encrypt with AES-256-CBC and a random IV, as  ivHex:encryptedHex
+    (the same format encryptApiKey in lib/encryption.ts produces).
+    """
+    iv = os.urandom(AES.block_size)
+    cipher = AES.new(_get_key(), AES.MODE_CBC, iv=iv)
+    ciphertext = cipher.encrypt(pad(plaintext.encode("utf-8"), AES.block_size))
+    return f"{iv.hex()}:{ciphertext.hex()}"
+
+
 def decrypt_api_key(encrypted: str) -> str:
     """
     Decrypt a string of form  ivHex:encryptedHex  using AES-256-CBC.
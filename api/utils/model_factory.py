@@ -33,7 +33,8 @@ def create_completion(
     temperature=0,
     top_p=0,
     max_tokens=150,
-    stream=False
+    stream=False,
+    use_cache=True
 ):
     """
     Factory function to create PromptCompletion instances with standardized defaults.
@@ -65,7 +66,8 @@ def create_completion(
                 top_p=top_p,
                 max_tokens=max_tokens,
                 api_key=api_key,
-                stream=stream
+                stream=stream,
+                use_cache=use_cache
             )
             logging.info(f"Successfully created completion for {model_provider}/{model}")
             return completion
@@ -78,19 +80,15 @@ def create_completion(
         raise Exception(f"Failed to initialize model: {str(e)}")
 
 def configure_litellm_globals(model_provider, api_key=None):
-    """Configure global litellm settings based on the provider."""
+    """
+    Configure process-wide litellm settings. Credentials are deliberately
+    not set here: each PromptCompletion sends its own key and base URL.
+    """
     try:
         # Set global litellm configurations as needed
         litellm.verbose = False  # Set to True for debugging
         litellm.request_timeout = 30
-        litellm.num_retries = 3
-        
-        # Add any provider-specific global configurations
-        if model_provider == "openai" and api_key:
-            litellm.api_key = api_key
-        elif model_provider == "claude" and api_key:
-            litellm.api_key = api_key
-        elif model_provider == "gemini" and api_key:
-            litellm.api_key = api_key
+        # Retries are handled once, by PromptOps.retry_policy
+        litellm.num_retries = 0
     except Exception as e:
         logging.warning(f"Error configuring litellm globals: {str(e)}")
\ No newline at end of file
@@ -40,8 +40,72 @@ MODEL_RATE_LIMITS = {
         "typhoon-v2-70b-instruct": 20,
         "default": 20
     },
-    "custom": {
-        "default": 15
-    },
     "default": 15  # Global fallback for unspecified providers.
 }
+
+# Tokens per minute (prompt + completion). Providers without an entry are
+# only limited on requests per minute.
+MODEL_TOKEN_LIMITS = {
+    "openai": {
+        "gpt-4o": 30000,
+        "gpt-4-turbo": 30000,
+        "gpt-4": 10000,
+        "gpt-3.5-turbo": 60000,
+        "default": 10000
+    },
+    "claude": {
+        "claude-3-7-sonnet-20250219": 20000,
+        "claude-3-5-sonnet-20241022": 20000,
+        "claude-3-5-haiku-20241022": 25000,
+        "default": 20000
+    },
+    "anthropic": {
+        "claude-3-7-sonnet-20250219": 20000,
+        "claude-3-5-sonnet-20241022": 20000,
+        "claude-3-5-haiku-20241022": 25000,
+        "default": 20000
+    },
+    "gemini": {
+        "default": 32000
+    },
+}
+
+
+def _lookup(table, provider, model, fallback):
+    limits = table.get(provider, table.get("default", fallback))
+    if isinstance(limits, dict):
+        return limits.get(model, limits.get("default", fallback))
+    return limits
+
+
+# Self-hosted servers (LM Studio, custom OpenAI-compatible URLs) have no
+# provider quota to protect; their only limit is how many requests they
+# can run at once, which PROVIDER_MAX_CONCURRENCY covers
+LOCAL_PROVIDERS = ("lm_studio", "custom")
+
+
+def get_rate_limits(provider, model):
+    """Return (requests_per_minute, tokens_per_minute) for a model; 0 means unlimited."""
+    provider = (provider or "").lower()
+    if provider in LOCAL_PROVIDERS:
+        return 0, 0
+    rpm = _lookup(MODEL_RATE_LIMITS, provider, model, 15)
+    tpm = _lookup(MODEL_TOKEN_LIMITS, provider, model, 0)
+    return rpm, tpm
+
+
+# Ceiling for the adaptive (AIMD) concurrency window per provider; the
+# window starts at a quarter of this and grows while responses are
+# healthy. Local servers can take far more parallel requests than the
+# hosted APIs.
+PROVIDER_MAX_CONCURRENCY = {
+    "openai": 32,
+    "claude": 16,
+    "anthropic": 16,
+    "gemini": 32,
+    "typhoon": 16,
+    "llama": 64,
+    "lm_studio": 64,
+    "custom": 64,
+    "default": 16
+}
@@ -0,0 +1,285 @@
+# api/utils/rate_limiter.py
+"""
+RPM/TPM token buckets per (provider, model), shared by every worker.
+
+Bucket state lives in Redis and is updated atomically by a Lua script, so
+all Celery workers draw from one budget per model. If Redis cannot be
+reached the limiter falls back to in-process buckets, which still paces
+a single worker correctly.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from api.config import Settings
+
+from .model_rate_limits import get_rate_limits
+from .redis_pool import redis_pools
+
+logger = logging.getLogger(__name__)
+
+# Buckets refill continuously at limit/60 per second, up to `limit`.
+# KEYS: request bucket, token bucket
+# ARGV: now, rpm, tpm, tokens requested
+# Returns 0 when granted, otherwise the wait in milliseconds.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local limits = {tonumber(ARGV[2]), tonumber(ARGV[3])}
+local costs = {1, tonumber(ARGV[4])}
+local levels = {}
+local wait = 0
+
+for i = 1, 2 do
+    local capacity = limits[i]
+    if capacity > 0 then
+        local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+        local level = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        local rate = capacity / 60.0
+        level = math.min(capacity, level + math.max(0, now - ts) * rate)
+        levels[i] = level
+        local cost = math.min(costs[i], capacity)
+        if level < cost then
+            wait = math.max(wait, (cost - level) / rate)
+        end
+    end
+end
+
+if wait > 0 then
+    return math.ceil(wait * 1000)
+end
+
+for i = 1, 2 do
+    if limits[i] > 0 then
+        local level = levels[i] - math.min(costs[i], limits[i])
+        redis.call('HSET', KEYS[i], 'level', level, 'ts', now)
+        redis.call('EXPIRE', KEYS[i], 120)
+    end
+end
+return 0
+"""
+
+# Give back (or take) tokens once the real usage of a call is known
+_ADJUST_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local level = tonumber(redis.call('HGET', KEYS[1], 'level'))
+if level then
+    level = math.min(capacity, level + tonumber(ARGV[2]))
+    redis.call('HSET', KEYS[1], 'level', level)
+end
+return 0
+"""
+
+# Never sleep longer than this in one go, so aborts are noticed promptly
+MAX_WAIT_SLICE = 5.0
+# How long to keep using local buckets before trying Redis again
+REDIS_RETRY_INTERVAL = 30.0
+
+
+def estimate_tokens(*texts: Optional[str], max_tokens: int = 0) -> int:
+    """Rough token count (~4 chars per token) plus the completion budget."""
+    chars = sum(len(t) for t in texts if t)
+    return chars // 4 + 1 + (max_tokens or 0)
+
+
+class _LocalBucket:
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.level = capacity
+        self.ts = time.time()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level +
+                         max(0.0, now - self.ts) * self.rate)
+        self.ts = now
+
+    def wait_for(self, cost: float) -> float:
+        cost = min(cost, self.capacity)
+        return 0.0 if self.level >= cost else (cost - self.level) / self.rate
+
+
+class RateLimiter:
+    """
+    Blocks (or awaits) until a request of `tokens` tokens fits both the
+    RPM and TPM budget of its model. Limits come from MODEL_RATE_LIMITS
+    and MODEL_TOKEN_LIMITS.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, enabled: bool = True, key_prefix: str = "ratelimit"):
+        self.enabled = enabled
+        self.key_prefix = key_prefix
+        self._redis_url = redis_url
+        self._redis: Optional[redis.Redis] = None
+        self._redis_down_until = 0.0
+        self._local: Dict[str, _LocalBucket] = {}
+        self._local_lock = threading.Lock()
+
+    # ---------------- keys & clients ----------------
+
+    def _keys(self, provider: str, model: str) -> Tuple[str, str]:
+        base = f"{self.key_prefix}:{provider.lower()}:{model}"
+        return f"{base}:requests", f"{base}:tokens"
+
+    def _redis_available(self) -> bool:
+        return bool(self._redis_url) and time.time() >= self._redis_down_until
+
+    def _mark_redis_down(self, e: Exception):
+        if time.time() >= self._redis_down_until:
+            logger.warning(
+                f"Rate limiter cannot reach Redis ({e}); using per-process buckets for {REDIS_RETRY_INTERVAL:.0f}s")
+        self._redis_down_until = time.time() + REDIS_RETRY_INTERVAL
+
+    def _sync_client(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis_pools.sync_client(self._redis_url)
+        return self._redis
+
+    def _async_client(self) -> aioredis.Redis:
+        # One pool per event loop; redis.asyncio clients are loop-bound
+        return redis_pools.async_client(self._redis_url)
+
+    # ---------------- bucket math ----------------
+
+    def _local_wait(self, provider: str, model: str, rpm: int, tpm: int, tokens: int) -> float:
+        req_key, tok_key = self._keys(provider, model)
+        with self._local_lock:
+            now = time.time()
+            buckets = []
+            for key, capacity, cost in ((req_key, rpm, 1), (tok_key, tpm, tokens)):
+                if capacity <= 0:
+                    continue
+                bucket = self._local.get(key)
+                if bucket is None or bucket.capacity != capacity:
+                    bucket = self._local[key] = _LocalBucket(capacity)
+                bucket.refill(now)
+                buckets.append((bucket, cost))
+
+            wait = max([b.wait_for(c) for b, c in buckets], default=0.0)
+            if wait == 0:
+                for bucket, cost in buckets:
+                    bucket.level -= min(cost, bucket.capacity)
+            return wait
+
+    def _try_acquire(self, provider: str, model: str, rpm: int, tpm: int, tokens: int) -> float:
+        if self._redis_available():
+            try:
+                client = self._sync_client()
+                wait_ms = client.eval(_ACQUIRE_SCRIPT, 2, *self._keys(provider, model),
+                                      time.time(), rpm, tpm, tokens)
+                return int(wait_ms) / 1000.0
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+        return self._local_wait(provider, model, rpm, tpm, tokens)
+
+    async def _atry_acquire(self, provider: str, model: str, rpm: int, tpm: int, tokens: int) -> float:
+        if self._redis_available():
+            try:
+                client = self._async_client()
+                wait_ms = await client.eval(_ACQUIRE_SCRIPT, 2, *self._keys(provider, model),
+                                            time.time(), rpm, tpm, tokens)
+                return int(wait_ms) / 1000.0
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+        return self._local_wait(provider, model, rpm, tpm, tokens)
+
+    # ---------------- public API ----------------
+
+    def acquire(self, provider: str, model: str, tokens: int = 1) -> float:
+        """Block until the call may proceed. Returns the total time waited."""
+        if not self.enabled:
+            return 0.0
+        rpm, tpm = get_rate_limits(provider, model)
+        if rpm <= 0 and tpm <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(provider, model, rpm, tpm, tokens)
+            if wait <= 0:
+                break
+            wait = min(wait, MAX_WAIT_SLICE)
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            logger.debug(
+                f"Rate limiter held {provider}/{model} for {waited:.2f}s")
+        return waited
+
+    async def aacquire(self, provider: str, model: str, tokens: int = 1) -> float:
+        """Async counterpart of acquire(); waiting never blocks the event loop."""
+        if not self.enabled:
+            return 0.0
+        rpm, tpm = get_rate_limits(provider, model)
+        if rpm <= 0 and tpm <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            wait = await self._atry_acquire(provider, model, rpm, tpm, tokens)
+            if wait <= 0:
+                break
+            wait = min(wait, MAX_WAIT_SLICE)
+            await asyncio.sleep(wait)
+            waited += wait
+        if waited:
+            logger.debug(
+                f"Rate limiter held {provider}/{model} for {waited:.2f}s")
+        return waited
+
+    def _usage_adjustment(self, provider: str, model: str, estimated: int, actual: Optional[int]):
+        if not self.enabled or not actual:
+            return None
+        _, tpm = get_rate_limits(provider, model)
+        delta = estimated - actual
+        if tpm <= 0 or delta == 0:
+            return None
+        return self._keys(provider, model)[1], tpm, delta
+
+    def _local_adjust(self, tok_key: str, delta: int):
+        with self._local_lock:
+            bucket = self._local.get(tok_key)
+            if bucket is not None:
+                bucket.level = min(bucket.capacity, bucket.level + delta)
+
+    def record_usage(self, provider: str, model: str, estimated: int, actual: Optional[int]):
+        """
+        Correct the token bucket once a response reports its real usage,
+        so over-estimates are given back and under-estimates are charged.
+        """
+        adjustment = self._usage_adjustment(provider, model, estimated, actual)
+        if adjustment is None:
+            return
+        tok_key, tpm, delta = adjustment
+        if self._redis_available():
+            try:
+                self._sync_client().eval(_ADJUST_SCRIPT, 1, tok_key, tpm, delta)
+                return
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+        self._local_adjust(tok_key, delta)
+
+    async def arecord_usage(self, provider: str, model: str, estimated: int, actual: Optional[int]):
+        adjustment = self._usage_adjustment(provider, model, estimated, actual)
+        if adjustment is None:
+            return
+        tok_key, tpm, delta = adjustment
+        if self._redis_available():
+            try:
+                await self._async_client().eval(_ADJUST_SCRIPT, 1, tok_key, tpm, delta)
+                return
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+        self._local_adjust(tok_key, delta)
+
+
+# ---------------- singleton ----------------
+_settings = Settings()
+rate_limiter = RateLimiter(
+    redis_url=_settings.REDIS_URL,
+    enabled=_settings.RATE_LIMIT_ENABLED
+)
@@ -0,0 +1,249 @@
+# api/utils/redis_pool.py
+"""
+One Redis connection pool per process.
+
+The status manager, the result store, abort flags, rate limits,
+checkpoints, progress counters and /health all borrow their clients
+from here instead of opening their own. Pools are blocking and bounded:
+when every connection is in use a caller waits (up to
+REDIS_POOL_TIMEOUT) rather than opening yet another connection.
+
+    sync_client()   thread-safe client for worker code and utilities
+    async_client()  client for the running event loop (redis.asyncio
+                    connections are loop-bound; the API has one loop,
+                    each Celery task runs in its own)
+
+The API creates its pools at startup (see index.py's lifespan); Celery
+workers create them on first use. stats() reports connections in use,
+checkouts and how often callers had to wait for a connection.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from api.config import Settings
+
+logger = logging.getLogger(__name__)
+
+settings = Settings()
+
+# Counters that keep growing; summed over live and discarded pools
+_CUMULATIVE = ("created", "acquired", "waits", "wait_seconds", "checkout_errors")
+
+
+class _PoolStats:
+    """Checkout counters of one pool."""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.created = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.checkout_errors = 0
+
+    def checkout_started(self) -> Tuple[float, bool]:
+        with self._lock:
+            return time.monotonic(), self.in_use >= self.max_connections
+
+    def checkout_done(self, started: Tuple[float, bool], ok: bool):
+        began, waited = started
+        with self._lock:
+            if waited:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - began
+            if not ok:
+                self.checkout_errors += 1
+                return
+            self.acquired += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def released(self):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def made(self):
+        with self._lock:
+            self.created += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "created": self.created,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "checkout_errors": self.checkout_errors,
+            }
+
+
+class _CountingPool(redis.BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = _PoolStats(self.max_connections)
+
+    def make_connection(self):
+        self.stats.made()
+        return super().make_connection()
+
+    def get_connection(self, *args, **kwargs):
+        started = self.stats.checkout_started()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except Exception:
+            self.stats.checkout_done(started, ok=False)
+            raise
+        self.stats.checkout_done(started, ok=True)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        self.stats.released()
+
+
+class _AsyncCountingPool(aioredis.BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = _PoolStats(self.max_connections)
+
+    def make_connection(self):
+        self.stats.made()
+        return super().make_connection()
+
+    async def get_connection(self, *args, **kwargs):
+        started = self.stats.checkout_started()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except Exception:
+            self.stats.checkout_done(started, ok=False)
+            raise
+        self.stats.checkout_done(started, ok=True)
+        return connection
+
+    async def release(self, connection):
+        await super().release(connection)
+        self.stats.released()
+
+
+class RedisPools:
+    """The process's Redis pools, one per URL (and per event loop for asyncio)."""
+
+    def __init__(self, default_url: str):
+        self.default_url = default_url
+        self._lock = threading.Lock()
+        self._sync: Dict[str, redis.Redis] = {}
+        # url -> [(loop, client)]
+        self._async: Dict[str, List[Tuple[asyncio.AbstractEventLoop, aioredis.Redis]]] = {}
+        # Cumulative counters of pools whose event loop has closed
+        self._retired: Dict[str, float] = {name: 0 for name in _CUMULATIVE}
+
+    @staticmethod
+    def _pool_kwargs() -> Dict[str, Any]:
+        return {
+            "decode_responses": True,
+            "max_connections": settings.REDIS_MAX_CONNECTIONS,
+            "timeout": settings.REDIS_POOL_TIMEOUT,
+            "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+            "socket_connect_timeout": settings.REDIS_CONNECT_TIMEOUT,
+        }
+
+    def sync_client(self, url: Optional[str] = None) -> redis.Redis:
+        url = url or self.default_url
+        client = self._sync.get(url)
+        if client is None:
+            with self._lock:
+                client = self._sync.get(url)
+                if client is None:
+                    pool = _CountingPool.from_url(url, **self._pool_kwargs())
+                    client = self._sync[url] = redis.Redis(connection_pool=pool)
+        return client
+
+    def async_client(self, url: Optional[str] = None) -> aioredis.Redis:
+        """Client on the pool of the running event loop."""
+        url = url or self.default_url
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async.setdefault(url, [])
+            for client_loop, client in clients:
+                if client_loop is loop:
+                    return client
+            # Pools of loops that have since closed cannot be used again
+            for client_loop, client in clients:
+                if client_loop.is_closed():
+                    self._retire(client)
+            clients[:] = [(l, c) for l, c in clients if not l.is_closed()]
+            pool = _AsyncCountingPool.from_url(url, **self._pool_kwargs())
+            client = aioredis.Redis(connection_pool=pool)
+            clients.append((loop, client))
+            return client
+
+    def _retire(self, client: Any):
+        snapshot = client.connection_pool.stats.snapshot()
+        for name in _CUMULATIVE:
+            self._retired[name] += snapshot[name]
+
+    async def startup(self):
+        """Create this process's pools and check that Redis answers."""
+        await self.async_client().ping()
+        logger.info(
+            f"Redis pool ready (max {settings.REDIS_MAX_CONNECTIONS} connections per pool)")
+
+    async def close_loop_pools(self):
+        """Close the async pools of the running loop, before the loop itself is closed."""
+        loop = asyncio.get_running_loop()
+        closing = []
+        with self._lock:
+            for clients in self._async.values():
+                for client_loop, client in clients:
+                    if client_loop is loop:
+                        self._retire(client)
+                        closing.append(client)
+                clients[:] = [(l, c) for l, c in clients if l is not loop]
+        for client in closing:
+            await client.aclose()
+
+    async def shutdown(self):
+        await self.close_loop_pools()
+        with self._lock:
+            sync_clients = list(self._sync.values())
+            self._sync.clear()
+        for client in sync_clients:
+            self._retire(client)
+            client.close()
+            client.connection_pool.disconnect()
+
+    def stats(self) -> Dict[str, Any]:
+        """Connections in use and checkout counters, for the sync and async pools."""
+        with self._lock:
+            sync_pools = [c.connection_pool.stats.snapshot() for c in self._sync.values()]
+            async_pools = [c.connection_pool.stats.snapshot()
+                           for clients in self._async.values() for _, c in clients]
+            retired = dict(self._retired)
+
+        def total(pools: List[Dict[str, Any]]) -> Dict[str, Any]:
+            summed: Dict[str, Any] = {"pools": len(pools)}
+            for name in ("max_connections", "in_use", "peak_in_use") + _CUMULATIVE:
+                summed[name] = sum(p[name] for p in pools)
+            summed["wait_seconds"] = round(summed["wait_seconds"], 3)
+            return summed
+
+        stats = {"sync": total(sync_pools), "async": total(async_pools)}
+        stats["retired"] = {name: round(value, 3) for name, value in retired.items()}
+        return stats
+
+
+# ---------------- singleton ----------------
+redis_pools = RedisPools(settings.REDIS_URL)
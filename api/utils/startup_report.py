@@ -0,0 +1,132 @@
+# api/utils/startup_report.py
+"""
+Startup and import-time reporting for the web tier.
+
+The API process is only supposed to enqueue work; scoring, perturbation
+and LLM libraries belong to the Celery workers. This module records how
+long the web app took to import, how much memory it holds and whether
+any worker-only dependency leaked into it.
+
+Run `python -m api.utils.startup_report` to import api.index in a fresh
+interpreter and print the slowest imports (via `-X importtime`).
+"""
+
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Modules that must only be imported by worker processes
+WORKER_ONLY_MODULES = (
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "spacy",
+    "coreferee",
+    "litellm",
+    "nltk",
+    "sklearn",
+    "pandas",
+    "openai",
+)
+
+# Budget for importing the web app; exceeded imports are logged as warnings
+IMPORT_BUDGET_SECONDS = float(os.getenv("WEB_IMPORT_BUDGET_SECONDS", "1.0"))
+
+_import_started: Optional[float] = None
+_import_finished: Optional[float] = None
+
+
+def rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB, if available."""
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def mark_import_start():
+    global _import_started
+    _import_started = time.perf_counter()
+
+
+def mark_import_end():
+    global _import_finished
+    _import_finished = time.perf_counter()
+
+
+def loaded_worker_modules() -> List[str]:
+    return [name for name in WORKER_ONLY_MODULES if name in sys.modules]
+
+
+def build_report() -> Dict[str, Any]:
+    import_seconds = None
+    if _import_started is not None and _import_finished is not None:
+        import_seconds = round(_import_finished - _import_started, 3)
+    return {
+        "pid": os.getpid(),
+        "import_seconds": import_seconds,
+        "import_budget_seconds": IMPORT_BUDGET_SECONDS,
+        "rss_mb": rss_mb(),
+        "modules_loaded": len(sys.modules),
+        "worker_only_modules_loaded": loaded_worker_modules(),
+    }
+
+
+def log_report() -> Dict[str, Any]:
+    report = build_report()
+    logger.info(f"Web startup report: {report}")
+    if report["import_seconds"] is not None and report["import_seconds"] > IMPORT_BUDGET_SECONDS:
+        logger.warning(
+            f"Web app import took {report['import_seconds']}s (budget {IMPORT_BUDGET_SECONDS}s)")
+    if report["worker_only_modules_loaded"]:
+        logger.warning(
+            f"Worker-only modules loaded in web process: {report['worker_only_modules_loaded']}")
+    return report
+
+
+def import_time_profile(module: str = "api.index") -> List[Tuple[float, str]]:
+    """
+    Import `module` in a fresh interpreter with -X importtime and return
+    (cumulative_seconds, module_name) for every import, slowest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.getcwd()},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    line_re = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(.*)$")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = line_re.match(line)
+        if match:
+            rows.append((int(match.group(1)) / 1e6, match.group(2).strip()))
+    rows.sort(reverse=True)
+    return rows
+
+
+def main(top: int = 25):
+    rows = import_time_profile()
+    print(f"{'cumulative (s)':>15}  module")
+    for seconds, name in rows[:top]:
+        print(f"{seconds:>15.3f}  {name}")
+    leaked = sorted({name.split(".")[0] for _, name in rows}
+                    & set(WORKER_ONLY_MODULES))
+    if leaked:
+        print(f"\nWorker-only modules imported by the web app: {', '.join(leaked)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -49,15 +49,29 @@ export async function GET(
         return NextResponse.json({ error: "Unauthorized" }, { status: 401 });
     }
 
-    const testId = new URL(request.url).searchParams.get("testId");
+    const searchParams = new URL(request.url).searchParams;
+    const testId = searchParams.get("testId");
     if (!testId) {
         return NextResponse.json({ error: "Missing testId" }, { status: 400 });
     }
+    // "summary" or "rows" read the stored results piecewise; without a
+    // view the whole results document is returned
+    const view = searchParams.get("view");
+    if (view && view !== "summary" && view !== "rows") {
+        return NextResponse.json({ error: "Invalid view" }, { status: 400 });
+    }
 
     // 2️⃣ Proxy to FastAPI
     const fastApiUrl = getFastApiUrl();
+    let upstream = `${fastApiUrl}/api/v2/tests/${encodeURIComponent(testId)}/results`;
+    if (view) {
+        const query = new URLSearchParams(searchParams);
+        query.delete("testId");
+        query.delete("view");
+        upstream += `/${view}?${query}`;
+    }
     const proxyRes = await fetch(
-        `${fastApiUrl}/api/v2/tests/${testId}/results`,
+        upstream,
         {
             method: "GET",
             headers: {
@@ -67,6 +81,9 @@ export async function GET(
     );
 
     const data = await proxyRes.json();
+    if (view) {
+        return NextResponse.json(data, { status: proxyRes.status });
+    }
 
     // 3️⃣ Wrap under `results` so your hook always sees `{ results: { … } }`
     return NextResponse.json(
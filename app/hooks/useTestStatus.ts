@@ -3,10 +3,12 @@ import { useState, useEffect } from "react";
 
 export interface TestStatusEvent {
     status: string;
+    test_id?: string;
     progress?: string;
     error?: string;
-    results?: any;
+    results_available?: boolean;
     runtime_seconds?: number;
+    version?: number;
 }
 
 export function useTestStatus(
@@ -35,9 +37,10 @@ export function useTestStatus(
         es.addEventListener("status", (e: MessageEvent) => {
             console.log("[SSE] raw event data:", e.data);
             try {
-                const parsed = JSON.parse(e.data) as TestStatusEvent;
+                const parsed = JSON.parse(e.data) as Partial<TestStatusEvent>;
                 console.log("[SSE] parsed event:", parsed);
-                setEvt(parsed);
+                // Messages after the first carry only the fields that changed
+                setEvt(prev => ({ ...prev, ...parsed } as TestStatusEvent));
             } catch (err) {
                 console.error("[SSE] malformed JSON:", err, e.data);
             }
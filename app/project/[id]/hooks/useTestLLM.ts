@@ -34,6 +34,8 @@ export function useTestLLM({ blocks, projectId, project }: UseTestLLMProps) {
   const [testRunId, setTestRunId] = useState<string | null>(null);
   const [savedToDb, setSavedToDb] = useState(false);
   const startTimeRef = useRef<number | null>(null);
+  // Run whose completion has been handled (results fetched and saved)
+  const completedRunRef = useRef<string | null>(null);
 
   const statusEvt = useTestStatus(projectId, testRunId);
 
@@ -67,18 +69,30 @@ export function useTestLLM({ blocks, projectId, project }: UseTestLLMProps) {
         setIsPlaying(false);
         setIsLoading(false);
         setError(null);
-        const finalResults = statusEvt.results ?? DEFAULT_TEST_RESULTS;
-        setTestResults(finalResults);
-        if (!savedToDb) {
-          setSavedToDb(true);
-          const evalBlock = blocks.find(b => b.type === "evaluation-container");
-          const topics: string[] = evalBlock?.config?.topics || [];
-          testApiClient.saveResults(projectId, { topics, ...finalResults })
-            .catch(err => console.error("Failed to save results:", err));
-        }
-        testEvents.emit("testComplete", {
-          projectId, testId: testRunId!, results: statusEvt.results
-        });
+        // Status messages carry only the fields that changed, never the
+        // results; fetch them once, when the run completes
+        if (!testRunId || completedRunRef.current === testRunId) break;
+        completedRunRef.current = testRunId;
+        const runId = testRunId;
+        setIsLoading(true);
+        testApiClient.loadResults(projectId, runId)
+          .then(finalResults => {
+            setTestResults(finalResults);
+            setSavedToDb(true);
+            const evalBlock = blocks.find(b => b.type === "evaluation-container");
+            const topics: string[] = evalBlock?.config?.topics || [];
+            testApiClient.saveResults(projectId, { topics, ...finalResults })
+              .catch(err => console.error("Failed to save results:", err));
+            testEvents.emit("testComplete", {
+              projectId, testId: runId, results: finalResults
+            });
+          })
+          .catch(err => {
+            console.error("Failed to load results:", err);
+            setTestResults(DEFAULT_TEST_RESULTS);
+            setError("Failed to load test results");
+          })
+          .finally(() => setIsLoading(false));
         break;
       }
       case "error":
@@ -92,7 +106,7 @@ export function useTestLLM({ blocks, projectId, project }: UseTestLLMProps) {
         setError("Test aborted");
         break;
     }
-  }, [statusEvt, projectId, testRunId, savedToDb, blocks]);
+  }, [statusEvt, projectId, testRunId, blocks]);
 
   const handleTest = useCallback(async () => {
     if (isPlaying) return false;
@@ -182,14 +196,15 @@ export function useTestLLM({ blocks, projectId, project }: UseTestLLMProps) {
   }, [isPlaying, testRunId, projectId]);
 
   const fetchResultsFromDb = useCallback(async () => {
-    if (!projectId || !testRunId) return;
+    // A run that just completed is loaded by the status handler
+    if (!projectId || !testRunId || completedRunRef.current === testRunId) return;
     try {
       setIsLoading(true);
-      const result = await testApiClient.getTestResults(projectId, testRunId);
-      if (result.results) {
-        setTestResults(result.results);
-        setSavedToDb(true);
-      }
+      const results = await testApiClient.loadResults(projectId, testRunId);
+      setTestResults(results);
+      setSavedToDb(true);
+    } catch (err) {
+      console.error("Failed to fetch results:", err);
     } finally {
       setIsLoading(false);
     }
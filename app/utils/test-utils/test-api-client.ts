@@ -16,6 +16,9 @@ export interface CreateTestOptions {
   url?: string;
 }
 
+// Largest page /results/rows serves
+const RESULT_PAGE_SIZE = 1000;
+
 export interface CreateTestResponse {
   testId: string;
   resultId: string;
@@ -105,6 +108,53 @@ const testApiClient = {
     return response.json();
   },
 
+  async getResultSummary(projectId: string, testId: string) {
+    const response = await fetch(
+      `/api/projects/${projectId}/test?testId=${encodeURIComponent(testId)}&view=summary`
+    );
+    if (!response.ok) {
+      throw new Error("Failed to fetch test result summary");
+    }
+    return response.json();
+  },
+
+  async getResultRows(projectId: string, testId: string, offset: number, limit: number) {
+    const response = await fetch(
+      `/api/projects/${projectId}/test?testId=${encodeURIComponent(testId)}` +
+      `&view=rows&offset=${offset}&limit=${limit}`
+    );
+    if (!response.ok) {
+      throw new Error("Failed to fetch test result rows");
+    }
+    return response.json();
+  },
+
+  // Final results of a completed run, in the shape the worker assembled
+  // them: scores from the summary, then every stored test, page by page
+  async loadResults(projectId: string, testId: string) {
+    const summary = await this.getResultSummary(projectId, testId);
+    const rows: any[] = [];
+    while (rows.length < summary.total_rows) {
+      const page = await this.getResultRows(projectId, testId, rows.length, RESULT_PAGE_SIZE);
+      if (!page.rows.length) break;
+      // Row number and topic are added by /results/rows
+      rows.push(...page.rows.map(({ row, topic, ...test }: any) => test));
+    }
+    const slice = ([start, stop]: number[]) => rows.slice(start, stop);
+    return {
+      results: slice(summary.result_rows),
+      robust_results: summary.robust_results.map(
+        ({ rows: range, ...entry }: any) => ({ ...entry, results: slice(range) })
+      ),
+      summary: summary.summary,
+      index_scores: summary.index_scores,
+      overall_robust_score: summary.overall_robust_score,
+      overall_score: summary.overall_score,
+      performance_score: summary.performance_score,
+      error: summary.error,
+    };
+  },
+
   async saveResults(projectId: string, results: any) {
     const res = await fetch(`/api/projects/results/${projectId}`, {
       method: "POST",